@@ -0,0 +1,82 @@
+import os, sys, time, asyncio
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from typing import Any, Dict, List
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+
+from src.graph import build_graph
+from src.nodes.retriever import rerank_stats
+from src.utils.tracing import SINK
+
+API_MAX_CONCURRENCY = int(os.getenv("API_MAX_CONCURRENCY", "8"))
+
+
+class AskRequest(BaseModel):
+    query: str = Field(..., min_length=1, description="Pergunta sobre o IPCC AR6 (SYR)")
+
+
+class AskResponse(BaseModel):
+    answer: str
+    contexts: List[Dict[str, Any]]
+    rejected: bool = False
+    cached: bool = False
+    latency_ms: int
+
+
+def create_app() -> FastAPI:
+    """
+    Serviço HTTP local: um processo, modelos compartilhados, muitas requisições concorrentes.
+    O grafo é compilado em modo assíncrono (ainvoke) e a concorrência é limitada por semáforo.
+    """
+    api = FastAPI(title="Clima em Foco – IPCC AR6 (SYR)")
+    graph = build_graph(use_async=True)
+    sem = asyncio.Semaphore(API_MAX_CONCURRENCY)
+
+    @api.get("/health")
+    async def health() -> Dict[str, str]:
+        return {"status": "ok"}
+
+    @api.get("/stats")
+    async def stats() -> Dict[str, Any]:
+        return {"rerank": rerank_stats(), "spans": SINK.to_json()}
+
+    @api.get("/metrics", response_class=PlainTextResponse)
+    async def metrics() -> str:
+        return SINK.to_prometheus()
+
+    @api.post("/ask", response_model=AskResponse)
+    async def ask(req: AskRequest) -> AskResponse:
+        q = req.query.strip()
+        if not q:
+            raise HTTPException(status_code=422, detail="query vazia")
+        t0 = time.time()
+        async with sem:
+            try:
+                out = await graph.ainvoke({"query": q, "contexts": [], "answer": {}})
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Falha ao executar o grafo: {e}")
+        ans = out.get("answer") or {}
+        return AskResponse(
+            answer=(ans.get("answer") or "").strip(),
+            contexts=out.get("contexts") or [],
+            rejected=bool(ans.get("rejected")),
+            cached=bool(out.get("cached")),
+            latency_ms=int((time.time() - t0) * 1000),
+        )
+
+    return api
+
+
+app = create_app()
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host=os.getenv("API_HOST", "127.0.0.1"), port=int(os.getenv("API_PORT", "8000")))
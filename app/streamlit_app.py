@@ -1,4 +1,4 @@
-import os, sys, time
+import os, sys, time, threading
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 if ROOT not in sys.path:
     sys.path.insert(0, ROOT)
@@ -7,7 +7,9 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from src.graph import build_graph
+from src.utils.citations import source_label
 
 st.set_page_config(
     page_title="Clima em Foco – IPCC AR6 (SYR)",
@@ -154,11 +156,13 @@ for m in st.session_state.messages:
                 for c in (m["contexts"] or []):
                     meta = c.get("metadata") or {}
                     page = meta.get("page", "?")
+                    src = source_label(meta.get("source"))
+                    chip = f"{src} p.{page}" if src else f"p.{page}"
                     snippet = (c.get("text") or "").strip().replace("\n", " ")
                     if len(snippet) > 700:
                         snippet = snippet[:700] + "…"
                     st.markdown(
-                        f'<div class="cite-card"><span class="cite-title"><span class="page-chip">p.{page}</span> Trecho</span> — {snippet}</div>',
+                        f'<div class="cite-card"><span class="cite-title"><span class="page-chip">{chip}</span> Trecho</span> — {snippet}</div>',
                         unsafe_allow_html=True
                     )
                 st.markdown('</div>', unsafe_allow_html=True)
@@ -171,18 +175,30 @@ if user_query:
 
     try:
         with st.chat_message("assistant"):
+            bubble = st.empty()
+            script_ctx = get_script_run_ctx()
+
+            def _on_partial(partial: str):
+                # Tokens chegam à bolha à medida que o LLM gera; o texto final substitui tudo ao fim.
+                if threading.current_thread() is not threading.main_thread():
+                    add_script_run_ctx(threading.current_thread(), script_ctx)
+                bubble.markdown(f'<div class="bubble assistant">{partial}▌</div>', unsafe_allow_html=True)
+
             with st.spinner("Analisando trechos…"):
-                result = graph.invoke({
-                    "query": user_query.strip(),
-                    "contexts": [],
-                    "answer": {},
-                    "nonce": time.time(),
-                })
+                result = graph.invoke(
+                    {
+                        "query": user_query.strip(),
+                        "contexts": [],
+                        "answer": {},
+                        "nonce": time.time(),
+                    },
+                    config={"configurable": {"on_partial": _on_partial}},
+                )
 
                 answer_text = (result.get("answer") or {}).get("answer", "").strip() or "_(sem resposta)_"
                 contexts = result.get("contexts", [])
 
-                st.markdown(f'<div class="bubble assistant">{answer_text}</div>', unsafe_allow_html=True)
+                bubble.markdown(f'<div class="bubble assistant">{answer_text}</div>', unsafe_allow_html=True)
 
                 if contexts:
                     with st.expander("Trechos citados", expanded=False):
@@ -190,11 +206,13 @@ if user_query:
                         for c in (contexts or []):
                             meta = c.get("metadata") or {}
                             page = meta.get("page", "?")
+                            src = source_label(meta.get("source"))
+                            chip = f"{src} p.{page}" if src else f"p.{page}"
                             snippet = (c.get("text") or "").strip().replace("\n", " ")
                             if len(snippet) > 700:
                                 snippet = snippet[:700] + "…"
                             st.markdown(
-                                f'<div class="cite-card"><span class="cite-title"><span class="page-chip">p.{page}</span> Trecho</span> — {snippet}</div>',
+                                f'<div class="cite-card"><span class="cite-title"><span class="page-chip">{chip}</span> Trecho</span> — {snippet}</div>',
                                 unsafe_allow_html=True
                             )
                         st.markdown('</div>', unsafe_allow_html=True)
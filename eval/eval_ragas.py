@@ -1,4 +1,5 @@
-import os, sys, time, json, threading, re
+import os, sys, time, json, threading, re, hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import List, Dict, Any, Tuple, Optional, cast
 
@@ -7,6 +8,11 @@ os.environ.setdefault("OMP_NUM_THREADS", "1")
 os.environ.setdefault("OPENBLAS_NUM_THREADS", "1")
 os.environ.setdefault("MKL_NUM_THREADS", "1")
 os.environ.setdefault("NUMEXPR_NUM_THREADS", "1")
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+# A avaliação mede o pipeline: acertos de cache (respostas, retrieval, embeddings, rerank,
+# LLM) trariam respostas antigas e latências irreais. Lido no import de src.graph, por isso antes dele.
+from src.utils.cache_env import active_caches, disable_caches
+disable_caches()
 
 try:
     from dotenv import load_dotenv
@@ -31,12 +37,11 @@ try:
 except ImportError:
     from langchain_community.embeddings import HuggingFaceEmbeddings
 
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-
 from src.graph import build_graph, State
-
-from langchain_ollama import ChatOllama
-from langchain_google_genai import ChatGoogleGenerativeAI
+from src.utils.emb_cache import cached_encode, EMB_CACHE_ENABLE
+from src.utils.score_cache import ScoreCache
+from src.utils.tracing import stage_totals, percentile
+from langchain_core.embeddings import Embeddings
 
 
 _env_eval = os.getenv("EVAL_PATH")
@@ -57,6 +62,23 @@ USE_GEMINI_JUDGE = os.getenv("USE_GEMINI_JUDGE", "1").strip()
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://127.0.0.1:11434")
 OLLAMA_JUDGE_MODEL = os.getenv("OLLAMA_JUDGE_MODEL", "qwen2.5:7b-instruct")
 
+# Concorrência: perguntas respondidas em paralelo e chamadas simultâneas ao juiz.
+# 1 = latências sem contenção; com mais workers o relatório marca as latências como concorrentes.
+EVAL_PIPELINE_WORKERS = int(os.getenv("EVAL_PIPELINE_WORKERS", "1"))
+EVAL_JUDGE_WORKERS = int(os.getenv("EVAL_JUDGE_WORKERS", "4"))
+EVAL_JUDGE_BATCH = int(os.getenv("EVAL_JUDGE_BATCH", "4"))  # linhas por chamada ao RAGAS (e por checkpoint)
+EVAL_CHECKPOINT = os.getenv("EVAL_CHECKPOINT", str(REPORTS_DIR / "checkpoint.jsonl"))
+# Cache persistente de scores do juiz por (linha, juiz, métrica); vazio desabilita.
+EVAL_JUDGE_CACHE_PATH = os.getenv("EVAL_JUDGE_CACHE_PATH", "data/cache/judge_scores.sqlite").strip()
+
+METRICS = [faithfulness, answer_relevancy, context_precision, context_recall]
+
+def judge_name() -> str:
+    """Juiz efetivo (mesma regra de make_judge), usado na chave do cache de scores."""
+    if (USE_GEMINI_JUDGE == "1") and bool(GOOGLE_API_KEY):
+        return f"gemini:{GEMINI_JUDGE_MODEL}"
+    return f"ollama:{OLLAMA_JUDGE_MODEL}"
+
 def make_judge():
     """
     Se USE_GEMINI_JUDGE == "1" e GOOGLE_API_KEY existir, usa Gemini 2.5 Pro (remote, alivia CPU/RAM).
@@ -64,6 +86,7 @@ def make_judge():
     """
     use_gemini = (USE_GEMINI_JUDGE == "1") and bool(GOOGLE_API_KEY)
     if use_gemini:
+        from langchain_google_genai import ChatGoogleGenerativeAI
         model_kwargs = {
             "response_mime_type": "application/json",
             "max_output_tokens": 2048,
@@ -77,6 +100,7 @@ def make_judge():
         print(f"[judge] Gemini ativo: model={GEMINI_JUDGE_MODEL}")
         return judge
     else:
+        from langchain_ollama import ChatOllama
         judge = ChatOllama(
             model=OLLAMA_JUDGE_MODEL,
             base_url=OLLAMA_BASE_URL,
@@ -87,12 +111,37 @@ def make_judge():
         print(f"[judge] Ollama ativo: model={OLLAMA_JUDGE_MODEL} @ {OLLAMA_BASE_URL}")
         return judge
 
-def make_embeddings():
-    model_name = (
+class CachedSTEmbeddings(Embeddings):
+    """Embeddings do RAGAS via SentenceTransformer, reaproveitando o cache em disco (src/utils/emb_cache)."""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._model = None
+
+    def encode(self, *args, **kwargs):
+        # Só instancia o modelo se algum texto não estiver no cache.
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name)
+        return self._model.encode(*args, **kwargs)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return cached_encode(self, self.model_name, list(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+def embeddings_name() -> str:
+    return (
         os.getenv("RAGAS_EMBEDDINGS_MODEL")
         or os.getenv("EMBEDDINGS_MODEL")
         or "sentence-transformers/all-MiniLM-L6-v2"
     )
+
+def make_embeddings():
+    model_name = embeddings_name()
+    if EMB_CACHE_ENABLE:
+        return CachedSTEmbeddings(model_name)
     return HuggingFaceEmbeddings(model_name=model_name)
 
 def load_jsonl(path: str) -> List[Dict[str, Any]]:
@@ -193,7 +242,7 @@ def pages_in_texts(texts: Any) -> set:
         for t in texts:
             if not isinstance(t, str):
                 continue
-            for m in re.finditer(r"\[p\.(\d+)\]", t):
+            for m in re.finditer(r"\[(?:[^\[\]\s]+\s+)?p\.(\d+)\]", t):
                 try:
                     pages.add(int(m.group(1)))
                 except Exception:
@@ -211,63 +260,223 @@ def gold_hit_row(row: pd.Series) -> Optional[bool]:
     ctx_pages = pages_in_texts(row.get("contexts"))
     return gold in ctx_pages if ctx_pages else False
 
-def run_eval(eval_path: str = EVAL_PATH) -> None:
-    print(f"[eval] Usando arquivo: {eval_path}")
-
-    items = load_jsonl(eval_path)
+def pipeline_fingerprint() -> str:
+    """
+    Identidade do pipeline avaliado: LLM, embedder, reranker, build do índice e prompts.
+    Entra na chave das linhas do checkpoint, então mudar qualquer um deles regenera as respostas.
+    """
+    from src.utils.llm import llm_name
+    from src.utils.settings import emb_key, rerank_key, index_version
+    from src.nodes.answerer import SYSTEM_PROMPT
+    from src.nodes.moderator import MODERATOR_SYSTEM_PROMPT
+    prompts = hashlib.sha1(f"{SYSTEM_PROMPT}\n{MODERATOR_SYSTEM_PROMPT}".encode("utf-8")).hexdigest()[:12]
+    raw = "|".join([llm_name(), emb_key(), rerank_key(), index_version(), prompts])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+def row_key(idx: int, question: str, fingerprint: str = "") -> str:
+    return hashlib.sha1(f"{idx}\n{question}\n{fingerprint}".encode("utf-8")).hexdigest()[:16]
+
+class Checkpoint:
+    """
+    JSONL append-only: uma linha por linha finalizada (resposta e, depois, scores).
+    Ao retomar, o último registro de cada chave vale. Serve só para retomar uma execução
+    interrompida: run_eval apaga o arquivo ao concluir.
+    """
 
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        done: Dict[str, Dict[str, Any]] = {}
+        if not self.path.exists():
+            return done
+        with self.path.open("r", encoding="utf-8") as f:
+            for ln in f:
+                try:
+                    rec = json.loads(ln)
+                except Exception:
+                    continue  # última linha truncada por um crash
+                done[rec["key"]] = rec
+        return done
+
+    def write(self, rec: Dict[str, Any]) -> None:
+        with self._lock, self.path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            f.flush()
+
+    def reset(self) -> None:
+        if self.path.exists():
+            self.path.unlink()
+
+def run_pipeline(items: List[Dict[str, Any]], done: Dict[str, Dict[str, Any]], ckpt: Checkpoint,
+                 workers: int = EVAL_PIPELINE_WORKERS, fingerprint: str = "") -> None:
+    """Responde as perguntas ainda sem resposta (deste fingerprint) no checkpoint, `workers` por vez."""
+    todo = [(i, it) for i, it in enumerate(items) if row_key(i, it["question"], fingerprint) not in done]
+    if not todo:
+        return
     app = build_graph()
 
-    sampler = FootprintSampler(period_sec=0.5)
-    sampler.start()
-
-    rows: List[Dict[str, Any]] = []
-    for i, item in enumerate(items, start=1):
+    def one(i: int, item: Dict[str, Any]) -> Dict[str, Any]:
         q: str = item["question"]
-        gt: Optional[str] = item.get("ground_truth") or ""
         t0 = time.time()
-
-        empty_contexts: List[Dict[str, Any]] = []
-        empty_answer: Dict[str, Any] = {}
-        init_state: State = {"query": q, "contexts": empty_contexts, "answer": empty_answer}
-
+        init_state: State = {"query": q, "contexts": [], "answer": {}}
         out_state: Dict[str, Any] = app.invoke(init_state)
         elapsed_ms = int((time.time() - t0) * 1000)
-
         answer_txt, ctx_texts = extract_answer_and_contexts(out_state)
-
-        rows.append({
+        return {
+            "key": row_key(i, q, fingerprint),
+            "idx": i,
             "question": q,
             "answer": answer_txt,
             "contexts": ctx_texts,
-            "ground_truth": gt,
+            "ground_truth": item.get("ground_truth") or "",
             "gold_page": item.get("gold_page"),
             "latency_ms": elapsed_ms,
-        })
-        print(f"[{i:02d}/{len(items)}] {elapsed_ms} ms | '{q[:70]}...'")
+            "stages_ms": stage_totals(out_state.get("spans") or []),
+        }
 
-    sampler.stop()
+    n = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="eval") as ex:
+        futs = [ex.submit(one, i, it) for i, it in todo]
+        for fut in as_completed(futs):
+            rec = fut.result()
+            ckpt.write(rec)
+            done[rec["key"]] = rec
+            n += 1
+            print(f"[{n:02d}/{len(todo)}] {rec['latency_ms']} ms | '{rec['question'][:70]}...'")
+
+def _score_value(v: Any) -> Optional[float]:
+    try:
+        v = float(v)
+    except Exception:
+        return None
+    return None if v != v else v  # NaN -> None
+
+def judge_key(row: Dict[str, Any], metric: str, judge: str) -> str:
+    """Hash de tudo que o juiz vê para uma métrica: pergunta, resposta, contextos, referência e modelos."""
+    payload = json.dumps(
+        [row.get("question"), row.get("answer"), row.get("contexts"), row.get("ground_truth") or "",
+         judge, embeddings_name(), metric],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
-    df = pd.DataFrame(rows)
-    ds_cols = ["question", "answer", "contexts"]
-    if "ground_truth" in df.columns and df["ground_truth"].notna().any():
-        ds_cols.append("ground_truth")
-    ds = Dataset.from_pandas(df[ds_cols])
+def needs_judge(row: Dict[str, Any]) -> bool:
+    """Linha sem scores ou com alguma métrica faltando/falha (None ou NaN) volta ao juiz."""
+    scores = row.get("scores")
+    if not isinstance(scores, dict):
+        return True
+    return any(_score_value(scores.get(m.name)) is None for m in METRICS)
+
+def run_judge(rows: List[Dict[str, Any]], ckpt: Checkpoint, workers: int = EVAL_JUDGE_WORKERS,
+              batch: int = EVAL_JUDGE_BATCH) -> None:
+    """
+    Pontua com RAGAS as linhas sem scores ou com métricas que falharam. Scores válidos
+    da linha ou do cache (mesma linha, juiz e métrica) são mantidos; só as métricas faltantes
+    vão ao juiz, em lotes agrupados pelo conjunto de métricas. Cada lote é gravado no checkpoint.
+    """
+    todo = [r for r in rows if needs_judge(r)]
+    if not todo:
+        return
+    with_gt = any(r.get("ground_truth") for r in rows)
+    jname = judge_name()
+    cache = ScoreCache(maxsize=0, path=EVAL_JUDGE_CACHE_PATH) if EVAL_JUDGE_CACHE_PATH else None
+
+    groups: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+    reused = 0
+    for r in todo:
+        keys = {m.name: judge_key(r, m.name, jname) for m in METRICS}
+        known = cache.get_many(list(keys.values())) if cache is not None else {}
+        have = {n: v for n, v in (r.get("scores") or {}).items() if _score_value(v) is not None}
+        r["scores"] = {**have, **{name: known[k] for name, k in keys.items() if k in known}}
+        reused += len(r["scores"])
+        missing = tuple(m.name for m in METRICS if m.name not in r["scores"])
+        if missing:
+            groups.setdefault(missing, []).append(r)
+        else:
+            ckpt.write(r)
+    n_missing = sum(len(g) for g in groups.values())
+    print(f"[judge] {reused} scores reaproveitados do cache; {n_missing}/{len(todo)} linhas vão ao juiz")
+    if not groups:
+        return
 
     judge = make_judge()
     embedder = make_embeddings()
+    batch = max(1, batch)
+    by_name = {m.name: m for m in METRICS}
+    done = 0
+    for names, group in groups.items():
+        for start in range(0, len(group), batch):
+            part = group[start:start + batch]
+            df = pd.DataFrame([{k: r.get(k) for k in ("question", "answer", "contexts", "ground_truth")} for r in part])
+            ds_cols = ["question", "answer", "contexts"] + (["ground_truth"] if with_gt else [])
+            result = ragas_evaluate(
+                Dataset.from_pandas(df[ds_cols]),
+                metrics=[by_name[n] for n in names],
+                llm=judge,
+                embeddings=embedder,
+                run_config=RunConfig(timeout=600, max_workers=max(1, workers)),
+            )
+            df_scores = result.to_pandas()
+            fresh = []
+            for rec, (_, srow) in zip(part, df_scores.iterrows()):
+                for n in names:
+                    v = _score_value(srow.get(n))
+                    rec["scores"][n] = v
+                    if v is not None:  # falhas do juiz não entram no cache
+                        fresh.append((judge_key(rec, n, jname), v))
+                rec["scores"] = {m.name: rec["scores"].get(m.name) for m in METRICS}
+                ckpt.write(rec)
+            if cache is not None and fresh:
+                cache.put_many(fresh)
+            done += len(part)
+            print(f"[judge] {done}/{n_missing} linhas pontuadas")
+
+def stage_summary(rows: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """p50/p95 (ms) por estágio/subetapa do grafo, a partir dos spans de cada linha."""
+    per: Dict[str, List[float]] = {}
+    for r in rows:
+        for name, ms in (r.get("stages_ms") or {}).items():
+            per.setdefault(name, []).append(float(ms))
+    return {
+        name: {"n": len(v), "p50": round(percentile(v, 50), 1), "p95": round(percentile(v, 95), 1)}
+        for name, v in sorted(per.items())
+    }
 
-    ragas_result = ragas_evaluate(
-        ds,
-        metrics=[faithfulness, answer_relevancy, context_precision, context_recall],
-        llm=judge,
-        embeddings=embedder,
-        run_config=RunConfig(timeout=600, max_workers=1),
-    )
+def run_eval(eval_path: str = EVAL_PATH, pipeline_workers: int = EVAL_PIPELINE_WORKERS,
+             judge_workers: int = EVAL_JUDGE_WORKERS, resume: bool = True) -> None:
+    print(f"[eval] Usando arquivo: {eval_path}")
 
-    df_scores = ragas_result.to_pandas()
-    merge_key = "user_input" if "user_input" in df_scores.columns else "question"
-    df_merged = df.merge(df_scores, left_on="question", right_on=merge_key, how="left")
+    items = load_jsonl(eval_path)
+    ckpt = Checkpoint(EVAL_CHECKPOINT)
+    if not resume:
+        ckpt.reset()
+    fp = pipeline_fingerprint()
+    done = ckpt.load()
+    keys = {row_key(i, it["question"], fp) for i, it in enumerate(items)}
+    reusable = sum(1 for k in done if k in keys)
+    if done:
+        print(f"[eval] Retomando de {ckpt.path}: {reusable} linhas do pipeline atual ({fp}); "
+              f"{len(done) - reusable} de outra versão serão ignoradas")
+
+    sampler = FootprintSampler(period_sec=0.5)
+    sampler.start()
+    t_pipe = time.time()
+    run_pipeline(items, done, ckpt, workers=pipeline_workers, fingerprint=fp)
+    pipeline_wall_s = round(time.time() - t_pipe, 1)
+    sampler.stop()
+
+    rows = [done[row_key(i, it["question"], fp)] for i, it in enumerate(items)]
+    run_judge(rows, ckpt, workers=judge_workers)
+
+    metric_names = [m.name for m in METRICS]
+    df_merged = pd.DataFrame([
+        {**{k: v for k, v in r.items() if k not in ("key", "idx", "scores", "stages_ms")}, **(r.get("scores") or {})}
+        for r in rows
+    ])
+    df_scores = df_merged[["question"] + [c for c in metric_names if c in df_merged.columns]]
 
     df_merged["gold_hit"] = df_merged.apply(gold_hit_row, axis=1)
     gold_rate = float(df_merged["gold_hit"].mean(skipna=True)) if "gold_hit" in df_merged else None
@@ -300,6 +509,14 @@ def run_eval(eval_path: str = EVAL_PATH) -> None:
             "min": int(lat.min()) if len(lat) else None,
             "max": int(lat.max()) if len(lat) else None,
         },
+        "stages_ms": stage_summary(rows),
+        "caches": active_caches(),
+        "concurrency": {
+            "pipeline_workers": pipeline_workers,
+            "latency_concurrent": pipeline_workers > 1,
+            "judge_workers": judge_workers,
+            "pipeline_wall_s": pipeline_wall_s,
+        },
         "footprint": {
             "memory_peak_mb": sampler.mem_peak_mb,
             "cpu_percent_avg": None if sampler.cpu_avg is None else round(sampler.cpu_avg, 1),
@@ -311,6 +528,7 @@ def run_eval(eval_path: str = EVAL_PATH) -> None:
             "scores_csv": str(REPORTS_DIR / "ragas_scores.csv"),
             "raw_csv": str(REPORTS_DIR / "raw_results.csv"),
         },
+        "pipeline_fingerprint": fp,
     }
 
     (REPORTS_DIR / "summary.json").write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding="utf-8")
@@ -324,10 +542,21 @@ def run_eval(eval_path: str = EVAL_PATH) -> None:
         f.write(f"- **Context Precision (média)**: {m['context_precision_mean']}\n")
         f.write(f"- **Context Recall (média)**: {m['context_recall_mean']}\n\n")
 
-        f.write("## Latência (ms)\n")
+        note = " — concorrente, não comparável com execuções sequenciais" if pipeline_workers > 1 else ""
+        f.write(f"## Latência (ms){note}\n")
         lm = summary["latency_ms"]
         f.write(f"- média: {lm['mean']} | min: {lm['min']} | max: {lm['max']}\n")
-        f.write(f"- p50: {lm['p50']} | p95: {lm['p95']}\n\n")
+        f.write(f"- p50: {lm['p50']} | p95: {lm['p95']}\n")
+        cc = summary["concurrency"]
+        f.write(f"- pipeline: {cc['pipeline_workers']} em paralelo, {cc['pipeline_wall_s']}s de parede; "
+                f"juiz: {cc['judge_workers']} em paralelo\n\n")
+
+        if summary["stages_ms"]:
+            f.write("## Latência por estágio (ms)\n")
+            f.write("| estágio | n | p50 | p95 |\n|---|---|---|---|\n")
+            for name, st in summary["stages_ms"].items():
+                f.write(f"| {name} | {st['n']} | {st['p50']} | {st['p95']} |\n")
+            f.write("\n")
 
         f.write("## Footprint (média aproximada do processo)\n")
         fp = summary["footprint"]
@@ -341,6 +570,9 @@ def run_eval(eval_path: str = EVAL_PATH) -> None:
         else:
             f.write(f"- **gold_hit_rate**: {gh:.2%}\n\n")
 
+    # Execução completa: o checkpoint não deve alimentar a próxima avaliação.
+    ckpt.reset()
+
     print("[DONE] Avaliação salva em:")
     print(f"- {REPORTS_DIR / 'report.md'}")
     print(f"- {REPORTS_DIR / 'raw_results.csv'}")
@@ -351,5 +583,9 @@ if __name__ == "__main__":
     import argparse
     ap = argparse.ArgumentParser()
     ap.add_argument("--eval-path", default=EVAL_PATH, help="Caminho para o JSONL (padrão autodetect)")
+    ap.add_argument("--pipeline-workers", type=int, default=EVAL_PIPELINE_WORKERS, help="Perguntas respondidas em paralelo (>1 mede latências sob contenção)")
+    ap.add_argument("--judge-workers", type=int, default=EVAL_JUDGE_WORKERS, help="Chamadas simultâneas ao juiz (RAGAS)")
+    ap.add_argument("--fresh", action="store_true", help="Ignora o checkpoint de uma execução interrompida e recomeça do zero")
     args = ap.parse_args()
-    run_eval(args.eval_path)
+    run_eval(args.eval_path, pipeline_workers=args.pipeline_workers,
+             judge_workers=args.judge_workers, resume=not args.fresh)
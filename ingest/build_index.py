@@ -1,58 +1,332 @@
-import argparse, os
+import argparse, os, json, time, uuid, hashlib, queue, threading
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from chromadb import PersistentClient
-from sentence_transformers import SentenceTransformer
-from src.utils.pdf_loader import load_pdf_with_metadata
+from src.utils.pdf_loader import iter_pdf_pages
+from src.utils.bm25 import BM25Index, BM25_FILE
+from src.utils.emb_cache import cached_encode
+from src.utils.settings import emb_key, get_embedder
+from src.utils.tokens import count_many, tokenizer_name
+from src.utils.vector_store import export_collection, mmap_build_id, MMAP_FILES, MMAP_VECTORS
 
 load_dotenv()
 
 DEFAULT_EMB = os.getenv("EMBEDDINGS_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+SPLITTER = {"chunk_size": 1200, "chunk_overlap": 150}
+CHUNK_IDS = 2  # 2: ids e metadados com `source`; entradas de manifest mais antigas são re-divididas
+MANIFEST = "manifest.json"
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "4"))
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").strip().lower()
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float32")  # float32 | float16 (só para o índice mmap)
+_DONE = object()
 
-def main(pdf_path: str, index_dir: str):
-    os.makedirs(index_dir, exist_ok=True)
+def _sha1(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
 
-    docs = load_pdf_with_metadata(pdf_path)
-    num_pages = len(docs)
+def chunk_id(page: int, text: str, source: str = "") -> str:
+    """
+    Id endereçado por conteúdo: o mesmo trecho na mesma página do mesmo PDF mantém o id
+    entre ingestões; relatórios diferentes nunca colidem.
+    """
+    key = f"{source}\n{page}\n{text}" if source else f"{page}\n{text}"
+    return "ipcc-" + _sha1(key)[:16]
 
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1200, chunk_overlap=150)
-    chunks = []
-    for d in docs:
-        parts = splitter.split_text(d["text"])
-        for c in parts:
-            c = (c or "").strip()
-            if not c:
-                continue
-            chunks.append({
-                "text": c,
-                "metadata": {"page": d["page"]},
-            })
+def write_index_meta(index_dir: str, **info):
+    """
+    Grava index_meta.json; o build_id invalida caches que dependem do índice e o emb_key
+    (modelo + backend) permite avisar se as perguntas forem embedadas de outro jeito.
+    """
+    meta = {"build_id": f"{int(time.time())}-{uuid.uuid4().hex[:8]}", "emb_model": DEFAULT_EMB, "emb_key": emb_key()}
+    meta.update(info)
+    with open(os.path.join(index_dir, "index_meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return meta
 
-    emb = SentenceTransformer(DEFAULT_EMB)
+def load_index_meta(index_dir: str) -> Dict:
+    try:
+        with open(os.path.join(index_dir, "index_meta.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
 
-    client = PersistentClient(path=index_dir)
+def load_manifest(index_dir: str) -> Dict:
     try:
-        client.delete_collection("ipcc")
+        with open(os.path.join(index_dir, MANIFEST), "r", encoding="utf-8") as f:
+            return json.load(f)
     except Exception:
-        pass
+        return {}
+
+def manifest_pdfs(manifest: Dict, index_dir: str, pdf_name: str) -> Dict[str, Dict]:
+    """
+    Páginas por PDF: {nome do PDF: {"splitter": ..., "pages": {página: {"hash", "chunks"}}}}.
+    Manifests antigos (só "pages") pertencem ao PDF registrado em index_meta.json.
+    """
+    pdfs = dict(manifest.get("pdfs") or {})
+    if "pages" in manifest and not pdfs:
+        try:
+            with open(os.path.join(index_dir, "index_meta.json"), "r", encoding="utf-8") as f:
+                owner = json.load(f).get("pdf") or pdf_name
+        except Exception:
+            owner = pdf_name
+        pdfs[owner] = {"splitter": manifest.get("splitter"), "pages": manifest["pages"]}
+    return pdfs
+
+def save_manifest(index_dir: str, manifest: Dict):
+    tmp = os.path.join(index_dir, MANIFEST + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp, os.path.join(index_dir, MANIFEST))
+
+def iter_collection(coll, batch: int = 1000, include=("documents",)):
+    offset = 0
+    while True:
+        got = coll.get(include=list(include), limit=batch, offset=offset)
+        if not got["ids"]:
+            break
+        yield got
+        offset += len(got["ids"])
+
+def build_bm25(coll, index_dir: str) -> int:
+    bm25 = BM25Index()
+    for got in iter_collection(coll):
+        bm25.add_many(zip(got["ids"], got["documents"]))
+    bm25.save(os.path.join(index_dir, BM25_FILE))
+    return len(bm25)
+
+class _LazyEmbedder:
+    """
+    Só carrega o embedder se algum texto não estiver no cache de embeddings. É o mesmo
+    do runtime (settings.get_embedder, com EMB_BACKEND): índice e perguntas no mesmo espaço.
+    """
+
+    def __init__(self):
+        self._model = None
+
+    def encode(self, *args, **kwargs):
+        if self._model is None:
+            self._model = get_embedder()
+        return self._model.encode(*args, **kwargs)
+
+class _Progress:
+    def __init__(self, every: float = 5.0):
+        self.t0 = time.time()
+        self.every = every
+        self._last = 0.0
+        self.pages = 0
+        self.embedded = 0
+        self.written = 0
+
+    def report(self, force: bool = False):
+        now = time.time()
+        if not force and now - self._last < self.every:
+            return
+        self._last = now
+        dt = max(now - self.t0, 1e-6)
+        print(
+            f"[ingest] {self.pages} páginas | {self.embedded} embedados | {self.written} gravados "
+            f"| {self.embedded / dt:.1f} chunks/s | {dt:.0f}s"
+        )
+
+class _StageAborted(Exception):
+    """Um estágio parou porque outro falhou; a causa fica no `.error` do estágio que falhou."""
+
+class _Stage(threading.Thread):
+    """Thread de pipeline que guarda a exceção para o main relançar."""
+
+    def __init__(self, name: str, fn):
+        super().__init__(name=name, daemon=True)
+        self.fn = fn
+        self.error: Optional[BaseException] = None
+
+    def run(self):
+        try:
+            self.fn()
+        except _StageAborted:
+            pass
+        except BaseException as e:
+            self.error = e
+
+def _put(q: queue.Queue, item, stages: List[_Stage]):
+    # put com timeout para não travar se um estágio seguinte morreu.
+    while True:
+        if any(st.error for st in stages):
+            raise _StageAborted()
+        try:
+            q.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            continue
+
+def _join(stages: List[_Stage]):
+    for st in stages:
+        while st.is_alive():
+            st.join(timeout=0.5)
+            if any(x.error for x in stages):
+                return
+
+def main(pdf_path: str, index_dir: str, full: bool = False, batch_size: int = INGEST_BATCH_SIZE,
+         export_mmap: bool = VECTOR_BACKEND == "mmap", vector_dtype: str = VECTOR_DTYPE):
+    """
+    Pipeline em streaming: extração → split → embedding em lotes → escrita em lotes,
+    com filas limitadas entre os estágios (memória constante no tamanho do corpus).
+    """
+    os.makedirs(index_dir, exist_ok=True)
+
+    pdf_name = os.path.basename(pdf_path)
+    manifest = load_manifest(index_dir)
+    key = emb_key()  # modelo + backend (onnx int8 gera vetores diferentes do torch)
+    compatible = not full and manifest.get("emb_model") == key
+
+    client = PersistentClient(path=index_dir)
+    if not compatible:
+        # Modelo/backend de embedding mudou (ou --full): vetores antigos não servem.
+        try:
+            client.delete_collection("ipcc")
+        except Exception:
+            pass
+        manifest = {}
+    pdfs = manifest_pdfs(manifest, index_dir, pdf_name)
 
     coll = client.get_or_create_collection(
         name="ipcc",
         metadata={"hnsw:space": "cosine"}
     )
+    existing = set()
+    for got in iter_collection(coll, include=()):
+        existing.update(got["ids"])
 
-    ids = [f"ipcc-{i}" for i in range(len(chunks))]
-    texts = [ch["text"] for ch in chunks]
-    metas = [ch["metadata"] for ch in chunks]
+    splitter = RecursiveCharacterTextSplitter(**SPLITTER)
+    prev = pdfs.get(pdf_name) or {}
+    # Com outro splitter (ou ids sem `source`) as páginas são re-divididas; ids por conteúdo
+    # reaproveitam os trechos iguais e o cache de embeddings evita recalcular os vetores.
+    reuse = prev.get("splitter") == SPLITTER and prev.get("chunk_ids") == CHUNK_IDS
+    prev_pages = prev.get("pages", {}) if reuse else {}
+    pages: Dict[str, Dict] = {}
+    progress = _Progress()
+    batch_size = max(1, batch_size)
+    chunk_q: queue.Queue = queue.Queue(maxsize=INGEST_QUEUE_SIZE * batch_size)
+    write_q: queue.Queue = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+    stages: List[_Stage] = []
 
-    vecs = emb.encode(texts, convert_to_numpy=True).tolist()
-    coll.add(ids=ids, documents=texts, metadatas=metas, embeddings=vecs)
+    def embed_stage():
+        emb = _LazyEmbedder()
+        batch: List[Dict] = []
 
-    print(f"Indexed {len(texts)} chunks from {num_pages} pages → {index_dir}")
+        def flush():
+            if not batch:
+                return
+            texts = [ch["text"] for ch in batch]
+            vecs = cached_encode(emb, key, texts, batch_size=batch_size).tolist()
+            # Tokens no tokenizer do LLM, usados pelo empacotador de contexto do answerer.
+            tok = tokenizer_name()
+            for ch, n in zip(batch, count_many(texts)):
+                ch["metadata"].update(n_tokens=n, tokenizer=tok)
+            _put(write_q, ([ch["id"] for ch in batch], texts, [ch["metadata"] for ch in batch], vecs), stages)
+            progress.embedded += len(batch)
+            batch.clear()
+
+        while True:
+            item = chunk_q.get()
+            if item is _DONE:
+                flush()
+                _put(write_q, _DONE, stages)
+                return
+            batch.append(item)
+            if len(batch) >= batch_size:
+                flush()
+
+    def write_stage():
+        while True:
+            item = write_q.get()
+            if item is _DONE:
+                return
+            ids, texts, metas, vecs = item
+            coll.upsert(ids=ids, documents=texts, metadatas=metas, embeddings=vecs)
+            progress.written += len(ids)
+            progress.report()
+
+    stages += [_Stage("ingest-embed", embed_stage), _Stage("ingest-write", write_stage)]
+    for st in stages:
+        st.start()
+
+    new_count = 0
+    try:
+        for d in iter_pdf_pages(pdf_path):
+            progress.pages += 1
+            ph = _sha1(d["text"])
+            old = prev_pages.get(str(d["page"]))
+            if old and old.get("hash") == ph and all(i in existing for i in old.get("chunks", [])):
+                pages[str(d["page"])] = old
+                continue
+
+            ids: List[str] = []
+            for c in splitter.split_text(d["text"]):
+                c = (c or "").strip()
+                if not c:
+                    continue
+                cid = chunk_id(d["page"], c, pdf_name)
+                if cid in ids:
+                    continue
+                ids.append(cid)
+                if cid not in existing:
+                    _put(chunk_q, {"id": cid, "text": c, "metadata": {"page": d["page"], "source": pdf_name}}, stages)
+                    new_count += 1
+            pages[str(d["page"])] = {"hash": ph, "chunks": ids}
+        _put(chunk_q, _DONE, stages)
+        _join(stages)
+    except _StageAborted:
+        pass  # relançada abaixo a exceção do estágio que falhou
+    for st in stages:
+        if st.error:
+            raise st.error
+    progress.report(force=True)
+
+    num_pages = len(pages)
+    wanted = {cid for p in pages.values() for cid in p["chunks"]}
+    pdfs[pdf_name] = {"splitter": SPLITTER, "chunk_ids": CHUNK_IDS, "pages": pages}
+    # Só sai o que nenhum PDF do manifest referencia: trechos de outros relatórios ficam.
+    referenced = {cid for entry in pdfs.values() for p in entry.get("pages", {}).values() for cid in p["chunks"]}
+    stale = sorted(existing - referenced)
+    if stale:
+        coll.delete(ids=stale)
+
+    save_manifest(index_dir, {"emb_model": key, "pdfs": pdfs})
+
+    changed = bool(new_count or stale) or not all(
+        os.path.exists(os.path.join(index_dir, f)) for f in ("index_meta.json", BM25_FILE)
+    )
+    if changed:
+        n_bm25 = build_bm25(coll, index_dir)
+        meta = write_index_meta(index_dir, chunks=n_bm25, pdf=pdf_name, pdfs=sorted(pdfs),
+                                pages=sum(len(e.get("pages", {})) for e in pdfs.values()))
+    else:
+        meta = load_index_meta(index_dir)
+
+    # Um índice mmap que já existe é sempre mantido em dia, mesmo sem --export-mmap:
+    # senão o runtime continuaria servindo vetores de uma build anterior.
+    mmap_exists = any(os.path.exists(os.path.join(index_dir, f)) for f in MMAP_FILES)
+    if (export_mmap or mmap_exists) and mmap_build_id(index_dir) != meta.get("build_id"):
+        # Cópia para busca exata em memória (VECTOR_BACKEND=mmap); o Chroma continua sendo a fonte.
+        n_mmap = export_collection(coll, index_dir, dtype=vector_dtype, build_id=meta.get("build_id"),
+                                   emb_model=key)
+        print(f"[ingest] Índice mmap ({vector_dtype}): {n_mmap} vetores → {os.path.join(index_dir, MMAP_VECTORS)}")
+
+    print(
+        f"Indexed {len(wanted)} chunks from {num_pages} pages of {pdf_name} → {index_dir} "
+        f"(+{new_count} embedded, -{len(stale)} removed, {len(wanted) - new_count} reused)"
+    )
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--pdf", required=True)
     ap.add_argument("--index-dir", required=True)
+    ap.add_argument("--full", action="store_true", help="Ignora o manifest e reconstrói o índice inteiro (todos os PDFs)")
+    ap.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE, help="Chunks por lote de embedding/escrita")
+    ap.add_argument("--export-mmap", action="store_true", default=VECTOR_BACKEND == "mmap",
+                    help="Também grava o índice mmap (vectors.npy, vectors.payload.bin, vectors.json)")
+    ap.add_argument("--vector-dtype", choices=["float32", "float16"], default=VECTOR_DTYPE)
     args = ap.parse_args()
-    main(args.pdf, args.index_dir)
+    main(args.pdf, args.index_dir, full=args.full, batch_size=args.batch_size,
+         export_mmap=args.export_mmap, vector_dtype=args.vector_dtype)
@@ -0,0 +1,60 @@
+import argparse, json, sys, time
+from pathlib import Path
+
+from src.graph import batch_answer, BATCH_MAX_WORKERS
+
+
+def read_queries(path: str):
+    src = sys.stdin if path == "-" else open(path, "r", encoding="utf-8-sig")
+    with src:
+        for ln in src:
+            ln = ln.strip()
+            if not ln or ln.startswith("#"):
+                continue
+            obj = json.loads(ln)
+            q = obj.get("question") or obj.get("pergunta") or obj.get("query")
+            if not q:
+                raise ValueError(f"Linha sem 'question': {obj}")
+            yield obj, q
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Responde perguntas em lote (JSONL in → JSONL out).")
+    ap.add_argument("--in", dest="inp", required=True, help="JSONL de entrada com 'question' (ou '-' para stdin)")
+    ap.add_argument("--out", dest="out", required=True, help="JSONL de saída")
+    ap.add_argument("--workers", type=int, default=BATCH_MAX_WORKERS, help="Chamadas ao LLM em paralelo")
+    ap.add_argument("--batch-size", type=int, default=32, help="Perguntas por lote de retrieval")
+    args = ap.parse_args()
+
+    items = list(read_queries(args.inp))
+    outp = Path(args.out)
+    outp.parent.mkdir(parents=True, exist_ok=True)
+
+    t_start = time.time()
+    with outp.open("w", encoding="utf-8") as f:
+        for i in range(0, len(items), args.batch_size):
+            chunk = items[i:i + args.batch_size]
+            t0 = time.time()
+            states = batch_answer([q for _, q in chunk], max_workers=args.workers)
+            for (obj, _), st in zip(chunk, states):
+                ans = st.get("answer") or {}
+                row = dict(obj)
+                row["answer"] = (ans.get("answer") or "").strip()
+                row["rejected"] = bool(ans.get("rejected"))
+                row["cached"] = bool(st.get("cached"))
+                row["contexts"] = [
+                    {"id": c.get("id"), "page": c.get("page"), "source": c.get("source"), "score": c.get("score"), "text": c.get("text")}
+                    for c in (st.get("contexts") or [])
+                ]
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            f.flush()
+            done = min(i + args.batch_size, len(items))
+            print(f"[batch] {done}/{len(items)} | lote em {time.time() - t0:.1f}s")
+
+    total = time.time() - t_start
+    rate = len(items) / total if total > 0 else 0.0
+    print(f"[batch] {len(items)} perguntas em {total:.1f}s ({rate:.2f}/s) → {outp}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import argparse, json, os, sys, threading, time
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from src.utils.cache_env import CACHE_ENV, active_caches, disable_caches
+
+
+def read_questions(path: str) -> List[str]:
+    out = []
+    with open(path, "r", encoding="utf-8-sig") as f:
+        for ln in f:
+            ln = ln.strip()
+            if not ln or ln.startswith("#"):
+                continue
+            obj = json.loads(ln)
+            q = obj.get("question") or obj.get("pergunta") or obj.get("query")
+            if q:
+                out.append(q)
+    if not out:
+        raise ValueError(f"Nenhuma pergunta em {path}")
+    return out
+
+
+class RssSampler(threading.Thread):
+    """RSS do processo e requisições concluídas a cada `period` segundos."""
+
+    def __init__(self, period: float, done_counter):
+        super().__init__(daemon=True)
+        import psutil
+        self.proc = psutil.Process(os.getpid())
+        self.period = period
+        self.done_counter = done_counter
+        self.samples: List[Dict] = []
+        self._halt = threading.Event()
+        self.t0 = time.time()
+
+    def run(self):
+        while not self._halt.is_set():
+            self.samples.append({
+                "t_s": round(time.time() - self.t0, 1),
+                "rss_mb": round(self.proc.memory_info().rss / (1024 * 1024), 1),
+                "done": self.done_counter(),
+            })
+            self._halt.wait(self.period)
+
+    def stop(self):
+        self._halt.set()
+        self.join(timeout=2.0)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Teste de carga: N usuários simulados sobre build_graph().")
+    ap.add_argument("--users", type=int, default=8, help="Usuários simultâneos")
+    ap.add_argument("--requests", type=int, default=5, help="Perguntas por usuário")
+    ap.add_argument("--eval-path", default="eval/eval_set.jsonl")
+    ap.add_argument("--provider", default="fake", help="LLM_PROVIDER para o teste (fake = sem rede)")
+    ap.add_argument("--think-time", type=float, default=0.0, help="Pausa (s) entre perguntas de um usuário")
+    ap.add_argument("--keep-cache", nargs="*", choices=sorted(CACHE_ENV), default=None,
+                    help="Mantém caches ligados (sem nomes = todos); por padrão todos ficam desligados")
+    ap.add_argument("--sample-interval", type=float, default=1.0, help="Intervalo (s) da amostragem de RSS")
+    ap.add_argument("--out", default="eval/reports/load_test.json")
+    args = ap.parse_args()
+
+    # Configuração antes de importar o grafo (os módulos leem o ambiente no import).
+    os.environ["LLM_PROVIDER"] = args.provider
+    disable_caches(keep=CACHE_ENV if args.keep_cache == [] else (args.keep_cache or ()))
+    from src.graph import build_graph
+    from src.utils.tracing import percentile, SINK
+
+    questions = read_questions(args.eval_path)
+    graph = build_graph()
+    caches = active_caches()
+    on = [n for n, v in caches.items() if v]
+    print(f"[load] caches ligados: {', '.join(on) if on else 'nenhum'}")
+
+    print("[load] aquecendo (carga de modelos)...")
+    t = time.time()
+    graph.invoke({"query": questions[0], "contexts": [], "answer": {}})
+    print(f"[load] aquecimento em {time.time() - t:.1f}s")
+    SINK.clear()
+
+    lat_ms: List[float] = []
+    errors: List[str] = []
+    lock = threading.Lock()
+
+    def user(uid: int):
+        for i in range(args.requests):
+            q = questions[(uid * args.requests + i) % len(questions)]
+            t0 = time.perf_counter()
+            try:
+                graph.invoke({"query": q, "contexts": [], "answer": {}})
+                with lock:
+                    lat_ms.append((time.perf_counter() - t0) * 1000)
+            except Exception as e:
+                with lock:
+                    errors.append(f"{type(e).__name__}: {e}")
+            if args.think_time:
+                time.sleep(args.think_time)
+
+    sampler = RssSampler(args.sample_interval, lambda: len(lat_ms) + len(errors))
+    sampler.start()
+    t_start = time.time()
+    threads = [threading.Thread(target=user, args=(u,), daemon=True) for u in range(args.users)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    wall = time.time() - t_start
+    sampler.stop()
+
+    asked = {questions[(u * args.requests + i) % len(questions)] for u in range(args.users) for i in range(args.requests)}
+    report = {
+        "users": args.users,
+        "requests": len(lat_ms) + len(errors),
+        "distinct_questions": len(asked),
+        "caches": caches,
+        "errors": len(errors),
+        "wall_s": round(wall, 2),
+        "throughput_rps": round(len(lat_ms) / wall, 3) if wall > 0 else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(lat_ms, 50), 1),
+            "p95": round(percentile(lat_ms, 95), 1),
+            "p99": round(percentile(lat_ms, 99), 1),
+            "max": round(max(lat_ms), 1) if lat_ms else None,
+        },
+        "rss_mb": {
+            "peak": max((s["rss_mb"] for s in sampler.samples), default=None),
+            "timeline": sampler.samples,
+        },
+        "stages_ms": SINK.to_json(),
+        "error_samples": errors[:5],
+    }
+
+    print(f"[load] {report['requests']} req ({report['errors']} erros, {len(asked)} perguntas distintas) "
+          f"em {report['wall_s']}s → {report['throughput_rps']} req/s")
+    lm = report["latency_ms"]
+    print(f"[load] latência p50 {lm['p50']} ms | p95 {lm['p95']} ms | p99 {lm['p99']} ms")
+    print(f"[load] RSS pico {report['rss_mb']['peak']} MB")
+
+    outp = Path(args.out)
+    outp.parent.mkdir(parents=True, exist_ok=True)
+    outp.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"[load] Relatório → {outp}")
+
+
+if __name__ == "__main__":
+    main()
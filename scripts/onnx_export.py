@@ -0,0 +1,154 @@
+import argparse, json, os, subprocess, sys, time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from src.utils.settings import (
+    EMB_NAME, RERANK_MODEL, ONNX_QUANT, onnx_model_dir, onnx_file_name,
+)
+
+EVAL_SET = "eval/eval_set.jsonl"
+
+
+def _classes():
+    from sentence_transformers import SentenceTransformer, CrossEncoder
+    return {"emb": (SentenceTransformer, EMB_NAME), "rerank": (CrossEncoder, RERANK_MODEL)}
+
+
+def export(kind: str, quant: str) -> str:
+    """Salva o modelo localmente, exporta para ONNX e gera a variante int8 dinâmica."""
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    cls, name = _classes()[kind]
+    out = onnx_model_dir(name)
+    if not os.path.exists(os.path.join(out, "onnx", "model.onnx")):
+        cls(name).save(out)
+        cls(out, backend="onnx").save(out)  # sem model.onnx o sentence-transformers exporta o fp32
+    model = cls(out, backend="onnx")
+    export_dynamic_quantized_onnx_model(model, quant, out)
+    print(f"[onnx_export] {name} → {os.path.join(out, onnx_file_name(quant))}")
+    return out
+
+
+def load(kind: str, backend: str, quant: str):
+    cls, name = _classes()[kind]
+    if backend == "torch":
+        return cls(name)
+    return cls(onnx_model_dir(name), backend="onnx", model_kwargs={"file_name": onnx_file_name(quant)})
+
+
+def sample(n: int) -> Tuple[List[str], List[str]]:
+    """Perguntas do eval set e trechos do índice (se existir) para os testes."""
+    questions = []
+    try:
+        with open(EVAL_SET, "r", encoding="utf-8-sig") as f:
+            for ln in f:
+                ln = ln.strip()
+                if ln:
+                    questions.append(json.loads(ln)["question"])
+    except Exception:
+        questions = ["How much has global surface temperature increased since 1850–1900?"]
+    passages = []
+    try:
+        from src.utils.settings import get_collection
+        passages = [d for d in get_collection().get(include=["documents"], limit=n)["documents"] if d]
+    except Exception:
+        pass
+    return questions[:n], passages or questions[:n]
+
+
+def run(model, kind: str, questions: List[str], passages: List[str]) -> np.ndarray:
+    if kind == "emb":
+        return np.asarray(model.encode(questions + passages, convert_to_numpy=True, normalize_embeddings=True))
+    pairs = [(q, p) for q in questions for p in passages[:8]]
+    return np.asarray(model.predict(pairs, convert_to_numpy=True, show_progress_bar=False), dtype=np.float32)
+
+
+def parity(kind: str, ref: np.ndarray, got: np.ndarray, n_questions: int) -> Dict:
+    if kind == "emb":
+        cos = np.sum(ref * got, axis=1)
+        return {"cos_mean": round(float(cos.mean()), 5), "cos_min": round(float(cos.min()), 5)}
+    diff = np.abs(ref - got)
+    r, g = ref.reshape(n_questions, -1), got.reshape(n_questions, -1)
+    top1 = float(np.mean(r.argmax(axis=1) == g.argmax(axis=1)))
+    return {"abs_diff_mean": round(float(diff.mean()), 5), "abs_diff_max": round(float(diff.max()), 5),
+            "top1_agreement": round(top1, 3)}
+
+
+def bench(kind: str, backend: str, quant: str, n: int, reps: int) -> Dict:
+    """Roda num processo limpo: tempo de carga, latência por chamada e RSS."""
+    import psutil
+    proc = psutil.Process(os.getpid())
+    questions, passages = sample(n)
+    rss0 = proc.memory_info().rss
+    t0 = time.perf_counter()
+    model = load(kind, backend, quant)
+    load_s = time.perf_counter() - t0
+    run(model, kind, questions[:2], passages[:2])  # aquecimento
+    times = []
+    for _ in range(reps):
+        t = time.perf_counter()
+        run(model, kind, questions, passages)
+        times.append(time.perf_counter() - t)
+    return {
+        "backend": backend,
+        "load_s": round(load_s, 2),
+        "p50_ms": round(float(np.percentile(times, 50)) * 1000, 1),
+        "p95_ms": round(float(np.percentile(times, 95)) * 1000, 1),
+        "rss_mb": round(proc.memory_info().rss / (1024 * 1024), 1),
+        "rss_model_mb": round((proc.memory_info().rss - rss0) / (1024 * 1024), 1),
+    }
+
+
+def bench_subprocess(kind: str, backend: str, quant: str, n: int, reps: int) -> Dict:
+    out = subprocess.run(
+        [sys.executable, "-m", "scripts.onnx_export", "--bench", kind, backend,
+         "--quant", quant, "--samples", str(n), "--reps", str(reps)],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Exporta embedder/reranker para ONNX int8 e compara com PyTorch.")
+    ap.add_argument("--models", choices=["emb", "rerank", "both"], default="both")
+    ap.add_argument("--quant", default=ONNX_QUANT, help="arm64 | avx2 | avx512 | avx512_vnni")
+    ap.add_argument("--samples", type=int, default=16, help="Perguntas/trechos usados na comparação")
+    ap.add_argument("--reps", type=int, default=5, help="Repetições para a latência")
+    ap.add_argument("--skip-export", action="store_true", help="Só compara (modelos já exportados)")
+    ap.add_argument("--report", default="eval/reports/onnx_report.json")
+    ap.add_argument("--bench", nargs=2, metavar=("KIND", "BACKEND"), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.bench:
+        print(json.dumps(bench(args.bench[0], args.bench[1], args.quant, args.samples, args.reps)))
+        return
+
+    kinds = ["emb", "rerank"] if args.models == "both" else [args.models]
+    report = {"quant": args.quant}
+    questions, passages = sample(args.samples)
+    for kind in kinds:
+        if not args.skip_export:
+            export(kind, args.quant)
+        ref = run(load(kind, "torch", args.quant), kind, questions, passages)
+        got = run(load(kind, "onnx", args.quant), kind, questions, passages)
+        report[kind] = {
+            "model": _classes()[kind][1],
+            "parity": parity(kind, ref, got, len(questions)),
+            "torch": bench_subprocess(kind, "torch", args.quant, args.samples, args.reps),
+            "onnx": bench_subprocess(kind, "onnx", args.quant, args.samples, args.reps),
+        }
+        r = report[kind]
+        print(f"[onnx_export] {kind}: paridade {r['parity']}")
+        for b in ("torch", "onnx"):
+            print(f"[onnx_export] {kind}/{b}: p50 {r[b]['p50_ms']} ms | p95 {r[b]['p95_ms']} ms "
+                  f"| RSS {r[b]['rss_mb']} MB (modelo {r[b]['rss_model_mb']} MB) | carga {r[b]['load_s']}s")
+
+    os.makedirs(os.path.dirname(args.report) or ".", exist_ok=True)
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"[onnx_export] Relatório → {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,22 @@
+import os, json, asyncio, hashlib, inspect, contextvars
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, END
-from typing import TypedDict, List, Dict
+from typing import TypedDict, List, Dict, Optional
 
-from src.nodes.retriever import retrieve
-from src.nodes.answerer import answer, FALLBACK
-from src.nodes.selfcheck import self_check
+from src.nodes import retriever as _retriever, compressor as _compressor
+from src.nodes.retriever import retrieve, retrieve_batch, aretrieve, normalize_text, K, RETRY_K_FACTOR
+from src.nodes.answerer import answer, aanswer, FALLBACK, SYSTEM_PROMPT, PACK_DUP_OVERLAP, context_budget
+from src.nodes.compressor import compress, COMPRESS_ENABLE
+from src.utils.llm import llm_name
+from src.nodes.selfcheck import self_check, FALLBACK as SELFCHECK_FALLBACK
 from src.nodes.safety import apply_safety
 from src.nodes.supervisor import Supervisor
-from src.nodes.moderator import moderate, REJECTION_OFF_TOPIC, REJECTION_UNSAFE
+from src.nodes.moderator import moderate, amoderate, REJECTION_OFF_TOPIC, REJECTION_UNSAFE, MODERATOR_SYSTEM_PROMPT
+from src.utils.answer_cache import get_answer_cache
+from src.utils.emb_cache import cached_encode
+from src.utils.settings import get_embedder, emb_key, rerank_key, index_version, RERANK_ENABLE
+from src.utils.tracing import span, collect
 
 class State(TypedDict, total=False):
     query: str
@@ -15,54 +25,228 @@ class State(TypedDict, total=False):
     stage: str
     tries: int
     agent_logs: List[str]
+    cached: bool
+    compression: Dict[str, int]
+    spans: List[Dict]
 
-def build_graph():
+SPECULATIVE_MODERATION = os.getenv("SPECULATIVE_MODERATION", "1") == "1"
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "4"))
+
+# Retrievals especulativos descartados continuam rodando aqui em segundo plano.
+_SPEC_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="spec-retrieve")
+
+def _answer_config() -> str:
+    """Hash dos prompts e da configuração de retrieval/empacotamento (mudam a resposta sem mudar modelos/índice)."""
+    r, c = _retriever, _compressor
+    raw = json.dumps([
+        SYSTEM_PROMPT, MODERATOR_SYSTEM_PROMPT, RERANK_ENABLE, rerank_key(), context_budget(), PACK_DUP_OVERLAP,
+        r.K, r.MIN_SIM, r.UNIQ_BY_PAGE, r.RERANK_TOP_K, r.RERANK_ALPHA, r.RERANK_CASCADE, r.RERANK_SKIP_MARGIN,
+        r.RERANK_MIN_POOL, r.HYBRID_ENABLE, r.HYBRID_FUSION, r.HYBRID_WEIGHT, r.RRF_K,
+        c.COMPRESS_ENABLE, c.COMPRESS_TOP_SENTS, c.COMPRESS_MIN_SENT_CHARS,
+    ])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+def _cache_namespace() -> str:
+    return f"{emb_key()}|{llm_name()}|{index_version()}|{_answer_config()}"
+
+def _embed_query(q: str):
+    return cached_encode(get_embedder(), emb_key(), [normalize_text(q)])[0]
+
+def _speculative_retrieve(query: str):
+    """retrieve() com spans numa lista própria: só entram no state se a pergunta for aceita."""
+    spans: List[Dict] = []
+    with collect(spans):
+        hits = retrieve(query)
+    return hits, spans
+
+def _apply_moderation(s: State, dec: str) -> bool:
+    if dec == "reject_unsafe":
+        s["answer"] = {"answer": REJECTION_UNSAFE, "contexts": [], "rejected": True}
+    elif dec == "reject_off_topic":
+        s["answer"] = {"answer": REJECTION_OFF_TOPIC, "contexts": [], "rejected": True}
+    else:
+        return True
+    s["stage"] = "moderated_reject"
+    return False
+
+def node_cache(s: State, qvec=None):
+    # qvec: embedding da pergunta normalizada já calculado (batch_answer); senão, encode aqui.
+    cache = get_answer_cache()
+    hit = None
+    if cache is not None:
+        ns = _cache_namespace()
+        hit = cache.lookup_exact(s["query"], ns)
+        if hit is None:
+            hit = cache.lookup_semantic(s["query"], _embed_query(s["query"]) if qvec is None else qvec, ns)
+    if hit is not None:
+        s["answer"] = hit["answer"]
+        s["contexts"] = hit["contexts"]
+        s["cached"] = True
+        s["stage"] = "cache_hit"
+    else:
+        s["cached"] = False
+        s["stage"] = "cache_miss"
+    return s
+
+def node_compress(s: State):
+    s["contexts"], s["compression"] = compress(s["query"], s.get("contexts", []))
+    s["stage"] = "compressed"
+    return s
+
+def node_selfcheck(s: State):
+    s["answer"] = self_check(s.get("answer", {}))
+    ans_txt = (s["answer"] or {}).get("answer", "")
+    if ans_txt in (FALLBACK, SELFCHECK_FALLBACK) and s.get("tries", 0) < 1:
+        s["tries"] = s.get("tries", 0) + 1
+        s["stage"] = "retry"
+    else:
+        s["stage"] = "safety"
+    return s
+
+def node_safety(s: State, qvec=None):
+    base = s.get("answer") or {"answer": FALLBACK, "contexts": s.get("contexts", [])}
+    cacheable = (base.get("answer") or FALLBACK) not in (FALLBACK, SELFCHECK_FALLBACK)
+    s["answer"] = apply_safety(base)
+    cache = get_answer_cache()
+    if cache is not None and cacheable:
+        qvec = _embed_query(s["query"]) if qvec is None else qvec
+        cache.store(s["query"], qvec, s["answer"], s.get("contexts", []), _cache_namespace())
+    s["stage"] = "safety"
+    return s
+
+def _traced(name: str, fn):
+    """Envolve um nó num span; os spans (inclusive subetapas) vão para state["spans"]."""
+    wants_config = "config" in inspect.signature(fn).parameters
+
+    def _annotate(sp: Dict, s: State):
+        sp["stage"] = s.get("stage")
+        sp["contexts"] = len(s.get("contexts") or [])
+
+    if asyncio.iscoroutinefunction(fn):
+        async def run(s: State, config: RunnableConfig):
+            with collect(s.setdefault("spans", [])), span(name) as sp:
+                out = await (fn(s, config) if wants_config else fn(s))
+                _annotate(sp, out)
+            return out
+    else:
+        def run(s: State, config: RunnableConfig):
+            with collect(s.setdefault("spans", [])), span(name) as sp:
+                out = fn(s, config) if wants_config else fn(s)
+                _annotate(sp, out)
+            return out
+    run.__name__ = name
+    return run
+
+def _retrieve_k(s: State) -> int:
+    # Na nova tentativa o pool é ampliado; repetir a mesma busca só devolveria os mesmos trechos.
+    return K * RETRY_K_FACTOR if s.get("tries", 0) > 0 else K
+
+def _on_partial(config: RunnableConfig):
+    # Streaming opcional: graph.invoke(..., config={"configurable": {"on_partial": cb}})
+    return ((config or {}).get("configurable") or {}).get("on_partial")
+
+def build_graph(speculative: bool = SPECULATIVE_MODERATION, use_async: bool = False,
+                compress_contexts: bool = COMPRESS_ENABLE):
+    """
+    Compila o grafo. Com use_async=True os nós de moderação, retrieval e resposta
+    são corrotinas (use graph.ainvoke); trabalho CPU-bound vai para threads.
+    """
     g = StateGraph(State)
-    sup = Supervisor()
+    sup = Supervisor(speculative=speculative, compress=compress_contexts)
 
     def node_moderate(s: State):
-        dec = moderate(s["query"])
-        if dec == "reject_unsafe":
-            s["answer"] = {"answer": REJECTION_UNSAFE, "contexts": [], "rejected": True}
-            s["stage"] = "moderated_reject"
-        elif dec == "reject_off_topic":
-            s["answer"] = {"answer": REJECTION_OFF_TOPIC, "contexts": [], "rejected": True}
-            s["stage"] = "moderated_reject"
-        else:
+        if _apply_moderation(s, moderate(s["query"])):
             s["stage"] = "moderated_ok"
         return s
 
+    def node_moderate_retrieve(s: State):
+        # Execução especulativa: retrieval em paralelo com a moderação;
+        # se a pergunta for rejeitada (ou a moderação falhar), o resultado é descartado.
+        fut = _SPEC_POOL.submit(contextvars.copy_context().run, _speculative_retrieve, s["query"])
+        accepted = False
+        try:
+            accepted = _apply_moderation(s, moderate(s["query"]))
+        finally:
+            if not accepted:
+                fut.cancel()  # sem efeito se já começou; os spans ficam fora do state
+        if accepted:
+            s["contexts"], spans = fut.result()
+            s.setdefault("spans", []).extend(spans)
+            s["stage"] = "retrieved"
+        return s
+
     def node_retrieve(s: State):
-        s["contexts"] = retrieve(s["query"])
+        s["contexts"] = retrieve(s["query"], k=_retrieve_k(s))
         s["stage"] = "retrieved"
         return s
 
-    def node_answer(s: State):
-        s["answer"] = answer(s["query"], s.get("contexts", []))
+    def node_answer(s: State, config: RunnableConfig):
+        s["answer"] = answer(s["query"], s.get("contexts", []), on_partial=_on_partial(config))
         s["stage"] = "answered"
         return s
 
-    def node_selfcheck(s: State):
-        s["answer"] = self_check(s.get("answer", {}))
-        ans_txt = (s["answer"] or {}).get("answer", "")
-        if ans_txt == FALLBACK and s.get("tries", 0) < 1:
-            s["tries"] = s.get("tries", 0) + 1
-            s["stage"] = "retry"
-        else:
-            s["stage"] = "safety"
+    async def anode_cache(s: State):
+        return await asyncio.to_thread(node_cache, s)
+
+    async def anode_moderate(s: State):
+        if _apply_moderation(s, await amoderate(s["query"])):
+            s["stage"] = "moderated_ok"
         return s
 
-    def node_safety(s: State):
-        base = s.get("answer") or {"answer": FALLBACK, "contexts": s.get("contexts", [])}
-        s["answer"] = apply_safety(base)
-        s["stage"] = "safety"
+    async def anode_moderate_retrieve(s: State):
+        task = asyncio.create_task(asyncio.to_thread(_speculative_retrieve, s["query"]))
+        accepted = False
+        try:
+            accepted = _apply_moderation(s, await amoderate(s["query"]))
+        finally:
+            if not accepted:
+                task.cancel()
+        if accepted:
+            s["contexts"], spans = await task
+            s.setdefault("spans", []).extend(spans)
+            s["stage"] = "retrieved"
+        return s
+
+    async def anode_retrieve(s: State):
+        s["contexts"] = await aretrieve(s["query"], k=_retrieve_k(s))
+        s["stage"] = "retrieved"
         return s
 
-    g.add_node("moderate", node_moderate)
-    g.add_node("retrieve", node_retrieve)
-    g.add_node("answer", node_answer)
-    g.add_node("selfcheck", node_selfcheck)
-    g.add_node("safety", node_safety)
+    async def anode_compress(s: State):
+        return await asyncio.to_thread(node_compress, s)
+
+    async def anode_answer(s: State, config: RunnableConfig):
+        s["answer"] = await aanswer(s["query"], s.get("contexts", []), on_partial=_on_partial(config))
+        s["stage"] = "answered"
+        return s
+
+    async def anode_safety(s: State):
+        return await asyncio.to_thread(node_safety, s)
+
+    if use_async:
+        nodes = {
+            "cache": anode_cache,
+            "moderate": anode_moderate,
+            "moderate_retrieve": anode_moderate_retrieve,
+            "retrieve": anode_retrieve,
+            "compress": anode_compress,
+            "answer": anode_answer,
+            "safety": anode_safety,
+        }
+    else:
+        nodes = {
+            "cache": node_cache,
+            "moderate": node_moderate,
+            "moderate_retrieve": node_moderate_retrieve,
+            "retrieve": node_retrieve,
+            "compress": node_compress,
+            "answer": node_answer,
+            "safety": node_safety,
+        }
+
+    nodes["selfcheck"] = node_selfcheck
+    for name, fn in nodes.items():
+        g.add_node(name, _traced(name, fn))
     g.add_node("supervisor", sup)
 
     g.set_entry_point("supervisor")
@@ -71,8 +255,11 @@ def build_graph():
         "supervisor",
         sup.decide_next,
         {
+            "cache": "cache",
             "moderate": "moderate",
+            "moderate_retrieve": "moderate_retrieve",
             "retrieve": "retrieve",
+            "compress": "compress",
             "answer": "answer",
             "selfcheck": "selfcheck",
             "safety": "safety",
@@ -80,11 +267,55 @@ def build_graph():
         },
     )
 
+    g.add_edge("cache", "supervisor")
     g.add_edge("moderate", "supervisor")
+    g.add_edge("moderate_retrieve", "supervisor")
     g.add_edge("retrieve", "supervisor")
+    g.add_edge("compress", "supervisor")
     g.add_edge("answer", "supervisor")
     g.add_edge("selfcheck", "supervisor")
 
     g.add_edge("safety", END)
 
     return g.compile()
+
+def _answer_until_done(s: State, qvec=None) -> State:
+    # Mesmo ciclo do grafo a partir de "retrieved": (compress ->) answer -> selfcheck (-> retry) -> safety.
+    while True:
+        if COMPRESS_ENABLE:
+            node_compress(s)
+        s["answer"] = answer(s["query"], s.get("contexts", []))
+        node_selfcheck(s)
+        if s["stage"] != "retry":
+            break
+        s["contexts"] = retrieve(s["query"], k=_retrieve_k(s))
+    return node_safety(s, qvec)
+
+def batch_answer(queries: List[str], max_workers: Optional[int] = None) -> List[State]:
+    """
+    Responde várias perguntas de uma vez: um encode das perguntas (usado pelo cache de
+    respostas e pelo retrieval), moderação por pergunta, retrieval em lote (um query no
+    Chroma e um predict do CrossEncoder) e chamadas ao LLM com concorrência limitada.
+    Devolve um estado final por pergunta, na ordem de entrada.
+    """
+    workers = max(1, max_workers or BATCH_MAX_WORKERS)
+    states: List[State] = [
+        {"query": q, "contexts": [], "answer": {}, "tries": 0, "agent_logs": [], "stage": "start"}
+        for q in queries
+    ]
+    if not states:
+        return states
+
+    qvecs = cached_encode(get_embedder(), emb_key(), [normalize_text(q) for q in queries])
+    pending = [(s, v) for s, v in zip(states, qvecs) if node_cache(s, qvec=v)["stage"] == "cache_miss"]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as ex:
+        decisions = list(ex.map(moderate, [s["query"] for s, _ in pending]))
+        ok = [(s, v) for (s, v), dec in zip(pending, decisions) if _apply_moderation(s, dec)]
+
+        hits = retrieve_batch([s["query"] for s, _ in ok], qvecs=[v for _, v in ok])
+        for (s, _), ctxs in zip(ok, hits):
+            s["contexts"] = ctxs
+            s["stage"] = "retrieved"
+
+        list(ex.map(_answer_until_done, [s for s, _ in ok], [v for _, v in ok]))
+    return states
@@ -1,43 +1,19 @@
-import os
-os.environ.setdefault("GRPC_VERBOSITY", "ERROR")
-os.environ.setdefault("GRPC_TRACE", "")
-os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
-
-try:
-    from absl import logging as absl_logging
-    absl_logging.set_verbosity(absl_logging.ERROR)
-except Exception:
-    pass
-
-from typing import List, Dict
-import os, re, textwrap
-from dotenv import load_dotenv
-load_dotenv()
+from typing import List, Dict, Callable, Optional, Tuple
+import os, re, time, textwrap
 
 from langchain.schema import HumanMessage, SystemMessage
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_ollama import ChatOllama
-
-def make_llm():
-    google_key = os.getenv("GOOGLE_API_KEY")
-    if google_key:
-        gem_model = os.getenv("GEMINI_MODEL", "gemini-2.5-pro")
-        return ChatGoogleGenerativeAI(
-            model=gem_model,
-            temperature=0.0,
-        )
-    ollama_model = os.getenv("OLLAMA_MODEL", "qwen2.5:7b-instruct")
-    return ChatOllama(
-        model=ollama_model,
-        temperature=0.0,
-        num_ctx=2048,
-        num_predict=256,
-        keep_alive="30m",
-        base_url=os.getenv("OLLAMA_BASE_URL", "http://127.0.0.1:11434"),
-    )
-
-llm = make_llm()
-print("LLM ativo:", type(llm).__name__)
+from src.utils.citations import CITE_RE, cite_tag, ctx_page, ctx_source
+from src.utils.llm import get_llm_for, provider
+from src.utils.tokens import count_many, tokenizer_name
+from src.utils.tracing import span
+
+# Orçamento de tokens para os trechos no prompt (0 = sem limite, todos os trechos entram).
+# Vazio = automático: OLLAMA_CONTEXT_BUDGET com Ollama (num_ctx limitado), sem limite nos demais.
+CONTEXT_TOKEN_BUDGET = os.getenv("CONTEXT_TOKEN_BUDGET", "").strip()
+OLLAMA_CONTEXT_BUDGET = 1500
+# Fração de shingles já presentes no contexto acima da qual o trecho é considerado duplicado.
+PACK_DUP_OVERLAP = float(os.getenv("PACK_DUP_OVERLAP", "0.6"))
+_BLOCK_OVERHEAD = 12  # "[p.X]" / "[<relatório> p.X]" + separador
 
 FALLBACK = "Não encontrei evidências suficientes no IPCC para responder com confiança."
 
@@ -47,8 +23,8 @@ Regras:
 - Escreva em português do Brasil. Mantenha termos técnicos do IPCC como aparecem nos trechos quando não houver tradução inequívoca.
 - Reproduza números, unidades, intervalos, rótulos de cenários (ex.: SSP1-2.6) e termos calibrados de confiança exatamente como nos trechos.
 - Mencione cenários/regiões/janelas de tempo SOMENTE se constarem nos trechos.
-- Cada frase factual deve terminar com uma citação de página no formato [p.X]; se usar vários trechos, encadeie [p.X][p.Y].
-- Use apenas páginas que aparecem nos trechos.
+- Cada frase factual deve terminar com a citação do trecho usado, copiada exatamente do cabeçalho do trecho ([p.X], ou [RELATÓRIO p.X] quando o trecho indica o relatório); se usar vários trechos, encadeie [p.X][p.Y].
+- Use apenas páginas (e relatórios) que aparecem nos trechos.
 - NÃO copie cabeçalhos de seção/figura/tabela (ex.: “Figure 3.2”). Descreva o conteúdo em texto corrido.
 - Seja conciso: parágrafos curtos ou bullets quando ajudar.
 - Se os trechos forem insuficientes, responda exatamente:
@@ -72,20 +48,78 @@ def _build_context(ctxs: List[Dict]) -> str:
     blocks = []
     for c in ctxs:
         txt = (c.get("text") or c.get("page_content") or "").strip()
-        pg  = c.get("page") or (c.get("metadata") or {}).get("page")
+        pg  = ctx_page(c)
         if not txt or not pg:
             continue
-        blocks.append(f"[p.{pg}]\n{txt}")
+        blocks.append(f"{cite_tag(pg, ctx_source(c))}\n{txt}")
     return "\n\n---\n\n".join(blocks)
 
+def _ctx_text(c: Dict) -> str:
+    return (c.get("text") or c.get("page_content") or "").strip()
+
+def _ctx_tokens(ctxs: List[Dict]) -> List[int]:
+    """n_tokens gravado na ingestão quando vem do mesmo tokenizer; senão conta agora."""
+    name = tokenizer_name()
+    out: List[Optional[int]] = []
+    for c in ctxs:
+        meta = c.get("metadata") or {}
+        n = meta.get("n_tokens") if meta.get("tokenizer") == name else None
+        out.append(int(n) if n is not None else None)
+    todo = [i for i, n in enumerate(out) if n is None]
+    for i, n in zip(todo, count_many([_ctx_text(ctxs[i]) for i in todo])):
+        out[i] = n
+    return out
+
+def _shingles(text: str, n: int = 8) -> set:
+    w = re.findall(r"\w+", text.lower())
+    return {" ".join(w[i:i + n]) for i in range(max(1, len(w) - n + 1))}
+
+def context_budget() -> int:
+    if CONTEXT_TOKEN_BUDGET:
+        return int(CONTEXT_TOKEN_BUDGET)
+    return OLLAMA_CONTEXT_BUDGET if provider() == "ollama" else 0
+
+def _pack(ctxs: List[Dict], budget: Optional[int] = None) -> Tuple[List[Dict], int]:
+    """
+    Seleciona trechos na ordem do retriever até encher o orçamento de tokens, descartando
+    os que se sobrepõem a trechos já escolhidos (overlap do splitter, páginas repetidas).
+    Não reordena por `score`: trechos rerankeados e os que a cascata pulou têm scores em
+    escalas diferentes. Devolve (trechos na ordem recebida, tokens usados).
+    """
+    if budget is None:
+        budget = context_budget()
+    ranked = [c for c in ctxs if _ctx_text(c)]
+    if budget <= 0:
+        return ranked, sum(_ctx_tokens(ranked)) + _BLOCK_OVERHEAD * len(ranked)
+
+    packed: List[Dict] = []
+    seen: set = set()
+    used = 0
+    for c, n in zip(ranked, _ctx_tokens(ranked)):
+        sh = _shingles(_ctx_text(c))
+        if packed and len(sh & seen) >= PACK_DUP_OVERLAP * len(sh):
+            continue
+        cost = n + _BLOCK_OVERHEAD
+        if used + cost > budget:
+            if packed:
+                continue
+            # Nem o melhor trecho cabe: entra truncado na proporção do orçamento.
+            keep = max(1, int(len(_ctx_text(c)) * (budget - _BLOCK_OVERHEAD) / max(n, 1)))
+            c = dict(c, text=_ctx_text(c)[:keep])
+            cost = budget
+        packed.append(c)
+        seen |= sh
+        used += cost
+    return packed, used
+
 def _normalize_citations(text: str) -> str:
-    text = re.sub(r"\[\s*p\s*\.?\s*(\d+)\s*\]", r"[p.\1]", text)
+    text = re.sub(r"\[\s*(?:([^\[\]\s]+)\s+)?p\s*\.?\s*(\d+)\s*\]", lambda m: cite_tag(m.group(2), m.group(1)), text)
     text = re.sub(r"\(\s*p\s*\.?\s*(\d+)\s*\)", r"[p.\1]", text)
-    text = re.sub(r"\s+\[p\.(\d+)\]", r" [p.\1]", text)
+    text = re.sub(r"\s+(" + CITE_RE.pattern + ")", r" \1", text)
     return text
 
 def _has_any_citation(text: str) -> bool:
-    return bool(re.search(r"\[p\.\d+\]", text))
+    return bool(CITE_RE.search(text))
 
 def _keywords(q: str) -> List[str]:
     toks = re.findall(r"[A-Za-z0-9\-\./]+", q.lower())
@@ -96,7 +130,7 @@ def _extractive_fallback(query: str, ctxs: List[Dict], max_sents: int = 5, min_s
     picked: List[str] = []
     seen = set()
 
-    def pick_from_text(txt, pg, require_kws=True):
+    def pick_from_text(txt, pg, src, require_kws=True):
         nonlocal picked
         for sent in _SENT_SPLIT.split(txt):
             s = sent.strip()
@@ -109,26 +143,26 @@ def _extractive_fallback(query: str, ctxs: List[Dict], max_sents: int = 5, min_s
             if sig in seen:
                 continue
             seen.add(sig)
-            if not re.search(r"\[p\.\d+\]\s*$", s):
-                s = s.rstrip(". ") + f" [p.{pg}]"
+            if not re.search(CITE_RE.pattern + r"\s*$", s):
+                s = s.rstrip(". ") + " " + cite_tag(pg, src)
             picked.append(s)
             if len(picked) >= max_sents:
                 break
 
     for c in ctxs:
         txt = (c.get("text") or c.get("page_content") or "").strip()
-        pg  = c.get("page") or (c.get("metadata") or {}).get("page")
+        pg  = ctx_page(c)
         if txt and pg:
-            pick_from_text(txt, pg, require_kws=True)
+            pick_from_text(txt, pg, ctx_source(c), require_kws=True)
         if len(picked) >= max_sents:
             break
 
     if len(picked) < min_sents:
         for c in ctxs:
             txt = (c.get("text") or c.get("page_content") or "").strip()
-            pg  = c.get("page") or (c.get("metadata") or {}).get("page")
+            pg  = ctx_page(c)
             if txt and pg:
-                pick_from_text(txt, pg, require_kws=False)
+                pick_from_text(txt, pg, ctx_source(c), require_kws=False)
             if len(picked) >= max_sents:
                 break
 
@@ -136,10 +170,16 @@ def _extractive_fallback(query: str, ctxs: List[Dict], max_sents: int = 5, min_s
         return FALLBACK
     return picked[0] if len(picked) == 1 else "\n".join(f"- {s}" for s in picked)
 
-def answer(query: str, ctxs: List[Dict]) -> Dict:
-    if not ctxs:
-        return {"answer": FALLBACK, "contexts": []}
+def _prepare(query: str, ctxs: List[Dict]):
+    """Empacota os trechos no orçamento e escolhe o cliente com num_ctx do tamanho do prompt."""
+    with span("answer.pack", contexts_in=len(ctxs)) as sp:
+        packed, used = _pack(ctxs)
+        msgs = _build_messages(query, packed)
+        prompt_tokens = sum(count_many([m.content for m in msgs]))
+        sp.update(contexts_out=len(packed), context_tokens=used, prompt_tokens=prompt_tokens)
+    return packed, msgs, get_llm_for(prompt_tokens)
 
+def _build_messages(query: str, ctxs: List[Dict]) -> list:
     context_text = _build_context(ctxs)
     user = textwrap.dedent(f"""
     Pergunta:
@@ -148,12 +188,12 @@ def answer(query: str, ctxs: List[Dict]) -> Dict:
     Trechos do IPCC (use APENAS o que está abaixo):
     {context_text}
 
-    Lembre-se: termine CADA frase factual com [p.X] (ou múltiplas como [p.X][p.Y]).
+    Lembre-se: termine CADA frase factual com a citação do trecho, como no cabeçalho ([p.X] ou [RELATÓRIO p.X]; múltiplas como [p.X][p.Y]).
     """)
+    return [SystemMessage(content=SYSTEM_PROMPT), HumanMessage(content=user)]
 
-    msgs = [SystemMessage(content=SYSTEM_PROMPT), HumanMessage(content=user)]
-    out = llm.invoke(msgs)
-    ans = (out.content or "").strip()
+def _finalize(query: str, ctxs: List[Dict], raw: str) -> Dict:
+    ans = (raw or "").strip()
     ans = _normalize_citations(ans)
 
     if not ans or ans.strip() == FALLBACK or not _has_any_citation(ans):
@@ -161,3 +201,66 @@ def answer(query: str, ctxs: List[Dict]) -> Dict:
 
     ans = re.sub(r"[ \t]+", " ", ans).strip()
     return {"answer": ans, "contexts": ctxs}
+
+def _chunk_text(chunk) -> str:
+    c = getattr(chunk, "content", "")
+    return c if isinstance(c, str) else ""
+
+def answer(query: str, ctxs: List[Dict], on_partial: Optional[Callable[[str], None]] = None) -> Dict:
+    """
+    Gera a resposta. Com `on_partial`, usa llm.stream e chama on_partial(texto_parcial)
+    a cada token; a normalização de citações é aplicada só no texto final.
+    """
+    if not ctxs:
+        return {"answer": FALLBACK, "contexts": []}
+
+    ctxs, msgs, llm = _prepare(query, ctxs)
+    if on_partial is None:
+        with span("answer.llm", stream=False) as sp:
+            out = llm.invoke(msgs)
+            sp["output_chars"] = len(out.content or "")
+        return _finalize(query, ctxs, out.content or "")
+
+    parts: List[str] = []
+    with span("answer.llm", stream=True) as sp:
+        for chunk in llm.stream(msgs):
+            piece = _chunk_text(chunk)
+            if not piece:
+                continue
+            if not parts:
+                sp["first_token_ms"] = round((time.time() - sp["start"]) * 1000, 1)
+            parts.append(piece)
+            try:
+                on_partial("".join(parts))
+            except Exception as e:
+                print(f"[answerer] on_partial falhou: {e}")
+        sp["output_chars"] = sum(len(p) for p in parts)
+    return _finalize(query, ctxs, "".join(parts))
+
+async def aanswer(query: str, ctxs: List[Dict], on_partial: Optional[Callable[[str], None]] = None) -> Dict:
+    """Versão assíncrona de answer() (llm.ainvoke / llm.astream)."""
+    if not ctxs:
+        return {"answer": FALLBACK, "contexts": []}
+
+    ctxs, msgs, llm = _prepare(query, ctxs)
+    if on_partial is None:
+        with span("answer.llm", stream=False) as sp:
+            out = await llm.ainvoke(msgs)
+            sp["output_chars"] = len(out.content or "")
+        return _finalize(query, ctxs, out.content or "")
+
+    parts: List[str] = []
+    with span("answer.llm", stream=True) as sp:
+        async for chunk in llm.astream(msgs):
+            piece = _chunk_text(chunk)
+            if not piece:
+                continue
+            if not parts:
+                sp["first_token_ms"] = round((time.time() - sp["start"]) * 1000, 1)
+            parts.append(piece)
+            try:
+                on_partial("".join(parts))
+            except Exception as e:
+                print(f"[answerer] on_partial falhou: {e}")
+        sp["output_chars"] = sum(len(p) for p in parts)
+    return _finalize(query, ctxs, "".join(parts))
@@ -0,0 +1,61 @@
+from typing import List, Dict, Tuple
+import os, re
+
+import numpy as np
+
+from src.utils.settings import get_embedder, emb_key
+from src.utils.emb_cache import cached_encode
+from src.utils.tokens import count_many
+
+COMPRESS_ENABLE = os.getenv("COMPRESS_ENABLE", "0") == "1"
+COMPRESS_TOP_SENTS = int(os.getenv("COMPRESS_TOP_SENTS", "3"))
+COMPRESS_MIN_SENT_CHARS = int(os.getenv("COMPRESS_MIN_SENT_CHARS", "25"))
+
+_SENT_SPLIT = re.compile(r"(?<=[.?!;])\s+")
+
+
+def _sentences(text: str) -> List[str]:
+    # Fragmentos muito curtos (rótulos, números soltos) são colados à frase anterior.
+    out: List[str] = []
+    for s in _SENT_SPLIT.split(text or ""):
+        s = " ".join(s.split())
+        if not s:
+            continue
+        if out and len(s) < COMPRESS_MIN_SENT_CHARS:
+            out[-1] = f"{out[-1]} {s}"
+        else:
+            out.append(s)
+    return out
+
+
+def compress(query: str, ctxs: List[Dict], top_n: int = COMPRESS_TOP_SENTS) -> Tuple[List[Dict], Dict[str, int]]:
+    """
+    Compressão extrativa guiada pela pergunta: as frases de todos os trechos são embedadas
+    numa única passada junto com a pergunta e cada trecho mantém só as `top_n` frases mais
+    similares, na ordem original. A página do trecho é preservada; o texto completo fica em
+    `text_full`. Devolve (trechos comprimidos, {"tokens_in", "tokens_out"}).
+    """
+    texts = [(c.get("text") or "").strip() for c in ctxs]
+    sents = [_sentences(t) for t in texts]
+    flat = [s for ss in sents for s in ss if len(ss) > top_n]
+    tokens_in = sum(count_many(texts))
+    if not flat:
+        return ctxs, {"tokens_in": tokens_in, "tokens_out": tokens_in}
+
+    vecs = cached_encode(get_embedder(), emb_key(), [query] + flat, normalize_embeddings=True)
+    sims = vecs[1:] @ vecs[0]
+
+    out: List[Dict] = []
+    offset = 0
+    for c, text, ss in zip(ctxs, texts, sents):
+        if len(ss) <= top_n:
+            out.append(c)
+            continue
+        local = sims[offset:offset + len(ss)]
+        offset += len(ss)
+        keep = sorted(np.argsort(-local)[:top_n].tolist())
+        meta = {k: v for k, v in (c.get("metadata") or {}).items() if k not in ("n_tokens", "tokenizer")}
+        out.append(dict(c, text=" ".join(ss[i] for i in keep), text_full=text, metadata=meta))
+
+    tokens_out = sum(count_many([c.get("text") or "" for c in out]))
+    return out, {"tokens_in": tokens_in, "tokens_out": tokens_out}
@@ -1,7 +1,16 @@
-from typing import List, Dict, Any
-import os, math
+from typing import List, Dict, Any, Optional
+import os, math, asyncio, hashlib, threading
 
-from src.utils.settings import COLL, EMB
+import numpy as np
+
+from src.utils.settings import (
+    get_collection, get_embedder, get_reranker, emb_key, rerank_key, INDEX_DIR, index_version,
+)
+from src.utils.emb_cache import cached_encode
+from src.utils.lru import LRUCache
+from src.utils.score_cache import ScoreCache
+from src.utils.tracing import span
+from src.utils.bm25 import load_bm25, rrf_fuse
 
 try:
     from src.utils.pdf_loader import normalize_text
@@ -15,29 +24,66 @@ MIN_SIM = float(os.getenv("RETRIEVER_MIN_SIM", "0.05"))
 
 UNIQ_BY_PAGE = os.getenv("RETRIEVER_UNIQUE_PAGES", "1") == "1"
 
-RERANK_ENABLE = os.getenv("RERANK_ENABLE", "1") == "1"
-RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
 RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", str(max(K * 3, 12))))
 RERANK_ALPHA = float(os.getenv("RERANK_ALPHA", "0.7"))
-
-_RERANKER = None 
+# Scores brutos do CrossEncoder por (modelo, pergunta normalizada, id do chunk); SQLite opcional.
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "20000"))
+RERANK_CACHE_PATH = os.getenv("RERANK_CACHE_PATH", "").strip()
+# Cascata: pula/encolhe o pool quando a margem do score vetorial já é decisiva.
+RERANK_CASCADE = os.getenv("RERANK_CASCADE", "0") == "1"
+RERANK_SKIP_MARGIN = float(os.getenv("RERANK_SKIP_MARGIN", "0.08"))
+RERANK_MIN_POOL = int(os.getenv("RERANK_MIN_POOL", "4"))
+RERANK_BATCH = int(os.getenv("RERANK_BATCH", "16"))
+
+# Híbrido BM25 + vetorial: rrf (Reciprocal Rank Fusion) ou weighted (scores normalizados)
+HYBRID_ENABLE = os.getenv("HYBRID_ENABLE", "1") == "1"
+HYBRID_FUSION = os.getenv("HYBRID_FUSION", "rrf").strip().lower()
+HYBRID_WEIGHT = float(os.getenv("HYBRID_WEIGHT", "0.5"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+RETRIEVE_CACHE_SIZE = int(os.getenv("RETRIEVE_CACHE_SIZE", "256"))
+RETRY_K_FACTOR = int(os.getenv("RETRY_K_FACTOR", "2"))
+
+_MEMO = LRUCache(RETRIEVE_CACHE_SIZE)
+_SCORES: Optional[ScoreCache] = None
+_STATS = {"full": 0, "shrink": 0, "skip": 0, "pairs_scored": 0, "pairs_cached": 0}
+_STATS_LOCK = threading.Lock()
+_BM25 = None
+_BM25_VERSION = None
 
 
 def _get_reranker():
-    """Carrega o CrossEncoder sob demanda. Fallback silencioso se não der."""
-    global _RERANKER
-    if _RERANKER is not None:
-        return _RERANKER
-    if not RERANK_ENABLE:
-        return None
-    try:
-        from sentence_transformers import CrossEncoder
-        _RERANKER = CrossEncoder(RERANK_MODEL)
-        return _RERANKER
-    except Exception as e:
-        print(f"[retriever] Rerank desabilitado: {e}")
-        _RERANKER = None
+    """CrossEncoder compartilhado (src.utils.settings.get_reranker)."""
+    return get_reranker()
+
+
+def _get_score_cache() -> Optional[ScoreCache]:
+    global _SCORES
+    if _SCORES is None and RERANK_CACHE_SIZE > 0:
+        try:
+            _SCORES = ScoreCache(RERANK_CACHE_SIZE, RERANK_CACHE_PATH or None)
+        except Exception as e:
+            print(f"[retriever] Cache de rerank só em memória: {e}")
+            _SCORES = ScoreCache(RERANK_CACHE_SIZE)
+    return _SCORES
+
+
+def _score_key(query_text: str, chunk_id: str) -> str:
+    # Ids são endereçados por conteúdo (ingestão), então o mesmo id é o mesmo texto.
+    raw = f"{rerank_key()}\n{' '.join(query_text.split())}\n{chunk_id}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _get_bm25():
+    """Índice BM25 gravado pela ingestão; recarregado quando a build do índice muda."""
+    global _BM25, _BM25_VERSION
+    if not HYBRID_ENABLE:
         return None
+    version = index_version()
+    if _BM25_VERSION != version:
+        _BM25 = load_bm25(INDEX_DIR)
+        _BM25_VERSION = version
+    return _BM25
 
 
 def _cosine_sim_from_distance(d) -> float:
@@ -54,62 +100,180 @@ def _sigmoid(x: float) -> float:
         return 0.0 if x < 0 else 1.0
 
 
+def _pool_score(d: Dict[str, Any]) -> float:
+    # Com busca híbrida o pool do rerank segue a fusão; sem ela, o score vetorial.
+    return d.get("fusion_score", d.get("vector_score", 0.0))
+
+
+def _count(**inc):
+    with _STATS_LOCK:
+        for k, v in inc.items():
+            _STATS[k] += v
+
+
+def rerank_stats(reset: bool = False) -> Dict[str, Any]:
+    """Quantas perguntas seguiram cada caminho do rerank (full/shrink/skip) e quantos pares foram pontuados."""
+    with _STATS_LOCK:
+        out = dict(_STATS)
+        if reset:
+            for k in _STATS:
+                _STATS[k] = 0
+    total = out["full"] + out["shrink"] + out["skip"]
+    out["skip_rate"] = round(out["skip"] / total, 3) if total else 0.0
+    return out
+
+
+def _cascade_pool(pool: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Só os candidatos a até RERANK_SKIP_MARGIN do melhor score vetorial disputam o topo.
+    Se apenas o primeiro está nessa janela o rerank é pulado; senão o pool encolhe
+    para a janela (mínimo RERANK_MIN_POOL).
+    """
+    if len(pool) < 2:
+        return pool
+    best = max(float(d.get("vector_score", 0.0)) for d in pool)
+    window = [d for d in pool if float(d.get("vector_score", 0.0)) >= best - RERANK_SKIP_MARGIN]
+    if len(window) == 1:
+        return []
+    if len(window) >= RERANK_MIN_POOL:
+        return window
+    ids = {d["id"] for d in window}
+    return window + [d for d in pool if d["id"] not in ids][:RERANK_MIN_POOL - len(window)]
+
+
+def _predict_sorted(reranker, pairs: List[tuple]):
+    # Pares ordenados por tamanho: lotes homogêneos desperdiçam menos padding.
+    order = sorted(range(len(pairs)), key=lambda i: len(pairs[i][0]) + len(pairs[i][1]))
+    scores = reranker.predict([pairs[i] for i in order], batch_size=RERANK_BATCH,
+                              convert_to_numpy=True, show_progress_bar=False)
+    out = [0.0] * len(pairs)
+    for pos, i in enumerate(order):
+        out[i] = float(scores[pos])
+    return out
+
+
 def _apply_rerank(query_text: str, cands: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """Reranqueia top-N com CrossEncoder e mistura com score vetorial."""
-    reranker = _get_reranker()
-    if reranker is None or not cands:
-        return cands 
+    return _apply_rerank_many([query_text], [cands])[0]
 
-    pool = sorted(cands, key=lambda x: x.get("vector_score", 0.0), reverse=True)[:RERANK_TOP_K]
-    pairs = [(query_text, d["text"]) for d in pool]
 
-    try:
-        scores = reranker.predict(pairs, convert_to_numpy=True, show_progress_bar=False)
-    except Exception as e:
-        print(f"[retriever] Falha no rerank: {e}")
-        return cands
+def _apply_rerank_many(query_texts: List[str], cands_list: List[List[Dict[str, Any]]]) -> List[List[Dict[str, Any]]]:
+    """Rerank de várias perguntas com UMA chamada ao CrossEncoder (todos os pares juntos)."""
+    reranker = _get_reranker()
+    if reranker is None or not any(cands_list):
+        return cands_list
 
-    out = []
-    for item, ce_raw in zip(pool, scores):
-        ce_norm = _sigmoid(float(ce_raw))             
-        vec = float(item.get("vector_score", 0.0))
-        final = RERANK_ALPHA * ce_norm + (1.0 - RERANK_ALPHA) * vec
-
-        new_item = dict(item)
-        new_item["rerank_score_raw"] = float(ce_raw)
-        new_item["rerank_score"] = ce_norm
-        new_item["score"] = final
-        out.append(new_item)
-
-    out.sort(key=lambda x: x["score"], reverse=True)
-
-    used = {i["id"] for i in out}
-    rest = [d for d in cands if d["id"] not in used]
-    out.extend(rest)
+    pools = [sorted(c, key=_pool_score, reverse=True)[:RERANK_TOP_K] for c in cands_list]
+    for i, pool in enumerate(pools):
+        if not pool:
+            continue
+        path = "full"
+        if RERANK_CASCADE:
+            short = _cascade_pool(pool)
+            path = "skip" if not short else ("shrink" if len(short) < len(pool) else "full")
+            pools[i] = short
+        _count(**{path: 1})
+    pairs = [(q, d["text"]) for q, pool in zip(query_texts, pools) for d in pool]
+    keys = [_score_key(q, d["id"]) for q, pool in zip(query_texts, pools) for d in pool]
+
+    # Só os pares ainda não pontuados vão para o modelo (deduplicados).
+    cache = _get_score_cache()
+    known = cache.get_many(keys) if cache is not None else {}
+    todo: Dict[str, int] = {}
+    for i, key in enumerate(keys):
+        if key not in known and key not in todo:
+            todo[key] = i
+    if todo:
+        try:
+            with span("retrieve.rerank", pairs=len(keys), scored=len(todo)):
+                fresh = _predict_sorted(reranker, [pairs[i] for i in todo.values()])
+        except Exception as e:
+            print(f"[retriever] Falha no rerank: {e}")
+            return cands_list
+        fresh_items = [(key, float(v)) for key, v in zip(todo.keys(), fresh)]
+        known.update(fresh_items)
+        if cache is not None:
+            try:
+                cache.put_many(fresh_items)
+            except Exception as e:
+                print(f"[retriever] Falha ao gravar cache de rerank: {e}")
+    _count(pairs_scored=len(todo), pairs_cached=len(keys) - len(todo))
+    scores = [known[key] for key in keys]
+
+    results = []
+    offset = 0
+    for cands, pool in zip(cands_list, pools):
+        if not pool:
+            results.append(cands)
+            continue
+        out = []
+        for item, ce_raw in zip(pool, scores[offset:offset + len(pool)]):
+            ce_norm = _sigmoid(float(ce_raw))             
+            vec = float(item.get("vector_score", 0.0))
+            final = RERANK_ALPHA * ce_norm + (1.0 - RERANK_ALPHA) * vec
+
+            new_item = dict(item)
+            new_item["rerank_score_raw"] = float(ce_raw)
+            new_item["rerank_score"] = ce_norm
+            new_item["score"] = final
+            out.append(new_item)
+        offset += len(pool)
+
+        out.sort(key=lambda x: x["score"], reverse=True)
+
+        used = {i["id"] for i in out}
+        rest = [d for d in cands if d["id"] not in used]
+        out.extend(rest)
+        results.append(out)
+    return results
+
+
+def _copy_hit(h: Dict[str, Any]) -> Dict[str, Any]:
+    # Quem chama pode alterar o trecho (ou seus metadados) sem tocar no memo.
+    out = dict(h)
+    if isinstance(out.get("metadata"), dict):
+        out["metadata"] = dict(out["metadata"])
     return out
 
 
-def retrieve(query: str) -> List[Dict[str, Any]]:
-    q_norm = normalize_text(query)
-    qv = EMB.encode([q_norm], convert_to_numpy=True).tolist()[0]
+def _memo_key(q_norm: str, k: int):
+    return (" ".join(q_norm.split()), k, index_version())
 
-    n = max(K * 3, K)
-    res = COLL.query(
-        query_embeddings=[qv],
-        n_results=n,
-        include=["documents", "metadatas", "distances"],
-    )
 
-    if not res.get("documents"):
-        return []
+def retrieve(query: str, k: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Top-k trechos para a pergunta, memoizado por (pergunta normalizada, k, versão do índice)."""
+    return retrieve_batch([query], k)[0]
+
+
+def retrieve_batch(queries: List[str], k: Optional[int] = None, qvecs=None) -> List[List[Dict[str, Any]]]:
+    """
+    Retrieval de várias perguntas: um EMB.encode, um COLL.query e um CrossEncoder.predict
+    para todas as que não estão no memo. `qvecs` (embeddings já calculados das perguntas
+    normalizadas, na mesma ordem) dispensa o encode.
+    """
+    k = k or K
+    q_norms = [normalize_text(q) for q in queries]
+    vec_of = dict(zip(q_norms, qvecs)) if qvecs is not None else None
+    results: List[Optional[List[Dict[str, Any]]]] = [_MEMO.get(_memo_key(q, k)) for q in q_norms]
+
+    todo = sorted({q for q, r in zip(q_norms, results) if r is None})
+    if todo:
+        with span("retrieve.search", queries=len(todo), memo_hits=len(q_norms) - len(todo), k=k):
+            given = [vec_of[q] for q in todo] if vec_of is not None else None
+            fresh = dict(zip(todo, _retrieve_many(todo, k, given)))
+        for q, hits in fresh.items():
+            _MEMO.put(_memo_key(q, k), hits)
+        results = [r if r is not None else fresh[q] for q, r in zip(q_norms, results)]
+
+    return [[_copy_hit(h) for h in r] for r in results]
 
-    docs = res["documents"][0]
-    metas = res["metadatas"][0]
-    dists = res.get("distances", [[None] * len(docs)])[0]
 
-    raw_ids = res.get("ids")
-    ids = raw_ids[0] if raw_ids and len(raw_ids) > 0 else [f"idx-{i}" for i in range(len(docs))]
+async def aretrieve(query: str, k: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Versão assíncrona: embedding/busca/rerank são CPU-bound e rodam numa thread."""
+    return await asyncio.to_thread(retrieve, query, k)
 
+
+def _candidates(ids, docs, metas, dists) -> List[Dict[str, Any]]:
     prelim: List[Dict[str, Any]] = []
     for id_, doc, meta, dist in zip(ids, docs, metas, dists):
         vec_sim = _cosine_sim_from_distance(dist)
@@ -120,6 +284,7 @@ def retrieve(query: str) -> List[Dict[str, Any]]:
             "text": doc,
             "metadata": meta,
             "page": (meta or {}).get("page"),
+            "source": (meta or {}).get("source"),
             "vector_score": vec_sim,
             "score": vec_sim,
         })
@@ -132,32 +297,130 @@ def retrieve(query: str) -> List[Dict[str, Any]]:
                 "text": doc,
                 "metadata": meta,
                 "page": (meta or {}).get("page"),
+                "source": (meta or {}).get("source"),
                 "vector_score": vec_sim,
                 "score": vec_sim,
             })
+    return prelim
+
+
+def _page_key(h: Dict[str, Any]):
+    # A mesma página de relatórios diferentes são páginas diferentes.
+    return (h.get("source"), h.get("page"))
 
-    ranked = _apply_rerank(q_norm, prelim)
 
+def _select(ranked: List[Dict[str, Any]], k: int) -> List[Dict[str, Any]]:
     out: List[Dict[str, Any]] = []
     seen_pages = set()
     for h in ranked:
         if UNIQ_BY_PAGE:
-            pg = h.get("page")
+            pg = _page_key(h)
             if pg in seen_pages:
                 continue
             seen_pages.add(pg)
         out.append(h)
-        if len(out) >= K:
+        if len(out) >= k:
             break
 
-    if len(out) < K:
+    if len(out) < k:
         for h in ranked:
             if h in out:
                 continue
-            if UNIQ_BY_PAGE and h.get("page") in seen_pages:
+            if UNIQ_BY_PAGE and _page_key(h) in seen_pages:
                 continue
             out.append(h)
-            if len(out) >= K:
+            if len(out) >= k:
                 break
 
     return out
+
+
+def _hybrid(q_norms: List[str], qvs, prelims: List[List[Dict[str, Any]]], bm25, n: int) -> List[List[Dict[str, Any]]]:
+    """Funde os hits densos com os do BM25; trechos só do BM25 são buscados no Chroma (com embedding)."""
+    lexical = [bm25.search(q, top_n=n) for q in q_norms]
+    known = {d["id"] for p in prelims for d in p}
+    missing = sorted({i for hits in lexical for i, _ in hits} - known)
+    extra: Dict[str, Dict[str, Any]] = {}
+    if missing:
+        got = get_collection().get(ids=missing, include=["documents", "metadatas", "embeddings"])
+        for id_, doc, meta, emb in zip(got["ids"], got["documents"], got["metadatas"], got["embeddings"]):
+            extra[id_] = {"text": doc, "metadata": meta, "emb": np.asarray(emb, dtype=np.float32)}
+
+    out = []
+    for qv, prelim, hits in zip(qvs, prelims, lexical):
+        by_id = {d["id"]: d for d in prelim}
+        qv = np.asarray(qv, dtype=np.float32)
+        qn = float(np.linalg.norm(qv)) or 1.0
+        for id_, _ in hits:
+            if id_ in by_id or id_ not in extra:
+                continue
+            e = extra[id_]
+            en = float(np.linalg.norm(e["emb"])) or 1.0
+            sim = max(0.0, float(qv @ e["emb"]) / (qn * en))
+            by_id[id_] = {
+                "id": id_,
+                "text": e["text"],
+                "metadata": e["metadata"],
+                "page": (e["metadata"] or {}).get("page"),
+                "source": (e["metadata"] or {}).get("source"),
+                "vector_score": sim,
+                "score": sim,
+            }
+
+        bm25_scores = dict(hits)
+        if HYBRID_FUSION == "weighted":
+            top = max(bm25_scores.values(), default=0.0) or 1.0
+            fused = {
+                i: HYBRID_WEIGHT * d["vector_score"] + (1.0 - HYBRID_WEIGHT) * bm25_scores.get(i, 0.0) / top
+                for i, d in by_id.items()
+            }
+        else:
+            dense_rank = [d["id"] for d in sorted(by_id.values(), key=lambda x: x["vector_score"], reverse=True)]
+            fused = rrf_fuse([dense_rank, [i for i, _ in hits if i in by_id]], k=RRF_K)
+
+        merged = []
+        for i, d in by_id.items():
+            item = dict(d)
+            item["bm25_score"] = float(bm25_scores.get(i, 0.0))
+            item["fusion_score"] = float(fused.get(i, 0.0))
+            merged.append(item)
+        merged.sort(key=lambda x: x["fusion_score"], reverse=True)
+        out.append(merged)
+    return out
+
+
+def _retrieve_many(q_norms: List[str], k: int, qvs=None) -> List[List[Dict[str, Any]]]:
+    if qvs is not None:
+        qvs = np.asarray(qvs, dtype=np.float32).tolist()
+    else:
+        with span("retrieve.embed", texts=len(q_norms)):
+            qvs = cached_encode(get_embedder(), emb_key(), q_norms).tolist()
+
+    n = max(k * 3, k)
+    with span("retrieve.query", n_results=n):
+        res = get_collection().query(
+            query_embeddings=qvs,
+            n_results=n,
+            include=["documents", "metadatas", "distances"],
+        )
+
+    if not res.get("documents"):
+        return [[] for _ in q_norms]
+
+    prelims = []
+    for qi in range(len(q_norms)):
+        docs = res["documents"][qi]
+        metas = res["metadatas"][qi]
+        dists = (res.get("distances") or [[None] * len(docs)] * len(q_norms))[qi]
+
+        raw_ids = res.get("ids")
+        ids = raw_ids[qi] if raw_ids and len(raw_ids) > qi else [f"idx-{i}" for i in range(len(docs))]
+        prelims.append(_candidates(ids, docs, metas, dists))
+
+    bm25 = _get_bm25()
+    if bm25 is not None and len(bm25):
+        with span("retrieve.hybrid", candidates=sum(len(p) for p in prelims)):
+            prelims = _hybrid(q_norms, qvs, prelims, bm25, n)
+
+    ranked = _apply_rerank_many(q_norms, prelims)
+    return [_select(r, k) for r in ranked]
@@ -1,7 +1,7 @@
 from typing import Dict
 import re
 
-RE_CIT = re.compile(r"\[p\.?\s*\d+\]", re.I)
+RE_CIT = re.compile(r"\[(?:[^\[\]\s]+\s+)?p\.?\s*\d+\]", re.I)
 FALLBACK = "I have not found sufficient evidence in the IPCC to answer with confidence."
 
 def _strip_fallback(txt: str) -> str:
@@ -2,6 +2,10 @@ from typing import Dict, Any, Literal
 from src.nodes.answerer import FALLBACK
 
 class Supervisor:
+    def __init__(self, speculative: bool = False, compress: bool = False):
+        self.speculative = speculative
+        self.compress = compress
+
     def __call__(self, s: Dict[str, Any]) -> Dict[str, Any]:
         s.setdefault("tries", 0)
         s.setdefault("stage", "start")
@@ -16,11 +20,16 @@ class Supervisor:
         )
         return s
 
-    def decide_next(self, s: Dict[str, Any]) -> Literal["moderate", "retrieve", "answer", "selfcheck", "safety", "end"]:
+    def decide_next(self, s: Dict[str, Any]) -> Literal["cache", "moderate", "moderate_retrieve", "retrieve", "compress", "answer", "selfcheck", "safety", "end"]:
         stage = s.get("stage", "start")
 
         if stage == "start":
-            return "moderate"
+            return "cache"
+
+        if stage == "cache_hit":
+            return "end"
+        if stage == "cache_miss":
+            return "moderate_retrieve" if self.speculative else "moderate"
 
         if stage == "moderated_ok":
             return "retrieve"
@@ -28,6 +37,8 @@ class Supervisor:
             return "end" 
 
         if stage == "retrieved":
+            return "compress" if self.compress else "answer"
+        if stage == "compressed":
             return "answer"
         if stage == "answered":
             return "selfcheck"
@@ -0,0 +1,197 @@
+# src/utils/answer_cache.py
+import os, re, json, time, copy, threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+ANSWER_CACHE_ENABLE = os.getenv("ANSWER_CACHE_ENABLE", "1") == "1"
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "data/cache/answers.json")
+ANSWER_CACHE_MIN_SIM = float(os.getenv("ANSWER_CACHE_MIN_SIM", "0.97"))
+ANSWER_CACHE_MAX = int(os.getenv("ANSWER_CACHE_MAX", "500"))
+
+_NUM_TOKEN = re.compile(r"[\w\.\-–°/]*\d[\w\.\-–°/]*")
+
+
+def normalize_query(q: str) -> str:
+    return re.sub(r"\s+", " ", (q or "").strip().lower())
+
+
+def _numeric_signature(q: str) -> frozenset:
+    """Tokens com dígitos (SSP2-4.5, 1.5°C, 2100...): perguntas com números diferentes nunca são equivalentes."""
+    return frozenset(t.strip(".") for t in _NUM_TOKEN.findall(normalize_query(q)))
+
+
+class SemanticAnswerCache:
+    """
+    Cache de respostas finais indexado pelo embedding da pergunta.
+
+    - acerto exato (pergunta normalizada) ou semântico (cosseno >= min_sim);
+    - despejo LRU limitado a max_entries;
+    - persistido em log JSONL append-only (um snapshot {"namespace", "entries"} seguido de
+      linhas {"put": entrada}), compactado quando o log passa de 2x max_entries linhas;
+    - invalidado quando o namespace (índice + modelos) muda.
+    """
+
+    def __init__(self, path: str = ANSWER_CACHE_PATH, min_sim: float = ANSWER_CACHE_MIN_SIM,
+                 max_entries: int = ANSWER_CACHE_MAX):
+        self.path = path
+        self.min_sim = min_sim
+        self.max_entries = max(1, max_entries)
+        self.namespace: Optional[str] = None
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None
+        self._keys: List[str] = []
+        self._lock = threading.Lock()
+        self._log_ns: Optional[str] = None  # namespace do snapshot no início do arquivo
+        self._log_lines = 0
+        self._load()
+
+    def _load(self):
+        try:
+            f = open(self.path, "r", encoding="utf-8")
+        except OSError:
+            return
+        with f:
+            for ln in f:
+                try:
+                    rec = json.loads(ln)
+                except Exception:
+                    continue  # linha truncada por um crash
+                self._log_lines += 1
+                if "put" in rec:
+                    e = rec["put"]
+                    self._entries[e["key"]] = e
+                    self._entries.move_to_end(e["key"])
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                else:  # snapshot (também o formato antigo, um único JSON)
+                    self.namespace = self._log_ns = rec.get("namespace")
+                    self._entries.clear()
+                    for e in rec.get("entries", []):
+                        self._entries[e["key"]] = e
+        self._matrix = None
+
+    def _compact(self):
+        d = os.path.dirname(self.path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"namespace": self.namespace, "entries": list(self._entries.values())}, f, ensure_ascii=False)
+            f.write("\n")
+        os.replace(tmp, self.path)
+        self._log_ns = self.namespace
+        self._log_lines = 1
+
+    def _append(self, entry: Dict[str, Any]):
+        # Só a entrada nova vai para o disco; o arquivo inteiro é regravado de vez em quando.
+        if self._log_ns != self.namespace or self._log_lines >= 2 * self.max_entries:
+            self._compact()
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"put": entry}, ensure_ascii=False) + "\n")
+        self._log_lines += 1
+
+    def _check_namespace(self, namespace: str):
+        if self.namespace != namespace:
+            if self._entries:
+                print(f"[answer_cache] Namespace mudou ({self.namespace} -> {namespace}); cache limpo.")
+            self._entries.clear()
+            self._matrix = None
+            self.namespace = namespace
+
+    def _index(self):
+        if self._matrix is None:
+            self._keys = list(self._entries.keys())
+            if self._keys:
+                self._matrix = np.asarray([self._entries[k]["vec"] for k in self._keys], dtype=np.float32)
+            else:
+                self._matrix = np.zeros((0, 0), dtype=np.float32)
+        return self._keys, self._matrix
+
+    def _touch(self, key: str) -> Dict[str, Any]:
+        e = self._entries[key]
+        e["last_used"] = time.time()
+        e["hits"] = int(e.get("hits", 0)) + 1
+        self._entries.move_to_end(key)
+        return copy.deepcopy({"answer": e["answer"], "contexts": e["contexts"], "cached_query": e["query"]})
+
+    def lookup_exact(self, query: str, namespace: str) -> Optional[Dict[str, Any]]:
+        key = normalize_query(query)
+        with self._lock:
+            self._check_namespace(namespace)
+            if key in self._entries:
+                return self._touch(key)
+        return None
+
+    def lookup(self, query: str, qvec, namespace: str) -> Optional[Dict[str, Any]]:
+        hit = self.lookup_exact(query, namespace)
+        if hit is not None:
+            return hit
+        return self.lookup_semantic(query, qvec, namespace)
+
+    def lookup_semantic(self, query: str, qvec, namespace: str) -> Optional[Dict[str, Any]]:
+        """Só a busca por cosseno (para quem já fez lookup_exact)."""
+        v = _unit(qvec)
+        sig = _numeric_signature(query)
+        with self._lock:
+            self._check_namespace(namespace)
+            keys, mat = self._index()
+            if not keys or mat.shape[1] != v.shape[0]:
+                return None
+            sims = mat @ v
+            for i in np.argsort(-sims)[:5]:
+                if float(sims[i]) < self.min_sim:
+                    break
+                e = self._entries[keys[i]]
+                if _numeric_signature(e["query"]) != sig:
+                    continue
+                return self._touch(keys[i])
+        return None
+
+    def store(self, query: str, qvec, answer: Dict[str, Any], contexts: List[Dict[str, Any]], namespace: str):
+        key = normalize_query(query)
+        with self._lock:
+            self._check_namespace(namespace)
+            entry = self._entries[key] = {
+                "key": key,
+                "query": query,
+                "vec": _unit(qvec).tolist(),
+                "answer": copy.deepcopy(answer),
+                "contexts": copy.deepcopy(contexts),
+                "last_used": time.time(),
+                "hits": 0,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+            try:
+                self._append(entry)
+            except Exception as e:
+                print(f"[answer_cache] Falha ao persistir: {e}")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _unit(v) -> np.ndarray:
+    a = np.asarray(v, dtype=np.float32).reshape(-1)
+    n = float(np.linalg.norm(a))
+    return a / n if n > 0 else a
+
+
+_CACHE: Optional[SemanticAnswerCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_answer_cache() -> Optional[SemanticAnswerCache]:
+    global _CACHE
+    if not ANSWER_CACHE_ENABLE:
+        return None
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = SemanticAnswerCache()
+    return _CACHE
@@ -0,0 +1,127 @@
+# src/utils/bm25.py
+import re, gzip, json, math, os
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+BM25_FILE = "bm25.json.gz"
+
+_DASHES = str.maketrans({
+    "\u2010": "-",
+    "\u2011": "-",
+    "\u2012": "-",
+    "\u2013": "-",
+    "\u2014": "-",
+    "\u2212": "-",
+})
+# Mantém rótulos compostos inteiros (ssp2-4.5, 1.1°c, 2011-2020) além das partes.
+_TOKEN = re.compile(r"\w+(?:[\-\./°]\w+)*°?")
+_PARTS = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    out: List[str] = []
+    for tok in _TOKEN.findall((text or "").lower().translate(_DASHES)):
+        if len(tok) < 2 and not tok.isdigit():
+            continue
+        out.append(tok)
+        parts = _PARTS.findall(tok)
+        if len(parts) > 1:
+            out.extend(p for p in parts if len(p) > 1 or p.isdigit())
+    return out
+
+
+class BM25Index:
+    """Índice invertido BM25 (Okapi) compacto, persistido em JSON gzip."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_ids: List[str] = []
+        self.doc_len: List[int] = []
+        self.postings: Dict[str, List[List[int]]] = {}
+        self._idf: Dict[str, float] = {}
+        self._avgdl = 0.0
+
+    def add(self, doc_id: str, text: str) -> None:
+        idx = len(self.doc_ids)
+        toks = tokenize(text)
+        self.doc_ids.append(doc_id)
+        self.doc_len.append(len(toks))
+        for term, tf in Counter(toks).items():
+            self.postings.setdefault(term, []).append([idx, tf])
+        self._idf = {}
+
+    def add_many(self, items: Iterable[Tuple[str, str]]) -> "BM25Index":
+        for doc_id, text in items:
+            self.add(doc_id, text)
+        return self
+
+    def _prepare(self):
+        if self._idf or not self.doc_ids:
+            return
+        n = len(self.doc_ids)
+        self._avgdl = sum(self.doc_len) / n
+        self._idf = {
+            t: math.log(1.0 + (n - len(p) + 0.5) / (len(p) + 0.5))
+            for t, p in self.postings.items()
+        }
+
+    def search(self, query: str, top_n: int = 10) -> List[Tuple[str, float]]:
+        self._prepare()
+        if not self.doc_ids:
+            return []
+        scores: Dict[int, float] = {}
+        k1, b, avgdl = self.k1, self.b, self._avgdl or 1.0
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for idx, tf in self.postings[term]:
+                norm = k1 * (1.0 - b + b * self.doc_len[idx] / avgdl)
+                scores[idx] = scores.get(idx, 0.0) + idf * tf * (k1 + 1.0) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_n]
+        return [(self.doc_ids[i], s) for i, s in ranked]
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def save(self, path: str) -> None:
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        data = {"k1": self.k1, "b": self.b, "doc_ids": self.doc_ids,
+                "doc_len": self.doc_len, "postings": self.postings}
+        tmp = path + ".tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        idx = cls(k1=data.get("k1", 1.5), b=data.get("b", 0.75))
+        idx.doc_ids = data["doc_ids"]
+        idx.doc_len = data["doc_len"]
+        idx.postings = data["postings"]
+        return idx
+
+
+def rrf_fuse(rankings: List[List[str]], k: int = 60) -> Dict[str, float]:
+    """Reciprocal Rank Fusion: soma de 1/(k + posição) em cada ranking."""
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return fused
+
+
+def load_bm25(index_dir: str) -> Optional[BM25Index]:
+    path = os.path.join(index_dir, BM25_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        return BM25Index.load(path)
+    except Exception as e:
+        print(f"[bm25] Falha ao carregar {path}: {e}")
+        return None
@@ -0,0 +1,37 @@
+# src/utils/cache_env.py
+import os
+from typing import Dict, Iterable
+
+# Caches que encurtam perguntas repetidas: medições do pipeline inteiro (carga, avaliação)
+# desligam todos. Os módulos leem o ambiente no import, então disable_caches() vem antes de src.graph.
+CACHE_ENV = {
+    "answer": ("ANSWER_CACHE_ENABLE", "0"),
+    "moderation": ("MODERATION_CACHE_SIZE", "0"),
+    "retrieve_memo": ("RETRIEVE_CACHE_SIZE", "0"),
+    "rerank_scores": ("RERANK_CACHE_SIZE", "0"),
+    "embeddings": ("EMB_CACHE_ENABLE", "0"),
+    "llm": ("LLM_CACHE_ENABLE", "0"),
+}
+
+
+def disable_caches(keep: Iterable[str] = ()) -> None:
+    """Desliga (via ambiente) todos os caches de CACHE_ENV, exceto os de `keep`."""
+    keep = set(keep)
+    for name, (var, off) in CACHE_ENV.items():
+        if name not in keep:
+            os.environ[var] = off
+
+
+def active_caches() -> Dict[str, bool]:
+    """Caches efetivamente ligados no processo (lidos dos módulos após o import)."""
+    from src.nodes import moderator, retriever
+    from src.utils import emb_cache, llm_cache
+    from src.utils.answer_cache import get_answer_cache
+    return {
+        "answer": get_answer_cache() is not None,
+        "moderation": moderator._CACHE.maxsize > 0,
+        "retrieve_memo": retriever._MEMO.maxsize > 0,
+        "rerank_scores": retriever.RERANK_CACHE_SIZE > 0,
+        "embeddings": bool(emb_cache.EMB_CACHE_ENABLE),
+        "llm": bool(llm_cache.LLM_CACHE_ENABLE),
+    }
@@ -0,0 +1,27 @@
+# src/utils/citations.py
+import os, re
+from typing import Dict, Optional
+
+# [p.X] (índices antigos, sem fonte) ou [<relatório> p.X] quando o trecho diz de qual PDF veio.
+CITE_RE = re.compile(r"\[(?:([^\[\]\s]+)\s+)?p\.(\d+)\]")
+
+
+def source_label(source: Optional[str]) -> str:
+    """Rótulo curto e sem espaços do PDF de origem (nome do arquivo sem extensão)."""
+    if not source:
+        return ""
+    stem = re.sub(r"\.pdf$", "", os.path.basename(str(source)), flags=re.I)
+    return re.sub(r"[^\w.\-]+", "_", stem).strip("_")
+
+
+def ctx_source(c: Dict) -> Optional[str]:
+    return c.get("source") or (c.get("metadata") or {}).get("source")
+
+
+def ctx_page(c: Dict):
+    return c.get("page") or (c.get("metadata") or {}).get("page")
+
+
+def cite_tag(page, source: Optional[str] = None) -> str:
+    label = source_label(source)
+    return f"[{label} p.{page}]" if label else f"[p.{page}]"
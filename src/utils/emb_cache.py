@@ -0,0 +1,146 @@
+# src/utils/emb_cache.py
+import os, re, json, hashlib, threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+EMB_CACHE_ENABLE = os.getenv("EMB_CACHE_ENABLE", "1") == "1"
+EMB_CACHE_DIR = os.getenv("EMB_CACHE_DIR", "data/cache/embeddings")
+
+_KEY_BYTES = 20  # sha1
+
+
+def text_key(text: str) -> bytes:
+    """Hash do texto normalizado (espaços colapsados)."""
+    return hashlib.sha1(" ".join((text or "").split()).encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """
+    Cache persistente de embeddings de UM modelo.
+
+    Um arquivo de registros fixos [sha1 (20 B) | float32 x dim], só com append e lido via
+    np.memmap; o índice hash -> linha é reconstruído ao abrir. Cada lote é gravado numa
+    única escrita O_APPEND, então processos diferentes podem compartilhar o diretório.
+    Vetores são guardados sem normalização.
+    """
+
+    def __init__(self, root: str, model_name: str):
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "__", model_name)
+        self.dir = os.path.join(root, slug)
+        self.path = os.path.join(self.dir, "vectors.bin")
+        self.model_name = model_name
+        self.dim: Optional[int] = None
+        self._rows: Dict[bytes, int] = {}
+        self._mm: Optional[np.memmap] = None
+        self._n = 0
+        self._lock = threading.Lock()
+        try:
+            with open(os.path.join(self.dir, "meta.json"), "r", encoding="utf-8") as f:
+                self.dim = int(json.load(f)["dim"])
+        except Exception:
+            self.dim = None
+
+    def _dtype(self):
+        return np.dtype([("key", f"S{_KEY_BYTES}"), ("vec", "<f4", (self.dim,))])
+
+    def _refresh(self):
+        if self.dim is None or not os.path.exists(self.path):
+            return
+        n = os.path.getsize(self.path) // self._dtype().itemsize
+        if n == self._n:
+            return
+        self._mm = np.memmap(self.path, dtype=self._dtype(), mode="r", shape=(n,))
+        keys = self._mm["key"]
+        for i in range(self._n, n):
+            self._rows.setdefault(bytes(keys[i]).ljust(_KEY_BYTES, b"\0"), i)
+        self._n = n
+
+    def _init_dim(self, dim: int):
+        os.makedirs(self.dir, exist_ok=True)
+        self.dim = dim
+        with open(os.path.join(self.dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"model": self.model_name, "dim": dim}, f)
+
+    def get_many(self, keys: Sequence[bytes]) -> Dict[int, np.ndarray]:
+        """{posição em keys: vetor} para as chaves já presentes."""
+        with self._lock:
+            self._refresh()
+            found = {}
+            for i, k in enumerate(keys):
+                row = self._rows.get(k)
+                if row is not None:
+                    found[i] = np.array(self._mm["vec"][row], dtype=np.float32)
+            return found
+
+    def put_many(self, keys: Sequence[bytes], vecs: np.ndarray):
+        vecs = np.asarray(vecs, dtype=np.float32)
+        if not len(keys):
+            return
+        with self._lock:
+            if self.dim is None:
+                self._init_dim(int(vecs.shape[1]))
+            if vecs.shape[1] != self.dim:
+                print(f"[emb_cache] Dimensão {vecs.shape[1]} != {self.dim}; cache ignorado.")
+                return
+            rec = np.zeros(len(keys), dtype=self._dtype())
+            rec["key"] = list(keys)
+            rec["vec"] = vecs
+            fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                os.write(fd, rec.tobytes())
+            finally:
+                os.close(fd)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._rows)
+
+
+_CACHES: Dict[str, EmbeddingCache] = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_emb_cache(model_name: str) -> Optional[EmbeddingCache]:
+    if not EMB_CACHE_ENABLE:
+        return None
+    with _CACHES_LOCK:
+        if model_name not in _CACHES:
+            _CACHES[model_name] = EmbeddingCache(EMB_CACHE_DIR, model_name)
+        return _CACHES[model_name]
+
+
+def cached_encode(model, model_name: str, texts: List[str], normalize_embeddings: bool = False,
+                  batch_size: int = 32) -> np.ndarray:
+    """
+    model.encode(texts) reaproveitando vetores já calculados para (modelo, texto).
+    Só os textos inéditos vão para o modelo.
+    """
+    cache = get_emb_cache(model_name)
+    if cache is None:
+        return np.asarray(model.encode(texts, convert_to_numpy=True, batch_size=batch_size,
+                                       normalize_embeddings=normalize_embeddings), dtype=np.float32)
+
+    keys = [text_key(t) for t in texts]
+    found = cache.get_many(keys)
+    missing = [i for i in range(len(texts)) if i not in found]
+    if missing:
+        # Deduplica textos repetidos no mesmo lote.
+        uniq: Dict[bytes, int] = {}
+        for i in missing:
+            uniq.setdefault(keys[i], i)
+        fresh = np.asarray(model.encode([texts[i] for i in uniq.values()], convert_to_numpy=True,
+                                        batch_size=batch_size), dtype=np.float32)
+        cache.put_many(list(uniq.keys()), fresh)
+        by_key = dict(zip(uniq.keys(), fresh))
+        for i in missing:
+            found[i] = by_key[keys[i]]
+
+    if not texts:
+        return np.zeros((0, cache.dim or 0), dtype=np.float32)
+    out = np.stack([found[i] for i in range(len(texts))]).astype(np.float32)
+    if normalize_embeddings:
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        out = out / np.where(norms > 0, norms, 1.0)
+    return out
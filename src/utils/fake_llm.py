@@ -0,0 +1,96 @@
+# src/utils/fake_llm.py
+import re, time, asyncio
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+_BLOCK = re.compile(r"(\[(?:[^\[\]\s]+ )?p\.\d+\])\n(.+?)(?=\n\n---\n\n|\n\s*\n\s*Lembre-se|\Z)", re.S)
+_SENT = re.compile(r"(?<=[.?!])\s+")
+_TOKEN = re.compile(r"\S+\s*")
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model offline e determinístico (LLM_PROVIDER=fake) para testes de carga e demos.
+
+    A resposta é a primeira frase dos `sentences` primeiros trechos do prompt, cada uma
+    com a citação do cabeçalho do trecho ([p.X] ou [RELATÓRIO p.X]); sem trechos (ex.:
+    moderação) responde "safe". A latência simula prefill (tokens do prompt / prefill_tokens_per_s), tempo até o primeiro token
+    (latency_ms) e geração (tokens_per_s). num_predict limita os tokens gerados.
+    """
+
+    model: str = "stub"
+    latency_ms: float = 200.0
+    tokens_per_s: float = 30.0
+    prefill_tokens_per_s: float = 0.0
+    sentences: int = 2
+    num_ctx: int = 2048
+    num_predict: int = 256
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model": self.model, "sentences": self.sentences, "num_predict": self.num_predict}
+
+    def _reply(self, messages: List[BaseMessage]) -> List[str]:
+        prompt = str(messages[-1].content) if messages else ""
+        parts = []
+        for tag, text in _BLOCK.findall(prompt)[: max(1, self.sentences)]:
+            first = _SENT.split(" ".join(text.split()), maxsplit=1)[0][:240].rstrip(" .")
+            if first:
+                parts.append(f"{first} {tag}.")
+        text = " ".join(parts) if parts else "safe"
+        return _TOKEN.findall(text)[: max(1, self.num_predict)]
+
+    def _delays(self, messages: List[BaseMessage]):
+        prompt_tokens = sum(len(str(m.content)) for m in messages) / 4
+        first = self.latency_ms / 1000.0
+        if self.prefill_tokens_per_s > 0:
+            first += prompt_tokens / self.prefill_tokens_per_s
+        per_token = 1.0 / self.tokens_per_s if self.tokens_per_s > 0 else 0.0
+        return first, per_token
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        tokens = self._reply(messages)
+        first, per_token = self._delays(messages)
+        time.sleep(first + per_token * len(tokens))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        tokens = self._reply(messages)
+        first, per_token = self._delays(messages)
+        await asyncio.sleep(first + per_token * len(tokens))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        tokens = self._reply(messages)
+        first, per_token = self._delays(messages)
+        time.sleep(first)
+        for tok in tokens:
+            time.sleep(per_token)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=tok))
+            if run_manager:
+                run_manager.on_llm_new_token(tok, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        tokens = self._reply(messages)
+        first, per_token = self._delays(messages)
+        await asyncio.sleep(first)
+        for tok in tokens:
+            await asyncio.sleep(per_token)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=tok))
+            if run_manager:
+                await run_manager.on_llm_new_token(tok, chunk=chunk)
+            yield chunk
@@ -0,0 +1,122 @@
+# src/utils/llm.py
+import os, threading
+os.environ.setdefault("GRPC_VERBOSITY", "ERROR")
+os.environ.setdefault("GRPC_TRACE", "")
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+
+from dotenv import load_dotenv
+load_dotenv()
+
+ANSWER_MAX_TOKENS = int(os.getenv("ANSWER_MAX_TOKENS", "256"))
+LLM_MIN_CTX = int(os.getenv("LLM_MIN_CTX", "1024"))
+
+_LLM = None
+_SIZED = {}
+_LOCK = threading.Lock()
+
+
+def provider() -> str:
+    """LLM_PROVIDER (gemini | ollama | fake); vazio = Gemini se houver GOOGLE_API_KEY, senão Ollama."""
+    p = os.getenv("LLM_PROVIDER", "").strip().lower()
+    if p in ("gemini", "ollama", "fake"):
+        return p
+    return "gemini" if os.getenv("GOOGLE_API_KEY") else "ollama"
+
+
+def llm_name() -> str:
+    """Provedor:modelo em uso (mesma regra de make_llm)."""
+    p = provider()
+    if p == "fake":
+        return f"fake:{os.getenv('FAKE_LLM_MODEL', 'stub')}"
+    if p == "gemini":
+        return f"gemini:{os.getenv('GEMINI_MODEL', 'gemini-2.5-pro')}"
+    return f"ollama:{os.getenv('OLLAMA_MODEL', 'qwen2.5:7b-instruct')}"
+
+
+def _cache_kwargs() -> dict:
+    # Cache de respostas em disco (opt-in: LLM_CACHE_ENABLE=1).
+    if os.getenv("LLM_CACHE_ENABLE", "0") != "1":
+        return {}
+    from src.utils.llm_cache import get_llm_cache
+    cache = get_llm_cache()
+    return {"cache": cache} if cache is not None else {}
+
+
+def make_llm():
+    # Só o SDK do provedor configurado é importado.
+    p = provider()
+    if p == "fake":
+        from src.utils.fake_llm import FakeChatModel
+        return FakeChatModel(
+            model=os.getenv("FAKE_LLM_MODEL", "stub"),
+            latency_ms=float(os.getenv("FAKE_LLM_LATENCY_MS", "200")),
+            tokens_per_s=float(os.getenv("FAKE_LLM_TOKENS_PER_S", "30")),
+            prefill_tokens_per_s=float(os.getenv("FAKE_LLM_PREFILL_TOKENS_PER_S", "0")),
+            num_predict=ANSWER_MAX_TOKENS,
+            **_cache_kwargs(),
+        )
+    if p == "gemini":
+        try:
+            from absl import logging as absl_logging
+            absl_logging.set_verbosity(absl_logging.ERROR)
+        except Exception:
+            pass
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        gem_model = os.getenv("GEMINI_MODEL", "gemini-2.5-pro")
+        return ChatGoogleGenerativeAI(
+            model=gem_model,
+            temperature=0.0,
+            **_cache_kwargs(),
+        )
+    from langchain_ollama import ChatOllama
+
+    ollama_model = os.getenv("OLLAMA_MODEL", "qwen2.5:7b-instruct")
+    return ChatOllama(
+        model=ollama_model,
+        temperature=0.0,
+        num_ctx=2048,
+        num_predict=ANSWER_MAX_TOKENS,
+        keep_alive="30m",
+        base_url=os.getenv("OLLAMA_BASE_URL", "http://127.0.0.1:11434"),
+        **_cache_kwargs(),
+    )
+
+
+def get_llm():
+    """Cliente de chat compartilhado pelo processo (answerer e moderator)."""
+    global _LLM
+    if _LLM is None:
+        with _LOCK:
+            if _LLM is None:
+                _LLM = make_llm()
+                print("LLM ativo:", type(_LLM).__name__)
+    return _LLM
+
+
+def _ctx_bucket(n: int) -> int:
+    # Potências de 2: o Ollama recarrega o modelo quando num_ctx muda, então poucos tamanhos distintos.
+    size = LLM_MIN_CTX
+    while size < n:
+        size *= 2
+    return size
+
+
+def get_llm_for(prompt_tokens: int):
+    """
+    Cliente com janela ajustada ao prompt empacotado: num_ctx = prompt + ANSWER_MAX_TOKENS
+    (arredondado), num_predict = ANSWER_MAX_TOKENS. Provedores sem num_ctx usam o cliente padrão.
+    """
+    llm = get_llm()
+    if not hasattr(llm, "num_ctx"):
+        return llm
+    num_ctx = _ctx_bucket(prompt_tokens + ANSWER_MAX_TOKENS)
+    if num_ctx not in _SIZED:
+        with _LOCK:
+            if num_ctx not in _SIZED:
+                try:
+                    _SIZED[num_ctx] = llm.model_copy(update={"num_ctx": num_ctx, "num_predict": ANSWER_MAX_TOKENS})
+                except Exception as e:
+                    print(f"[llm] Não foi possível ajustar num_ctx: {e}")
+                    _SIZED[num_ctx] = llm
+    return _SIZED[num_ctx]
@@ -0,0 +1,114 @@
+# src/utils/llm_cache.py
+import os, time, hashlib, sqlite3, threading
+from typing import Any, Optional
+
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.load import dumps, loads
+
+LLM_CACHE_ENABLE = os.getenv("LLM_CACHE_ENABLE", "0") == "1"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "data/cache/llm.sqlite")
+LLM_CACHE_TTL_S = int(os.getenv("LLM_CACHE_TTL_S", str(7 * 24 * 3600)))  # 0 = sem expiração
+LLM_CACHE_MAX = int(os.getenv("LLM_CACHE_MAX", "5000"))
+
+
+class SQLiteLLMCache(BaseCache):
+    """
+    Cache de respostas do chat model (interface BaseCache do LangChain) em SQLite.
+
+    Chave = sha256(llm_string + mensagens serializadas); o llm_string do LangChain já traz
+    provedor, modelo e parâmetros (temperature, num_ctx, ...). Entradas expiram após
+    `ttl_s` e, acima de `max_entries`, as menos usadas recentemente são removidas.
+    Só invoke/ainvoke passam pelo cache; stream sempre chama o modelo.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl_s: int = LLM_CACHE_TTL_S, max_entries: int = LLM_CACHE_MAX):
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, created REAL NOT NULL, accessed REAL NOT NULL, value TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed)")
+        self._db.commit()
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\n{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT created, value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl_s > 0 and now - row[0] > self.ttl_s:
+                self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._db.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self.hits += 1
+        try:
+            return loads(row[1])
+        except Exception as e:
+            print(f"[llm_cache] Entrada ilegível, ignorando: {e}")
+            return None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        value = dumps(return_val)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, created, accessed, value) VALUES (?, ?, ?, ?)",
+                (key, now, now, value),
+            )
+            self._evict(now)
+            self._db.commit()
+
+    def _evict(self, now: float) -> None:
+        if self.ttl_s > 0:
+            self._db.execute("DELETE FROM llm_cache WHERE created < ?", (now - self.ttl_s,))
+        if self.max_entries > 0:
+            self._db.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                "SELECT key FROM llm_cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM llm_cache")
+            self._db.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+
+_CACHE: Optional[SQLiteLLMCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_llm_cache() -> Optional[SQLiteLLMCache]:
+    """Cache compartilhado do processo; None se LLM_CACHE_ENABLE=0 ou se o SQLite falhar."""
+    global _CACHE
+    if not LLM_CACHE_ENABLE:
+        return None
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            try:
+                _CACHE = SQLiteLLMCache()
+            except Exception as e:
+                print(f"[llm_cache] Cache desabilitado: {e}")
+                return None
+    return _CACHE
@@ -1,7 +1,15 @@
 # src/utils/pdf_loader.py
-import re
+import os, re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
 import fitz
 
+# 0 = automático (nº de CPUs), 1 = sequencial
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "0"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+
 _HYPHENS = str.maketrans({
     "\u00ad": "",
     "\u2010": "-",
@@ -25,14 +33,37 @@ def normalize_text(raw: str) -> str:
     txt = re.sub(r"\s*\n\s*", " ", txt)
     return txt.strip()
 
-def load_pdf_with_metadata(path: str):
+def _extract_range(path: str, start: int, end: int) -> List[Dict]:
+    # Roda no worker: cada processo abre o próprio documento fitz.
+    with fitz.open(path) as doc:
+        return [{"text": normalize_text(doc[i].get_text("text")), "page": i + 1} for i in range(start, end)]
+
+def iter_pdf_pages(path: str, workers: Optional[int] = None, pages_per_task: int = PDF_PAGES_PER_TASK) -> Iterator[Dict]:
+    """
+    Gera {'text', 'page'} em ordem de página. Com workers > 1 os intervalos de páginas
+    são extraídos num pool de processos (no máximo 2*workers intervalos em voo).
+    """
+    workers = PDF_WORKERS if workers is None else workers
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    with fitz.open(path) as doc:
+        n = len(doc)
+
+    pages_per_task = max(1, pages_per_task)
+    if workers <= 1 or n <= pages_per_task:
+        yield from _extract_range(path, 0, n)
+        return
+
+    ranges = deque((s, min(s + pages_per_task, n)) for s in range(0, n, pages_per_task))
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        inflight = deque()
+        while ranges or inflight:
+            while ranges and len(inflight) < 2 * workers:
+                inflight.append(ex.submit(_extract_range, path, *ranges.popleft()))
+            yield from inflight.popleft().result()
+
+def load_pdf_with_metadata(path: str, workers: Optional[int] = None):
     """
     Retorna: [{ 'text': <texto normalizado da página>, 'page': <1-based> }, ...]
     """
-    doc = fitz.open(path)
-    out = []
-    for i in range(len(doc)):
-        page = doc[i]
-        text = normalize_text(page.get_text("text"))
-        out.append({"text": text, "page": i + 1})
-    return out
+    return list(iter_pdf_pages(path, workers=workers))
@@ -0,0 +1,52 @@
+# src/utils/score_cache.py
+import os, sqlite3, threading
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+from src.utils.lru import LRUCache
+
+
+class ScoreCache:
+    """
+    Cache de scores (float) por chave string: LRU em memória e, opcionalmente,
+    uma tabela SQLite para sobreviver a reinícios.
+    """
+
+    def __init__(self, maxsize: int = 20000, path: Optional[str] = None):
+        self._mem = LRUCache(maxsize)
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        if path:
+            d = os.path.dirname(path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, score REAL NOT NULL)")
+            self._db.commit()
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, float]:
+        found: Dict[str, float] = {}
+        missing = []
+        for k in keys:
+            v = self._mem.get(k)
+            if v is None:
+                missing.append(k)
+            else:
+                found[k] = v
+        if missing and self._db is not None:
+            with self._lock:
+                for i in range(0, len(missing), 500):
+                    part = missing[i:i + 500]
+                    q = f"SELECT key, score FROM scores WHERE key IN ({','.join('?' * len(part))})"
+                    for k, v in self._db.execute(q, part):
+                        found[k] = float(v)
+                        self._mem.put(k, float(v))
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, float]]) -> None:
+        items = [(k, float(v)) for k, v in items]
+        for k, v in items:
+            self._mem.put(k, v)
+        if items and self._db is not None:
+            with self._lock:
+                self._db.executemany("INSERT OR REPLACE INTO scores (key, score) VALUES (?, ?)", items)
+                self._db.commit()
@@ -1,14 +1,172 @@
 # src/utils/settings.py
-import os
+import os, re, json, threading
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
-from chromadb import PersistentClient
 
 load_dotenv()
 
 EMB_NAME = os.getenv("EMBEDDINGS_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
 INDEX_DIR = os.getenv("INDEX_DIR", "data/index")
+INDEX_META = "index_meta.json"
+# chroma (padrão) ou mmap: busca exata em vectors.npy mapeado em memória (src/utils/vector_store.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").strip().lower()
 
-EMB = SentenceTransformer(EMB_NAME)
-DB = PersistentClient(path=INDEX_DIR)
-COLL = DB.get_or_create_collection(name="ipcc")
+RERANK_ENABLE = os.getenv("RERANK_ENABLE", "1") == "1"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_MAX_TOKENS = int(os.getenv("RERANK_MAX_TOKENS", "0"))  # 0 = limite do modelo
+
+# Backend de inferência: torch (padrão) ou onnx (int8 dinâmico, exportado por scripts/onnx_export.py)
+EMB_BACKEND = os.getenv("EMB_BACKEND", "torch").strip().lower()
+RERANK_BACKEND = os.getenv("RERANK_BACKEND", "torch").strip().lower()
+ONNX_DIR = os.getenv("ONNX_DIR", "data/models/onnx")
+ONNX_QUANT = os.getenv("ONNX_QUANT", "avx2")  # arm64 | avx2 | avx512 | avx512_vnni
+
+# Singletons do processo, criados no primeiro uso (importar este módulo é barato).
+_LOCK = threading.RLock()
+_EMB = None
+_DB = None
+_COLL = None
+_RERANKER = None
+_RERANKER_FAILED = False
+_EMB_KEY = None
+_RERANK_KEY = None
+
+
+def onnx_model_dir(model_name: str) -> str:
+    """Diretório local do modelo exportado para ONNX."""
+    return os.path.join(ONNX_DIR, re.sub(r"[^A-Za-z0-9_.-]+", "__", model_name))
+
+
+def onnx_file_name(quant: str = ONNX_QUANT) -> str:
+    return f"onnx/model_qint8_{quant}.onnx"
+
+
+def _onnx_ready(model_name: str, backend: str) -> bool:
+    return backend == "onnx" and os.path.exists(os.path.join(onnx_model_dir(model_name), onnx_file_name()))
+
+
+def _load(cls, model_name: str, backend: str, **kwargs):
+    """
+    Instancia SentenceTransformer/CrossEncoder no backend pedido; cai para torch se o ONNX faltar.
+    Devolve (modelo, chave para caches): vetores/scores int8 diferem levemente dos fp32.
+    """
+    if backend == "onnx":
+        if _onnx_ready(model_name, backend):
+            try:
+                return cls(onnx_model_dir(model_name), backend="onnx", model_kwargs={"file_name": onnx_file_name()},
+                           **kwargs), f"{model_name}@onnx-{ONNX_QUANT}"
+            except Exception as e:
+                print(f"[settings] ONNX indisponível para {model_name}: {e}")
+        else:
+            print(f"[settings] {model_name} não exportado em {ONNX_DIR}; usando torch "
+                  f"(rode scripts/onnx_export.py).")
+    return cls(model_name, **kwargs), model_name
+
+
+def emb_key() -> str:
+    """Nome do embedder para caches: modelo + backend que de fato carregou."""
+    if _EMB_KEY is None and EMB_BACKEND == "onnx":
+        get_embedder()  # o ONNX pode falhar e cair para torch: a chave só é conhecida após o load
+    return _EMB_KEY or EMB_NAME
+
+
+def rerank_key() -> str:
+    """Nome do reranker para caches: modelo + backend carregado + truncamento (muda os scores)."""
+    if _RERANK_KEY is None and RERANK_BACKEND == "onnx":
+        get_reranker()
+    key = _RERANK_KEY or RERANK_MODEL
+    return f"{key}|max_len={RERANK_MAX_TOKENS}" if RERANK_MAX_TOKENS > 0 else key
+
+
+def get_embedder():
+    global _EMB, _EMB_KEY
+    if _EMB is None:
+        with _LOCK:
+            if _EMB is None:
+                from sentence_transformers import SentenceTransformer
+                _EMB, _EMB_KEY = _load(SentenceTransformer, EMB_NAME, EMB_BACKEND)
+    return _EMB
+
+
+def get_client():
+    global _DB
+    if _DB is None:
+        with _LOCK:
+            if _DB is None:
+                from chromadb import PersistentClient
+                _DB = PersistentClient(path=INDEX_DIR)
+    return _DB
+
+
+def get_collection():
+    global _COLL
+    if _COLL is None:
+        with _LOCK:
+            if _COLL is None:
+                _check_index_embedder()
+                if VECTOR_BACKEND == "mmap":
+                    try:
+                        from src.utils.vector_store import MmapCollection, StaleIndexError
+                        _COLL = MmapCollection(INDEX_DIR, version_fn=lambda: index_version(INDEX_DIR))
+                        return _COLL
+                    except FileNotFoundError:
+                        print(f"[settings] {INDEX_DIR} sem índice mmap (rode a ingestão com VECTOR_BACKEND=mmap); usando Chroma.")
+                    except StaleIndexError as e:
+                        print(f"[settings] {e}; usando Chroma.")
+                _COLL = get_client().get_or_create_collection(name="ipcc")
+    return _COLL
+
+
+def _check_index_embedder(index_dir: str = INDEX_DIR) -> bool:
+    """Avisa se o índice foi embedado com outro modelo/backend que o usado nas perguntas."""
+    try:
+        with open(os.path.join(index_dir, INDEX_META), "r", encoding="utf-8") as f:
+            built = json.load(f).get("emb_key")
+    except Exception:
+        return True
+    if built and built != emb_key():
+        print(f"[settings] Índice embedado com {built}, perguntas com {emb_key()} "
+              f"(EMB_BACKEND={EMB_BACKEND}); re-rode a ingestão.")
+        return False
+    return True
+
+
+def get_reranker():
+    """CrossEncoder sob demanda; None se desabilitado ou se o carregamento falhar."""
+    global _RERANKER, _RERANKER_FAILED, _RERANK_KEY
+    if _RERANKER is not None or _RERANKER_FAILED or not RERANK_ENABLE:
+        return _RERANKER
+    with _LOCK:
+        if _RERANKER is None and not _RERANKER_FAILED:
+            try:
+                from sentence_transformers import CrossEncoder
+                # max_length trunca cada par (pergunta + trecho) no tokenizer.
+                kwargs = {"max_length": RERANK_MAX_TOKENS} if RERANK_MAX_TOKENS > 0 else {}
+                _RERANKER, _RERANK_KEY = _load(CrossEncoder, RERANK_MODEL, RERANK_BACKEND, **kwargs)
+            except Exception as e:
+                print(f"[retriever] Rerank desabilitado: {e}")
+                _RERANKER_FAILED = True
+    return _RERANKER
+
+
+def __getattr__(name: str):
+    # Compatibilidade: `settings.EMB` / `settings.DB` / `settings.COLL` continuam funcionando (lazy).
+    if name == "EMB":
+        return get_embedder()
+    if name == "DB":
+        return get_client()
+    if name == "COLL":
+        return get_collection()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def index_version(index_dir: str = INDEX_DIR) -> str:
+    """Identificador da build atual do índice (gravado pela ingestão)."""
+    try:
+        with open(os.path.join(index_dir, INDEX_META), "r", encoding="utf-8") as f:
+            return str(json.load(f).get("build_id") or "unknown")
+    except Exception:
+        pass
+    try:
+        return f"mtime-{int(os.path.getmtime(os.path.join(index_dir, 'chroma.sqlite3')))}"
+    except Exception:
+        return "unknown"
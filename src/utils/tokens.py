@@ -0,0 +1,46 @@
+# src/utils/tokens.py
+import os, math, threading
+from typing import List
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# Tokenizer do LLM alvo (id do Hugging Face, ex.: Qwen/Qwen2.5-7B-Instruct). Vazio = heurística chars/4.
+LLM_TOKENIZER = os.getenv("LLM_TOKENIZER", "").strip()
+
+_TOK = None
+_TOK_FAILED = False
+_LOCK = threading.Lock()
+
+
+def _get_tokenizer():
+    global _TOK, _TOK_FAILED
+    if _TOK is not None or _TOK_FAILED or not LLM_TOKENIZER:
+        return _TOK
+    with _LOCK:
+        if _TOK is None and not _TOK_FAILED:
+            try:
+                from transformers import AutoTokenizer
+                _TOK = AutoTokenizer.from_pretrained(LLM_TOKENIZER)
+            except Exception as e:
+                print(f"[tokens] Tokenizer {LLM_TOKENIZER} indisponível, usando chars/4: {e}")
+                _TOK_FAILED = True
+    return _TOK
+
+
+def tokenizer_name() -> str:
+    """Identifica a regra de contagem (gravada junto de n_tokens na ingestão)."""
+    return LLM_TOKENIZER if _get_tokenizer() is not None else "chars/4"
+
+
+def count_many(texts: List[str]) -> List[int]:
+    if not texts:
+        return []
+    tok = _get_tokenizer()
+    if tok is None:
+        return [math.ceil(len(t or "") / 4) for t in texts]
+    return [len(ids) for ids in tok(list(texts), add_special_tokens=False)["input_ids"]]
+
+
+def count_tokens(text: str) -> int:
+    return count_many([text])[0]
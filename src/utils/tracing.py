@@ -0,0 +1,123 @@
+# src/utils/tracing.py
+import os, time, threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+TRACE_ENABLE = os.getenv("TRACE_ENABLE", "1") == "1"
+TRACE_RESERVOIR = int(os.getenv("TRACE_RESERVOIR", "2048"))  # durações guardadas por span (quantis)
+
+# Spans da requisição atual (lista do state) e span pai, propagados por contextvars
+# (asyncio.to_thread e copy_context().run levam o contexto junto).
+_SPANS: ContextVar[Optional[List[Dict[str, Any]]]] = ContextVar("ipcc_spans", default=None)
+_PARENT: ContextVar[Optional[str]] = ContextVar("ipcc_span_parent", default=None)
+
+
+class SpanSink:
+    """Agregado do processo: contagem, soma e últimas durações de cada span."""
+
+    def __init__(self, reservoir: int = TRACE_RESERVOIR):
+        self.reservoir = reservoir
+        self._lock = threading.Lock()
+        self._count: Dict[str, int] = {}
+        self._sum: Dict[str, float] = {}
+        self._last: Dict[str, deque] = {}
+
+    def add(self, name: str, duration_ms: float) -> None:
+        with self._lock:
+            self._count[name] = self._count.get(name, 0) + 1
+            self._sum[name] = self._sum.get(name, 0.0) + duration_ms
+            self._last.setdefault(name, deque(maxlen=self.reservoir)).append(duration_ms)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._count.clear()
+            self._sum.clear()
+            self._last.clear()
+
+    def to_json(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            names = sorted(self._count)
+            return {
+                n: {
+                    "count": self._count[n],
+                    "mean_ms": round(self._sum[n] / self._count[n], 2),
+                    "p50_ms": round(percentile(self._last[n], 50), 2),
+                    "p95_ms": round(percentile(self._last[n], 95), 2),
+                    "max_ms": round(max(self._last[n]), 2),
+                }
+                for n in names
+            }
+
+    def to_prometheus(self, metric: str = "ipcc_span_duration_seconds") -> str:
+        """Formato texto do Prometheus (summary com quantis 0.5/0.95)."""
+        lines = [
+            f"# HELP {metric} Duração dos estágios do grafo RAG.",
+            f"# TYPE {metric} summary",
+        ]
+        with self._lock:
+            for n in sorted(self._count):
+                last = self._last[n]
+                for q in (0.5, 0.95):
+                    lines.append(f'{metric}{{span="{n}",quantile="{q}"}} {percentile(last, q * 100) / 1000:.6f}')
+                lines.append(f'{metric}_sum{{span="{n}"}} {self._sum[n] / 1000:.6f}')
+                lines.append(f'{metric}_count{{span="{n}"}} {self._count[n]}')
+        return "\n".join(lines) + "\n"
+
+
+SINK = SpanSink()
+
+
+def percentile(values, p: float) -> float:
+    vals = sorted(values)
+    if not vals:
+        return 0.0
+    idx = (len(vals) - 1) * p / 100.0
+    lo = int(idx)
+    hi = min(lo + 1, len(vals) - 1)
+    return vals[lo] + (vals[hi] - vals[lo]) * (idx - lo)
+
+
+@contextmanager
+def collect(spans: List[Dict[str, Any]]):
+    """Direciona os spans deste contexto para `spans` (ex.: state["spans"])."""
+    tok = _SPANS.set(spans)
+    try:
+        yield spans
+    finally:
+        _SPANS.reset(tok)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Mede um bloco: {"name", "parent", "start", "duration_ms", **attrs}. O dict é entregue
+    ao bloco para anotar tamanhos (sp["n_ctx"] = ...). Vai para a lista do contexto e para o SINK.
+    """
+    if not TRACE_ENABLE:
+        yield {"name": name, "start": time.time(), **attrs}
+        return
+    rec: Dict[str, Any] = {"name": name, "parent": _PARENT.get(), "start": time.time(), **attrs}
+    tok = _PARENT.set(name)
+    t0 = time.perf_counter()
+    try:
+        yield rec
+    except BaseException as e:
+        rec["error"] = type(e).__name__
+        raise
+    finally:
+        _PARENT.reset(tok)
+        rec["duration_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+        SINK.add(name, rec["duration_ms"])
+        spans = _SPANS.get()
+        if spans is not None:
+            spans.append(rec)
+
+
+def stage_totals(spans: List[Dict[str, Any]]) -> Dict[str, float]:
+    """Soma de duração (ms) por nome de span numa requisição (retries somam)."""
+    out: Dict[str, float] = {}
+    for s in spans or []:
+        out[s["name"]] = round(out.get(s["name"], 0.0) + float(s.get("duration_ms") or 0.0), 3)
+    return out
@@ -0,0 +1,214 @@
+# src/utils/vector_store.py
+import os, json, threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+MMAP_VECTORS = "vectors.npy"
+MMAP_PAYLOAD = "vectors.payload.bin"   # [texto, metadados] de cada linha em JSON, concatenados
+MMAP_OFFSETS = "vectors.offsets.npy"   # início de cada linha no payload (n + 1 posições)
+MMAP_SIDECAR = "vectors.json"          # dtype, dim, build_id e ids; gravado por último
+MMAP_FILES = (MMAP_VECTORS, MMAP_PAYLOAD, MMAP_OFFSETS, MMAP_SIDECAR)
+_BLOCK_ROWS = 8192  # linhas por bloco no produto matriz-vetor (limita a cópia fp16 -> fp32)
+
+
+class StaleIndexError(RuntimeError):
+    """O índice mmap não corresponde à build atual do índice (index_meta.json)."""
+
+
+def _normalize(m: np.ndarray) -> np.ndarray:
+    m = np.asarray(m, dtype=np.float32)
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    return m / np.where(norms > 0, norms, 1.0)
+
+
+def write_mmap_index(index_dir: str, ids: Sequence[str], documents: Sequence[str], metadatas: Sequence[Dict],
+                     embeddings, dtype: str = "float32", build_id: Optional[str] = None, **info) -> int:
+    """
+    Grava vetores normalizados em vectors.npy (float32 ou float16), textos/metadados em
+    vectors.payload.bin (+ offsets) e ids/build_id em vectors.json. Todos os arquivos são
+    mapeados em memória na leitura, então processos filhos compartilham as páginas.
+    Cada arquivo é trocado atomicamente (tmp + os.replace), com o sidecar por último.
+    """
+    vecs = _normalize(embeddings).astype(np.dtype(dtype))
+    if len(ids) != len(vecs):
+        raise ValueError(f"{len(ids)} ids para {len(vecs)} vetores")
+    os.makedirs(index_dir, exist_ok=True)
+    path = lambda name: os.path.join(index_dir, name)
+
+    offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+    with open(path(MMAP_PAYLOAD) + ".tmp", "wb") as f:
+        for i, (doc, meta) in enumerate(zip(documents, metadatas)):
+            blob = json.dumps([doc, meta or {}], ensure_ascii=False).encode("utf-8")
+            f.write(blob)
+            offsets[i + 1] = offsets[i] + len(blob)
+    with open(path(MMAP_VECTORS) + ".tmp", "wb") as f:
+        np.save(f, vecs)
+    with open(path(MMAP_OFFSETS) + ".tmp", "wb") as f:
+        np.save(f, offsets)
+    side = {
+        "dtype": str(vecs.dtype), "dim": int(vecs.shape[1]) if vecs.ndim == 2 else 0,
+        "build_id": build_id, **info, "ids": list(ids),
+    }
+    with open(path(MMAP_SIDECAR) + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(side, f, ensure_ascii=False)
+    for name in MMAP_FILES:
+        os.replace(path(name) + ".tmp", path(name))
+    return len(ids)
+
+
+def mmap_build_id(index_dir: str) -> Optional[str]:
+    """build_id gravado no sidecar do índice mmap (None se não há índice ou ele é do formato antigo)."""
+    try:
+        with open(os.path.join(index_dir, MMAP_SIDECAR), "r", encoding="utf-8") as f:
+            return json.load(f).get("build_id")
+    except Exception:
+        return None
+
+
+def export_collection(coll, index_dir: str, dtype: str = "float32", batch: int = 1000, **info) -> int:
+    """Copia uma coleção Chroma (ids, textos, metadados, embeddings) para o formato mmap."""
+    ids: List[str] = []
+    docs: List[str] = []
+    metas: List[Dict] = []
+    vecs: List[np.ndarray] = []
+    offset = 0
+    while True:
+        got = coll.get(include=["documents", "metadatas", "embeddings"], limit=batch, offset=offset)
+        if not got["ids"]:
+            break
+        ids += got["ids"]
+        docs += got["documents"]
+        metas += got["metadatas"]
+        vecs.append(np.asarray(got["embeddings"], dtype=np.float32))
+        offset += len(got["ids"])
+    mat = np.concatenate(vecs) if vecs else np.zeros((0, 0), dtype=np.float32)
+    return write_mmap_index(index_dir, ids, docs, metas, mat, dtype=dtype, **info)
+
+
+class MmapCollection:
+    """
+    Busca exata sobre vectors.npy mapeado em memória, com a mesma interface de
+    query()/get() da coleção Chroma usada pelo retriever. Vetores são normalizados
+    na gravação, então similaridade = produto interno e distância = 1 - sim (cosine).
+    Textos e metadados também ficam no mmap e só são decodificados para as linhas devolvidas.
+
+    Com `version_fn` (ex.: settings.index_version), o build_id do sidecar precisa bater
+    com a build atual ao abrir; senão StaleIndexError (settings cai para o Chroma). Depois
+    de aberto, o arquivo é remapeado quando a ingestão grava uma versão nova; enquanto a
+    build não bate (exportação em andamento ou esquecida), a última build consistente
+    continua servindo e um aviso é impresso uma vez por par de builds.
+    """
+
+    def __init__(self, index_dir: str, version_fn: Optional[Callable[[], str]] = None):
+        self.index_dir = index_dir
+        self.version_fn = version_fn
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._warned = None
+        self._load()
+        current = self._current_version()
+        if current is not None and self.build_id != current:
+            raise StaleIndexError(
+                f"{self.index_dir}: índice mmap da build {self.build_id}, índice atual {current}; "
+                f"rode a ingestão com --export-mmap"
+            )
+
+    def _load(self):
+        spath = os.path.join(self.index_dir, MMAP_SIDECAR)
+        stamp = os.path.getmtime(spath)
+        if stamp == self._stamp:
+            return
+        with open(spath, "r", encoding="utf-8") as f:
+            side = json.load(f)
+        vecs = np.load(os.path.join(self.index_dir, MMAP_VECTORS), mmap_mode="r")
+        offsets = np.load(os.path.join(self.index_dir, MMAP_OFFSETS), mmap_mode="r")
+        ids: List[str] = side["ids"]
+        if len(vecs) != len(ids) or len(offsets) != len(ids) + 1:
+            raise FileNotFoundError(f"{self.index_dir}: índice mmap incompleto (gravação em andamento?)")
+        ppath = os.path.join(self.index_dir, MMAP_PAYLOAD)
+        self._payload = np.memmap(ppath, dtype=np.uint8, mode="r") if offsets[-1] > 0 else np.zeros(0, np.uint8)
+        self._vecs = vecs
+        self._offsets = offsets
+        self._ids = ids
+        self._row = {i: n for n, i in enumerate(ids)}
+        self.build_id = side.get("build_id")
+        self._stamp = stamp
+
+    def _current_version(self) -> Optional[str]:
+        return self.version_fn() if self.version_fn is not None else None
+
+    def _refresh(self):
+        with self._lock:
+            try:
+                self._load()
+            except FileNotFoundError:
+                pass
+            current = self._current_version()
+            if current is not None and self.build_id != current and self._warned != (self.build_id, current):
+                self._warned = (self.build_id, current)
+                print(f"[vector_store] Índice mmap da build {self.build_id}, índice atual {current}; "
+                      f"servindo a última build consistente até a exportação (--export-mmap).")
+
+    def _payload_rows(self, rows: Sequence[int]):
+        docs, metas = [], []
+        for r in rows:
+            doc, meta = json.loads(bytes(self._payload[self._offsets[r]:self._offsets[r + 1]]).decode("utf-8"))
+            docs.append(doc)
+            metas.append(meta)
+        return docs, metas
+
+    def count(self) -> int:
+        self._refresh()
+        return len(self._ids)
+
+    def _scores(self, q: np.ndarray) -> np.ndarray:
+        # sims = M @ q em blocos de linhas: o fp16 é convertido só bloco a bloco.
+        n = len(self._ids)
+        out = np.empty((n, q.shape[1]), dtype=np.float32)
+        for s in range(0, n, _BLOCK_ROWS):
+            out[s:s + _BLOCK_ROWS] = np.asarray(self._vecs[s:s + _BLOCK_ROWS], dtype=np.float32) @ q
+        return out
+
+    def query(self, query_embeddings, n_results: int = 10, include: Iterable[str] = ("documents", "metadatas", "distances"),
+              **kwargs) -> Dict[str, Any]:
+        self._refresh()
+        include = set(include)
+        q = _normalize(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+        res: Dict[str, Any] = {"ids": [], "documents": [], "metadatas": [], "distances": [], "embeddings": None}
+        if not self._ids:
+            for key in ("ids", "documents", "metadatas", "distances"):
+                res[key] = [[] for _ in range(len(q))]
+            return res
+
+        sims = self._scores(q.T)
+        k = max(1, min(int(n_results), len(self._ids)))
+        want_payload = bool(include & {"documents", "metadatas"})
+        for j in range(sims.shape[1]):
+            col = sims[:, j]
+            top = np.argpartition(-col, k - 1)[:k] if k < len(col) else np.arange(len(col))
+            top = top[np.argsort(-col[top], kind="stable")]
+            docs, metas = self._payload_rows(top) if want_payload else ([], [])
+            res["ids"].append([self._ids[i] for i in top])
+            res["documents"].append(docs if "documents" in include else None)
+            res["metadatas"].append(metas if "metadatas" in include else None)
+            res["distances"].append((1.0 - col[top]).tolist() if "distances" in include else None)
+        return res
+
+    def get(self, ids: Optional[Sequence[str]] = None, include: Iterable[str] = ("documents", "metadatas"),
+            limit: Optional[int] = None, offset: int = 0, **kwargs) -> Dict[str, Any]:
+        self._refresh()
+        include = set(include)
+        if ids is not None:
+            rows = [self._row[i] for i in ids if i in self._row]
+        else:
+            end = len(self._ids) if limit is None else offset + limit
+            rows = list(range(offset, min(end, len(self._ids))))
+        docs, metas = self._payload_rows(rows) if include & {"documents", "metadatas"} else ([], [])
+        return {
+            "ids": [self._ids[r] for r in rows],
+            "documents": docs if "documents" in include else None,
+            "metadatas": metas if "metadatas" in include else None,
+            "embeddings": (np.asarray(self._vecs[rows], dtype=np.float32) if rows else np.zeros((0, 0), np.float32))
+            if "embeddings" in include else None,
+        }
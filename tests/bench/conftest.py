@@ -0,0 +1,146 @@
+"""
+Micro-benchmarks (RUN_BENCH=1 pytest tests/bench -s).
+
+Cada benchmark mede ops/s (mediana de rodadas; o setup por operação fica fora do tempo),
+blocos de memória retidos após uma operação e o pico (tracemalloc). O CPython não expõe
+contagem de alocações por operação; blocos retidos + pico são o que o tracemalloc mede.
+
+O gate compara razões, não ops/s absolutos: cada resultado é dividido pelos ops/s de uma
+carga de calibração fixa (Python puro) medida na mesma sessão, e a razão é comparada com
+a de tests/bench/baseline.json. Falha se ficar mais de BENCH_THRESHOLD abaixo.
+BENCH_UPDATE=1 regrava a baseline (e a calibração) com os números desta máquina.
+"""
+import gc, json, os, statistics, time, tracemalloc
+from pathlib import Path
+
+import pytest
+
+BENCH_DIR = Path(__file__).resolve().parent
+BASELINE = BENCH_DIR / "baseline.json"
+RESULTS = Path(os.getenv("BENCH_RESULTS", "bench_results.json"))
+BENCH_THRESHOLD = float(os.getenv("BENCH_THRESHOLD", "0.25"))
+BENCH_MIN_TIME = float(os.getenv("BENCH_MIN_TIME", "0.3"))
+BENCH_ROUNDS = int(os.getenv("BENCH_ROUNDS", "5"))
+
+CALIBRATION = "_calibration"
+
+_RESULTS = {}
+_CALIB = {}
+
+
+def pytest_collection_modifyitems(config, items):
+    if os.getenv("RUN_BENCH") == "1":
+        return
+    skip = pytest.mark.skip(reason="benchmarks só com RUN_BENCH=1")
+    for item in items:
+        if BENCH_DIR in Path(str(item.fspath)).resolve().parents:
+            item.add_marker(skip)
+
+
+def _load_baseline():
+    try:
+        return json.loads(BASELINE.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+
+
+def _timed(fn, setup, n: int) -> float:
+    """Segundos gastos em n chamadas de fn; com setup, só fn entra na conta."""
+    if not setup:
+        t0 = time.perf_counter()
+        for _ in range(n):
+            fn()
+        return time.perf_counter() - t0
+    total = 0.0
+    for _ in range(n):
+        setup()
+        t0 = time.perf_counter()
+        fn()
+        total += time.perf_counter() - t0
+    return total
+
+
+def _rate(fn, setup=None) -> float:
+    # Calibra quantas chamadas cabem em BENCH_MIN_TIME / BENCH_ROUNDS.
+    if setup:
+        setup()
+    fn()
+    n, per_round = 1, BENCH_MIN_TIME / BENCH_ROUNDS
+    while _timed(fn, setup, n) < per_round and n < 1_000_000:
+        n *= 2
+
+    rates = []
+    gc.collect()
+    for _ in range(BENCH_ROUNDS):
+        rates.append(n / max(_timed(fn, setup, n), 1e-9))
+    return statistics.median(rates)
+
+
+def _calibration_work():
+    d = {str(i): i * 2 for i in range(2000)}
+    sorted(d.values(), reverse=True)
+    " ".join(d.keys()).split()
+
+
+def _calibration() -> float:
+    """ops/s da carga de calibração nesta máquina (medido uma vez por sessão)."""
+    if CALIBRATION not in _CALIB:
+        _CALIB[CALIBRATION] = {"ops_per_sec": round(_rate(_calibration_work), 2)}
+        print(f"\n[bench] calibração: {_CALIB[CALIBRATION]['ops_per_sec']:.1f} ops/s")
+    return _CALIB[CALIBRATION]["ops_per_sec"]
+
+
+def _measure(fn, setup=None):
+    rate = _rate(fn, setup)
+    if setup:
+        setup()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    fn()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # Saldo de blocos ainda vivos após uma chamada (caches, vazamentos) — não é contagem de alocações.
+    stats = after.compare_to(before, "filename")
+    retained = sum(max(s.count_diff, 0) for s in stats)
+    return {
+        "ops_per_sec": round(rate, 2),
+        "retained_blocks": int(retained),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+@pytest.fixture
+def bench(request):
+    """bench(fn, setup=None, name=None) -> resultado; falha em regressão contra a baseline."""
+
+    def run(fn, setup=None, name=None):
+        name = name or request.node.name
+        calib = _calibration()
+        res = _measure(fn, setup)
+        res["relative"] = round(res["ops_per_sec"] / calib, 6)
+        _RESULTS[name] = res
+        print(f"\n[bench] {name}: {res['ops_per_sec']:.1f} ops/s ({res['relative']:.4g}x calibração) | "
+              f"{res['retained_blocks']} blocos retidos | pico {res['peak_kib']} KiB")
+        baseline = _load_baseline()
+        base, base_calib = baseline.get(name), baseline.get(CALIBRATION)
+        if base and base_calib and os.getenv("BENCH_UPDATE") != "1":
+            base_rel = base["ops_per_sec"] / base_calib["ops_per_sec"]
+            floor = base_rel * (1.0 - BENCH_THRESHOLD)
+            assert res["relative"] >= floor, (
+                f"{name}: {res['relative']:.4g}x calibração < {floor:.4g}x "
+                f"(baseline {base_rel:.4g}x, tolerância {BENCH_THRESHOLD:.0%})"
+            )
+        return res
+
+    return run
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if not _RESULTS:
+        return
+    RESULTS.write_text(json.dumps({**_CALIB, **_RESULTS}, indent=2, sort_keys=True), encoding="utf-8")
+    if os.getenv("BENCH_UPDATE") == "1":
+        merged = {**_load_baseline(), **_CALIB, **_RESULTS}
+        BASELINE.write_text(json.dumps(merged, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"\n[bench] baseline atualizada: {BASELINE}")
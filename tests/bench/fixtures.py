@@ -0,0 +1,68 @@
+"""Corpus sintético, embedder/reranker determinísticos e LLM stub para os benchmarks."""
+import hashlib, os, random, re
+from types import SimpleNamespace
+
+_TERMS = (
+    "global surface temperature increased 1.1°C 2011-2020 1850-1900 human activities greenhouse gas "
+    "emissions CO2 CH4 N2O aerosols SSP1-1.9 SSP2-4.5 SSP5-8.5 mitigation adaptation risk sea level "
+    "ocean acidification heatwaves droughts high confidence medium confidence very likely net zero "
+    "carbon budget losses and damages finance equity vulnerability ecosystems food security"
+).split()
+
+
+def make_corpus(n_chunks: int = 400, words: int = 180, seed: int = 7):
+    rnd = random.Random(seed)
+    out = []
+    for i in range(n_chunks):
+        sents = []
+        for _ in range(words // 15):
+            sents.append(" ".join(rnd.choice(_TERMS) for _ in range(15)).capitalize() + ".")
+        out.append({"id": f"ipcc-{i:05d}", "text": " ".join(sents), "page": 1 + i // 4})
+    return out
+
+
+class HashingEmbedder:
+    """Bag-of-words com hashing: encode() compatível com SentenceTransformer, sem download."""
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def encode(self, texts, convert_to_numpy=True, batch_size=32, normalize_embeddings=False, **kw):
+        import numpy as np
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, t in enumerate(texts):
+            for tok in re.findall(r"\w+", t.lower()):
+                out[i, int(hashlib.md5(tok.encode()).hexdigest()[:8], 16) % self.dim] += 1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.where(norms > 0, norms, 1.0)
+
+
+def make_embedder():
+    """BENCH_EMB_MODEL (ex.: sentence-transformers/all-MiniLM-L6-v2, já em cache) ou o hashing."""
+    name = os.getenv("BENCH_EMB_MODEL", "").strip()
+    if name:
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(name)
+    return HashingEmbedder()
+
+
+class OverlapReranker:
+    """predict() de CrossEncoder: sobreposição de termos, custo proporcional ao tamanho do par."""
+
+    def predict(self, pairs, batch_size=32, convert_to_numpy=True, show_progress_bar=False, **kw):
+        import numpy as np
+        out = []
+        for q, d in pairs:
+            qs = set(re.findall(r"\w+", q.lower()))
+            ds = re.findall(r"\w+", d.lower())
+            out.append(sum(1 for w in ds if w in qs) / (1 + len(ds)) * 10 - 2)
+        return np.asarray(out, dtype=np.float32)
+
+
+class StubLLM:
+    """Chat model determinístico: cita as duas primeiras páginas do contexto."""
+
+    def invoke(self, msgs):
+        pages = re.findall(r"\[p\.(\d+)\]", msgs[-1].content)[:2] or ["1"]
+        text = " ".join(f"Global surface temperature increased by 1.1°C [p.{p}]." for p in pages)
+        return SimpleNamespace(content=text)
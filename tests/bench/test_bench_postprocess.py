@@ -0,0 +1,47 @@
+import pytest
+
+from tests.bench.fixtures import make_corpus, StubLLM
+
+QUERY = "By how much did global surface temperature increase in 2011-2020 vs 1850-1900?"
+RAW = ("Global surface temperature was 1.1°C higher in 2011–2020 than 1850–1900 ( p. 4 ) , "
+       "with larger increases over land [ p 5]. Human activities, principally through emis-\n"
+       "sions of greenhouse gases, have unequivocally caused global warming (p.8).") * 4
+
+
+@pytest.fixture(scope="module")
+def ctxs():
+    return [dict(c, score=1.0 - i / 100) for i, c in enumerate(make_corpus(n_chunks=8))]
+
+
+def test_bench_normalize_text(bench):
+    pdf_loader = pytest.importorskip("src.utils.pdf_loader")
+    bench(lambda: pdf_loader.normalize_text(RAW))
+
+
+def test_bench_build_context(bench, ctxs):
+    answerer = pytest.importorskip("src.nodes.answerer")
+    bench(lambda: answerer._build_context(ctxs))
+
+
+def test_bench_normalize_citations(bench):
+    answerer = pytest.importorskip("src.nodes.answerer")
+    bench(lambda: answerer._normalize_citations(RAW))
+
+
+def test_bench_extractive_fallback(bench, ctxs):
+    answerer = pytest.importorskip("src.nodes.answerer")
+    bench(lambda: answerer._extractive_fallback(QUERY, ctxs))
+
+
+def test_bench_self_check(bench, ctxs):
+    from src.nodes.selfcheck import self_check
+    ans = {"answer": "Warming reached 1.1°C [p.4]. Human activities caused it [p.8].", "contexts": ctxs}
+    bench(lambda: self_check(ans))
+
+
+def test_bench_answer_with_stub_llm(bench, ctxs, monkeypatch):
+    answerer = pytest.importorskip("src.nodes.answerer")
+    monkeypatch.setattr(answerer, "get_llm_for", lambda n: StubLLM())
+    out = answerer.answer(QUERY, ctxs)
+    assert "[p." in out["answer"]
+    bench(lambda: answerer.answer(QUERY, ctxs))
@@ -0,0 +1,61 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+chromadb = pytest.importorskip("chromadb")
+pytest.importorskip("dotenv")
+
+from src.nodes import retriever as r
+from src.utils import emb_cache
+from src.utils.bm25 import BM25Index
+from tests.bench.fixtures import make_corpus, make_embedder, OverlapReranker
+
+QUERIES = [
+    "By how much did global surface temperature increase in 2011-2020?",
+    "Which gases dominate the warming contribution?",
+    "What is the remaining carbon budget for 1.5°C?",
+    "How do SSP5-8.5 and SSP1-1.9 differ in sea level rise?",
+]
+
+
+@pytest.fixture(scope="module")
+def index(tmp_path_factory):
+    """Índice Chroma de fixture (400 trechos) + BM25, com o embedder de benchmark."""
+    corpus = make_corpus()
+    emb = make_embedder()
+    client = chromadb.PersistentClient(path=str(tmp_path_factory.mktemp("bench_index")))
+    coll = client.get_or_create_collection(name="ipcc", metadata={"hnsw:space": "cosine"})
+    texts = [c["text"] for c in corpus]
+    coll.add(
+        ids=[c["id"] for c in corpus],
+        documents=texts,
+        metadatas=[{"page": c["page"]} for c in corpus],
+        embeddings=np.asarray(emb.encode(texts), dtype=np.float32).tolist(),
+    )
+    bm25 = BM25Index().add_many((c["id"], c["text"]) for c in corpus)
+    return coll, emb, bm25, corpus
+
+
+@pytest.fixture
+def wired(index, monkeypatch):
+    coll, emb, bm25, corpus = index
+    monkeypatch.setattr(r, "get_collection", lambda: coll)
+    monkeypatch.setattr(r, "get_embedder", lambda: emb)
+    monkeypatch.setattr(r, "_get_reranker", lambda: OverlapReranker())
+    monkeypatch.setattr(r, "_get_bm25", lambda: bm25)
+    # Sem caches: mede o caminho completo a cada operação.
+    monkeypatch.setattr(emb_cache, "EMB_CACHE_ENABLE", False)
+    monkeypatch.setattr(r, "RERANK_CACHE_SIZE", 0)
+    monkeypatch.setattr(r, "_SCORES", None)
+    return corpus
+
+
+def test_bench_retrieve(bench, wired):
+    i = iter(range(10 ** 9))
+    hits = r.retrieve(QUERIES[0])
+    assert hits and all("score" in h for h in hits)
+    bench(lambda: r.retrieve(QUERIES[next(i) % len(QUERIES)]), setup=r._MEMO.clear)
+
+
+def test_bench_apply_rerank(bench, wired):
+    cands = [dict(c, vector_score=0.5 - j / 1000) for j, c in enumerate(wired[:r.RERANK_TOP_K])]
+    bench(lambda: r._apply_rerank(QUERIES[0], cands))
@@ -0,0 +1,99 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from src.utils.answer_cache import SemanticAnswerCache
+
+
+def test_semantic_hit_and_namespace_invalidation(tmp_path):
+    path = tmp_path / "answers.json"
+    cache = SemanticAnswerCache(path=str(path), min_sim=0.95, max_entries=10)
+    v = np.array([1.0, 0.0, 0.0])
+    cache.store("What is SSP2-4.5?", v, {"answer": "x [p.1]"}, [], "ns1")
+
+    hit = cache.lookup("what is  ssp2-4.5?", v, "ns1")
+    assert hit and hit["answer"]["answer"] == "x [p.1]"
+
+    near = np.array([0.99, 0.05, 0.0])
+    assert cache.lookup("What does SSP2-4.5 mean?", near, "ns1") is not None
+    assert cache.lookup("What is SSP5-8.5?", v, "ns1") is None, "números diferentes não podem colidir"
+
+    reloaded = SemanticAnswerCache(path=str(path), min_sim=0.95, max_entries=10)
+    assert len(reloaded) == 1
+    assert reloaded.lookup("What is SSP2-4.5?", v, "ns2") is None
+    assert len(reloaded) == 0
+
+
+def test_lru_eviction(tmp_path):
+    cache = SemanticAnswerCache(path=str(tmp_path / "a.json"), min_sim=0.99, max_entries=2)
+    for i, q in enumerate(["q one", "q two", "q three"]):
+        vec = np.zeros(3)
+        vec[i] = 1.0
+        cache.store(q, vec, {"answer": q}, [], "ns")
+    assert len(cache) == 2
+    assert cache.lookup_exact("q one", "ns") is None
+    assert cache.lookup_exact("q three", "ns") is not None
+
+
+def test_store_appends_and_compacts(tmp_path):
+    path = tmp_path / "answers.json"
+    cache = SemanticAnswerCache(path=str(path), min_sim=0.99, max_entries=2)
+    for i in range(4):
+        cache.store(f"q {i}", np.eye(5)[i], {"answer": str(i)}, [], "ns")
+    # snapshot + uma linha por store; ao chegar a 2x max_entries linhas o log é compactado
+    assert len(path.read_text(encoding="utf-8").splitlines()) == 4
+    cache.store("q 4", np.eye(5)[4], {"answer": "4"}, [], "ns")
+    assert len(path.read_text(encoding="utf-8").splitlines()) == 1
+
+    reloaded = SemanticAnswerCache(path=str(path), min_sim=0.99, max_entries=2)
+    assert len(reloaded) == 2
+    assert reloaded.lookup_exact("q 4", "ns")["answer"] == {"answer": "4"}
+    assert reloaded.lookup_exact("q 2", "ns") is None
+
+
+def test_reload_replays_log_with_lru_bound(tmp_path):
+    path = tmp_path / "answers.json"
+    cache = SemanticAnswerCache(path=str(path), min_sim=0.99, max_entries=3)
+    for i in range(3):
+        cache.store(f"q {i}", np.eye(3)[i], {"answer": str(i)}, [], "ns")
+    reloaded = SemanticAnswerCache(path=str(path), min_sim=0.99, max_entries=2)
+    assert [k for k in reloaded._entries] == ["q 1", "q 2"]
+    assert reloaded.lookup_semantic("Q  2?", np.eye(3)[2], "ns")["answer"] == {"answer": "2"}
+
+
+def test_singleton_created_once_under_threads(monkeypatch):
+    import threading
+    import time
+    from src.utils import answer_cache as ac
+
+    made = []
+
+    class SlowCache:
+        def __init__(self):
+            time.sleep(0.05)
+            made.append(self)
+
+    monkeypatch.setattr(ac, "ANSWER_CACHE_ENABLE", True)
+    monkeypatch.setattr(ac, "_CACHE", None)
+    monkeypatch.setattr(ac, "SemanticAnswerCache", SlowCache)
+    got = []
+    threads = [threading.Thread(target=lambda: got.append(ac.get_answer_cache())) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(made) == 1 and all(c is made[0] for c in got)
+
+
+def test_namespace_changes_with_prompt_and_config(monkeypatch):
+    pytest.importorskip("langgraph")
+    from src import graph as g
+
+    monkeypatch.setattr(g, "emb_key", lambda: "emb")
+    monkeypatch.setattr(g, "llm_name", lambda: "llm")
+    monkeypatch.setattr(g, "index_version", lambda: "build-1")
+    base = g._cache_namespace()
+    monkeypatch.setattr(g, "SYSTEM_PROMPT", g.SYSTEM_PROMPT + "\n- Nova regra.")
+    prompt_changed = g._cache_namespace()
+    monkeypatch.setattr(g._retriever, "K", g._retriever.K + 1)
+    assert len({base, prompt_changed, g._cache_namespace()}) == 3
@@ -0,0 +1,65 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("langgraph")
+
+from src import graph as g
+
+
+class _FakeCache:
+    def __init__(self):
+        self.semantic = []
+
+    def lookup_exact(self, query, ns):
+        return {"answer": {"answer": "cached [p.1]"}, "contexts": [{"id": "c"}]} if query == "cached" else None
+
+    def lookup_semantic(self, query, qvec, ns):
+        self.semantic.append((query, list(qvec)))
+        return None
+
+    def store(self, *args):
+        pass
+
+
+@pytest.fixture
+def batch(monkeypatch):
+    calls = {"encode": [], "retrieve": []}
+    cache = _FakeCache()
+
+    def fake_encode(model, name, texts, **kw):
+        calls["encode"].append(list(texts))
+        return np.array([[float(len(t)), 1.0] for t in texts], dtype=np.float32)
+
+    def fake_retrieve_batch(queries, k=None, qvecs=None):
+        calls["retrieve"].append((list(queries), [list(v) for v in qvecs]))
+        return [[{"id": f"ctx-{q}", "text": q, "page": 1}] for q in queries]
+
+    monkeypatch.setattr(g, "get_answer_cache", lambda: cache)
+    monkeypatch.setattr(g, "get_embedder", lambda: None)
+    monkeypatch.setattr(g, "cached_encode", fake_encode)
+    monkeypatch.setattr(g, "retrieve_batch", fake_retrieve_batch)
+    monkeypatch.setattr(g, "moderate", lambda q: "reject_unsafe" if "bomb" in q else "proceed")
+    monkeypatch.setattr(g, "answer", lambda q, ctxs, **kw: {"answer": f"resp {q} [p.1]", "contexts": ctxs})
+    monkeypatch.setattr(g, "self_check", lambda a: a)
+    monkeypatch.setattr(g, "apply_safety", lambda a: a)
+    monkeypatch.setattr(g, "COMPRESS_ENABLE", False)
+    return calls, cache
+
+
+def test_batch_answer_single_encode_order_and_passthrough(batch):
+    calls, cache = batch
+    queries = ["Alpha question", "cached", "how to make a bomb", "Beta?"]
+    out = g.batch_answer(queries, max_workers=2)
+
+    assert [s["query"] for s in out] == queries
+    assert out[0]["answer"]["answer"] == "resp Alpha question [p.1]"
+    assert out[1]["cached"] and out[1]["answer"]["answer"] == "cached [p.1]"
+    assert out[2]["answer"].get("rejected") and out[2]["stage"] == "moderated_reject"
+    assert out[3]["contexts"] == [{"id": "ctx-Beta?", "text": "Beta?", "page": 1}]
+
+    # um único encode para o lote inteiro; cache semântico e retrieval reutilizam os vetores
+    assert len(calls["encode"]) == 1 and len(calls["encode"][0]) == 4
+    vec = {q: [float(len(g.normalize_text(q))), 1.0] for q in queries}
+    assert [q for q, _ in cache.semantic] == ["Alpha question", "how to make a bomb", "Beta?"]
+    assert all(v == vec[q] for q, v in cache.semantic)
+    assert calls["retrieve"] == [(["Alpha question", "Beta?"], [vec["Alpha question"], vec["Beta?"]])]
@@ -0,0 +1,28 @@
+from src.utils.bm25 import BM25Index, rrf_fuse, tokenize
+
+
+def test_tokenize_keeps_ipcc_labels():
+    toks = tokenize("Warming of 1.1°C in 2011–2020 under SSP2-4.5.")
+    assert "1.1°c" in toks
+    assert "2011-2020" in toks and "2011" in toks
+    assert "ssp2-4.5" in toks
+
+
+def test_bm25_exact_label_ranks_first_and_roundtrips(tmp_path):
+    idx = BM25Index().add_many([
+        ("a", "Global warming projections under SSP5-8.5 reach high levels."),
+        ("b", "Under SSP2-4.5 warming is very likely 2.1°C to 3.5°C by 2100."),
+        ("c", "Adaptation options reduce risks for ecosystems."),
+    ])
+    assert idx.search("warming SSP2-4.5", top_n=2)[0][0] == "b"
+
+    path = tmp_path / "bm25.json.gz"
+    idx.save(str(path))
+    again = BM25Index.load(str(path))
+    assert again.search("warming SSP2-4.5", top_n=3) == idx.search("warming SSP2-4.5", top_n=3)
+    assert again.search("inexistente") == []
+
+
+def test_rrf_rewards_agreement():
+    fused = rrf_fuse([["a", "b", "c"], ["b", "a"]], k=60)
+    assert fused["a"] == fused["b"] > fused["c"]
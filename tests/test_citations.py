@@ -0,0 +1,33 @@
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("langchain")
+
+from src.nodes import answerer as a
+from src.nodes.selfcheck import RE_CIT
+from src.utils.citations import cite_tag, source_label
+
+
+def test_tag_carries_report_label():
+    assert source_label("data/corpus/IPCC AR6 SYR.pdf") == "IPCC_AR6_SYR"
+    assert cite_tag(12, "syr.pdf") == "[syr p.12]"
+    assert cite_tag(12) == "[p.12]"  # índices sem `source`
+
+
+def test_context_and_citations_keep_source():
+    ctxs = [{"text": "Warming is unequivocal.", "page": 4, "metadata": {"source": "syr.pdf"}},
+            {"text": "Sea level rises.", "page": 4, "metadata": {"source": "wg1.pdf"}}]
+    assert a._build_context(ctxs).startswith("[syr p.4]\nWarming")
+    assert "[wg1 p.4]\nSea level" in a._build_context(ctxs)
+    text = a._normalize_citations("Aquece [ syr p 4 ]. Sobe  [wg1 p.4][p.2] (p. 7).")
+    assert text == "Aquece [syr p.4]. Sobe [wg1 p.4][p.2] [p.7]."
+    assert a._has_any_citation("Sobe [wg1 p.4].") and RE_CIT.search("Sobe [wg1 p.4].")
+    assert a._extractive_fallback("warming", ctxs, min_sents=1).endswith("[syr p.4]")
+
+
+def test_page_dedupe_distinguishes_reports(monkeypatch):
+    from src.nodes import retriever as r
+    monkeypatch.setattr(r, "UNIQ_BY_PAGE", True)
+    ranked = [{"id": "a", "page": 4, "source": "syr.pdf"}, {"id": "b", "page": 4, "source": "syr.pdf"},
+              {"id": "c", "page": 4, "source": "wg1.pdf"}]
+    assert [h["id"] for h in r._select(ranked, 2)] == ["a", "c"]
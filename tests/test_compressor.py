@@ -0,0 +1,33 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("dotenv")
+
+from src.nodes import compressor as c
+
+
+def _fake_encode(model, name, texts, normalize_embeddings=False):
+    # Vetor 1-D "tem a palavra warming?" + ruído constante: só essas frases batem com a pergunta.
+    out = np.array([[1.0 if "warming" in t.lower() else 0.0, 0.1] for t in texts], dtype=np.float32)
+    return out / np.linalg.norm(out, axis=1, keepdims=True)
+
+
+def test_compress_keeps_top_sentences_in_order(monkeypatch):
+    monkeypatch.setattr(c, "cached_encode", _fake_encode)
+    monkeypatch.setattr(c, "get_embedder", lambda: None)
+    text = ("Ocean heat content increased substantially. Global warming reached 1.1°C in 2011–2020. "
+            "Sea ice declined across the Arctic region. Human activities caused the observed warming.")
+    ctxs = [{"id": "a", "page": 8, "text": text, "metadata": {"page": 8, "n_tokens": 99}}]
+    out, stats = c.compress("How much warming?", ctxs, top_n=2)
+    assert out[0]["text"] == ("Global warming reached 1.1°C in 2011–2020. "
+                              "Human activities caused the observed warming.")
+    assert out[0]["text_full"] == text and out[0]["page"] == 8
+    assert "n_tokens" not in out[0]["metadata"]
+    assert stats["tokens_out"] < stats["tokens_in"]
+
+
+def test_short_chunks_are_left_untouched(monkeypatch):
+    monkeypatch.setattr(c, "cached_encode", _fake_encode)
+    ctxs = [{"id": "a", "page": 3, "text": "Only one sentence about warming here."}]
+    out, stats = c.compress("warming", ctxs, top_n=3)
+    assert out == ctxs and stats["tokens_in"] == stats["tokens_out"]
@@ -0,0 +1,45 @@
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("langchain")
+
+from src.nodes import answerer as a
+
+def _ctx(i, page, score, n_words=40):
+    text = " ".join(f"w{i}x{j}" for j in range(n_words))
+    return {"id": f"c{i}", "page": page, "score": score, "text": text}
+
+
+def test_pack_respects_budget_and_retriever_order():
+    # scores em escalas diferentes (rerank vs. fusão): a ordem do retriever é que vale
+    ctxs = [_ctx(1, 2, 0.2), _ctx(2, 3, 7.5), _ctx(0, 1, 0.9)]
+    n = a._ctx_tokens(ctxs[:1])[0] + a._BLOCK_OVERHEAD
+    packed, used = a._pack(ctxs, budget=2 * n)
+    assert [c["id"] for c in packed] == ["c1", "c2"]
+    assert used <= 2 * n
+
+
+def test_pack_drops_overlapping_duplicates():
+    base = _ctx(0, 4, 0.9)
+    dup = dict(base, id="c1", score=0.8)
+    packed, _ = a._pack([base, dup, _ctx(2, 5, 0.1, n_words=5)], budget=10_000)
+    assert [c["id"] for c in packed] == ["c0", "c2"]
+
+
+def test_pack_uses_ingested_token_counts():
+    c = _ctx(0, 1, 0.9)
+    c["metadata"] = {"n_tokens": 3, "tokenizer": a.tokenizer_name()}
+    assert a._ctx_tokens([c]) == [3]
+
+
+def test_budget_defaults_by_provider(monkeypatch):
+    ctxs = [_ctx(i, i, 1.0 - i / 100) for i in range(30)]
+    monkeypatch.setattr(a, "CONTEXT_TOKEN_BUDGET", "")
+    monkeypatch.setattr(a, "provider", lambda: "gemini")
+    assert a.context_budget() == 0
+    assert len(a._pack(ctxs)[0]) == 30
+    monkeypatch.setattr(a, "provider", lambda: "ollama")
+    assert a.context_budget() == a.OLLAMA_CONTEXT_BUDGET
+    assert len(a._pack(ctxs)[0]) < 30
+    monkeypatch.setattr(a, "CONTEXT_TOKEN_BUDGET", "0")
+    assert a.context_budget() == 0
@@ -0,0 +1,32 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from src.utils.emb_cache import EmbeddingCache, text_key
+import src.utils.emb_cache as emb_cache
+
+
+class _CountingModel:
+    def __init__(self):
+        self.seen = []
+
+    def encode(self, texts, **kwargs):
+        self.seen.extend(texts)
+        return np.array([[len(t), 1.0, 0.0] for t in texts], dtype=np.float32)
+
+
+def test_cached_encode_only_computes_unseen_texts(tmp_path, monkeypatch):
+    monkeypatch.setattr(emb_cache, "EMB_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(emb_cache, "_CACHES", {})
+    model = _CountingModel()
+
+    a = emb_cache.cached_encode(model, "m/x", ["aa", "bbb", "aa"])
+    assert model.seen == ["aa", "bbb"]
+    b = emb_cache.cached_encode(model, "m/x", ["bbb", "cccc"], normalize_embeddings=True)
+    assert model.seen == ["aa", "bbb", "cccc"]
+    assert np.allclose(a[0], a[2])
+    assert np.allclose(np.linalg.norm(b, axis=1), 1.0)
+
+    fresh = EmbeddingCache(str(tmp_path), "m/x")
+    assert len(fresh) == 3
+    assert np.allclose(fresh.get_many([text_key("bbb")])[0], [3.0, 1.0, 0.0])
@@ -0,0 +1,53 @@
+import pytest
+
+pytest.importorskip("ragas")
+pytest.importorskip("langgraph")
+
+from eval import eval_ragas as ev
+
+
+def _scores(**over):
+    base = {m.name: 0.5 for m in ev.METRICS}
+    base.update(over)
+    return base
+
+
+def test_needs_judge_retries_failed_metrics():
+    name = ev.METRICS[0].name
+    assert ev.needs_judge({"question": "q"})
+    assert not ev.needs_judge({"scores": _scores()})
+    assert ev.needs_judge({"scores": _scores(**{name: None})})
+    assert ev.needs_judge({"scores": _scores(**{name: float("nan")})})
+    # métrica ausente (ex.: checkpoint de uma versão com menos métricas)
+    partial = _scores()
+    partial.pop(name)
+    assert ev.needs_judge({"scores": partial})
+
+
+def test_run_judge_keeps_valid_scores_and_rejudges_failed(monkeypatch, tmp_path):
+    failed = ev.METRICS[-1].name
+    row = {"question": "q", "answer": "a", "contexts": ["c"], "ground_truth": "g",
+           "scores": _scores(**{failed: None})}
+    sent = []
+
+    class _Result:
+        def __init__(self, names, n):
+            self.names, self.n = names, n
+
+        def to_pandas(self):
+            return ev.pd.DataFrame([{k: 0.9 for k in self.names}] * self.n)
+
+    def fake_evaluate(ds, metrics, **kwargs):
+        sent.append([m.name for m in metrics])
+        return _Result([m.name for m in metrics], len(ds))
+
+    monkeypatch.setattr(ev, "EVAL_JUDGE_CACHE_PATH", "")
+    monkeypatch.setattr(ev, "ragas_evaluate", fake_evaluate)
+    monkeypatch.setattr(ev, "make_judge", lambda: None)
+    monkeypatch.setattr(ev, "make_embeddings", lambda: None)
+    ev.run_judge([row], ev.Checkpoint(str(tmp_path / "ckpt.jsonl")))
+
+    assert sent == [[failed]]
+    assert row["scores"][failed] == 0.9
+    assert all(row["scores"][m.name] == 0.5 for m in ev.METRICS if m.name != failed)
+    assert not ev.needs_judge(row)
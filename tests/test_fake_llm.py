@@ -0,0 +1,40 @@
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from src.utils.fake_llm import FakeChatModel
+
+PROMPT = """Pergunta:
+Quanto aqueceu?
+
+Trechos do IPCC (use APENAS o que está abaixo):
+[p.8]
+Global surface temperature was 1.1°C higher in 2011–2020. Land warmed more.
+
+---
+
+[p.9]
+Human activities caused the observed warming. More text here.
+
+Lembre-se: termine CADA frase factual com [p.X].
+"""
+
+
+def _model(**kw):
+    return FakeChatModel(latency_ms=0, tokens_per_s=0, **kw)
+
+
+def test_fake_llm_is_deterministic_and_cites_pages():
+    msgs = [SystemMessage(content="sys"), HumanMessage(content=PROMPT)]
+    out = _model().invoke(msgs).content
+    assert out == ("Global surface temperature was 1.1°C higher in 2011–2020 [p.8]. "
+                   "Human activities caused the observed warming [p.9].")
+    assert "".join(c.content for c in _model().stream(msgs)) == out
+
+
+def test_fake_llm_moderation_and_token_cap():
+    assert _model().invoke([HumanMessage(content="Pergunta do usuário: 'oi'")]).content == "safe"
+    capped = _model(num_predict=3).invoke([HumanMessage(content=PROMPT)]).content
+    assert capped == "Global surface temperature "
@@ -0,0 +1,124 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("chromadb")
+pytest.importorskip("langchain.text_splitter")
+
+from ingest import build_index as bi
+
+
+@pytest.fixture
+def ingest(monkeypatch, tmp_path):
+    """Ingestão com PDFs e embedder falsos; devolve (run, embedded) — embedded = textos embedados por run."""
+    corpus = {}
+    embedded = []
+
+    def fake_pages(path):
+        for page, text in sorted(corpus[path].items()):
+            yield {"page": page, "text": text}
+
+    def fake_encode(model, name, texts, batch_size=None):
+        embedded[-1].extend(texts)
+        return np.array([[float(len(t)), 1.0, float(sum(map(ord, t)) % 97)] for t in texts], dtype=np.float32)
+
+    monkeypatch.setattr(bi, "iter_pdf_pages", fake_pages)
+    monkeypatch.setattr(bi, "cached_encode", fake_encode)
+
+    def run(pdf, pages, **kw):
+        corpus[pdf] = pages
+        embedded.append([])
+        bi.main(pdf, str(tmp_path), **{"export_mmap": False, **kw})
+        return embedded[-1]
+
+    return run, tmp_path
+
+
+def _ids(index_dir):
+    from chromadb import PersistentClient
+    coll = PersistentClient(path=str(index_dir)).get_collection("ipcc")
+    return set(coll.get(include=[])["ids"])
+
+
+PAGES = {1: "Warming is unequivocal.", 2: "Sea level rise continues.", 3: "Adaptation gaps persist."}
+
+
+def test_reingest_only_embeds_changed_page(ingest):
+    run, _ = ingest
+    assert len(run("syr.pdf", PAGES)) == 3
+    assert run("syr.pdf", PAGES) == []
+    assert run("syr.pdf", {**PAGES, 2: "Sea level rise accelerates."}) == ["Sea level rise accelerates."]
+
+
+def test_second_pdf_keeps_first_report(ingest):
+    run, index_dir = ingest
+    run("syr.pdf", PAGES)
+    first = _ids(index_dir)
+    assert len(run("wg1.pdf", {1: "Observed changes in the climate system."})) == 1
+    assert first < _ids(index_dir)
+    # re-ingerir o primeiro não re-embeda nada nem apaga o segundo
+    assert run("syr.pdf", PAGES) == []
+    assert len(_ids(index_dir)) == 4
+
+
+def test_same_page_text_in_two_reports_keeps_both_sources(ingest):
+    from chromadb import PersistentClient
+
+    run, index_dir = ingest
+    run("syr.pdf", {1: "Warming is unequivocal."})
+    run("wg1.pdf", {1: "Warming is unequivocal."})
+    got = PersistentClient(path=str(index_dir)).get_collection("ipcc").get(include=["metadatas"])
+    assert sorted(m["source"] for m in got["metadatas"]) == ["syr.pdf", "wg1.pdf"]
+    assert len(set(got["ids"])) == 2
+
+
+def test_splitter_change_reuses_unchanged_chunks(ingest, monkeypatch):
+    run, index_dir = ingest
+    long_page = "Mitigation pathways limit warming. " * 4
+    run("syr.pdf", {**PAGES, 4: long_page})
+    monkeypatch.setattr(bi, "SPLITTER", {"chunk_size": 60, "chunk_overlap": 0})
+    again = run("syr.pdf", {**PAGES, 4: long_page})
+    # páginas curtas geram o mesmo trecho (mesmo id): só a página longa é re-dividida e embedada
+    assert again and all(t in long_page for t in again)
+    assert not any(t in PAGES.values() for t in again)
+    assert len(_ids(index_dir)) == 3 + len(set(again))
+
+
+def test_existing_mmap_index_follows_reingest_without_flag(ingest):
+    from src.utils.settings import index_version
+    from src.utils.vector_store import MmapCollection, mmap_build_id
+
+    run, index_dir = ingest
+    run("syr.pdf", PAGES, export_mmap=True)
+    assert mmap_build_id(str(index_dir)) == index_version(str(index_dir))
+    # ingestão seguinte sem --export-mmap: o índice mmap existente é regravado mesmo assim
+    run("syr.pdf", {**PAGES, 2: "Sea level rise accelerates."})
+    assert mmap_build_id(str(index_dir)) == index_version(str(index_dir))
+    coll = MmapCollection(str(index_dir), version_fn=lambda: index_version(str(index_dir)))
+    assert "Sea level rise accelerates." in coll.get()["documents"]
+
+
+
+def test_stage_abort_keeps_root_cause():
+    import queue
+    import threading
+
+    full = queue.Queue(maxsize=1)
+    full.put(object())
+    writer_failed = threading.Event()
+
+    def writer():
+        writer_failed.set()
+        raise OSError("disco cheio")
+
+    def embed():
+        writer_failed.wait(5)
+        bi._put(full, object(), stages)  # fila cheia e writer morto: aborta
+
+    stages = [bi._Stage("ingest-embed", embed), bi._Stage("ingest-write", writer)]
+    for st in stages:
+        st.start()
+    for st in stages:
+        st.join(5)
+    # só o writer registra erro; o embed abortado não mascara a causa
+    assert stages[0].error is None
+    assert isinstance(stages[1].error, OSError)
@@ -0,0 +1,76 @@
+import subprocess
+import sys
+import types
+
+import pytest
+
+pytest.importorskip("dotenv")
+
+
+def _modules_after_import(stmt: str) -> set:
+    code = f"import sys; {stmt}; print('\\n'.join(sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return set(out.stdout.split())
+
+
+def test_settings_and_llm_import_do_not_load_models():
+    mods = _modules_after_import("import src.utils.settings, src.utils.llm")
+    for heavy in ("sentence_transformers", "chromadb", "langchain_ollama", "langchain_google_genai"):
+        assert heavy not in mods, f"{heavy} importado no import do módulo"
+
+
+def _fake_st(onnx_ok: bool):
+    class FakeST:
+        def __init__(self, name, backend="torch", **kwargs):
+            if backend == "onnx" and not onnx_ok:
+                raise RuntimeError("onnxruntime ausente")
+            self.name, self.backend = name, backend
+
+    return types.SimpleNamespace(SentenceTransformer=FakeST)
+
+
+@pytest.mark.parametrize("exported,onnx_ok,suffix", [
+    (False, True, False),  # sem export: torch
+    (True, False, False),  # export existe mas o load ONNX falha: torch
+    (True, True, True),
+])
+def test_emb_key_follows_backend_that_loaded(tmp_path, monkeypatch, exported, onnx_ok, suffix):
+    from src.utils import settings
+    monkeypatch.setattr(settings, "ONNX_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "EMB_NAME", "org/model")
+    monkeypatch.setattr(settings, "EMB_BACKEND", "onnx")
+    monkeypatch.setattr(settings, "_EMB", None)
+    monkeypatch.setattr(settings, "_EMB_KEY", None)
+    monkeypatch.setitem(sys.modules, "sentence_transformers", _fake_st(onnx_ok))
+    if exported:
+        target = tmp_path / "org__model" / "onnx"
+        target.mkdir(parents=True)
+        (target / f"model_qint8_{settings.ONNX_QUANT}.onnx").write_bytes(b"")
+    expected = f"org/model@onnx-{settings.ONNX_QUANT}" if suffix else "org/model"
+    assert settings.emb_key() == expected
+    assert settings.get_embedder().backend == ("onnx" if suffix else "torch")
+
+
+def test_rerank_key_includes_truncation(monkeypatch):
+    from src.utils import settings
+    monkeypatch.setattr(settings, "RERANK_BACKEND", "torch")
+    monkeypatch.setattr(settings, "_RERANK_KEY", None)
+    monkeypatch.setattr(settings, "RERANK_MAX_TOKENS", 0)
+    plain = settings.rerank_key()
+    monkeypatch.setattr(settings, "RERANK_MAX_TOKENS", 256)
+    assert settings.rerank_key() != plain
+    monkeypatch.setattr(settings, "RERANK_MAX_TOKENS", 512)
+    assert settings.rerank_key().endswith("max_len=512")
+
+
+def test_index_embedder_mismatch_warns(tmp_path, monkeypatch, capsys):
+    import json
+    from src.utils import settings
+    monkeypatch.setattr(settings, "EMB_BACKEND", "torch")
+    monkeypatch.setattr(settings, "_EMB_KEY", None)
+    monkeypatch.setattr(settings, "EMB_NAME", "org/model")
+    (tmp_path / settings.INDEX_META).write_text(json.dumps({"emb_key": "org/model@onnx-avx2"}))
+    assert not settings._check_index_embedder(str(tmp_path))
+    assert "org/model@onnx-avx2" in capsys.readouterr().out
+    (tmp_path / settings.INDEX_META).write_text(json.dumps({"emb_key": "org/model"}))
+    assert settings._check_index_embedder(str(tmp_path))
@@ -0,0 +1,33 @@
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration
+
+from src.utils.llm_cache import SQLiteLLMCache
+
+
+def _gen(text):
+    return [ChatGeneration(message=AIMessage(content=text))]
+
+
+def test_llm_cache_roundtrip_and_key_includes_llm_string(tmp_path):
+    cache = SQLiteLLMCache(str(tmp_path / "llm.sqlite"), ttl_s=0, max_entries=10)
+    cache.update("prompt", "ollama:qwen|temperature=0.0", _gen("resposta [p.8]"))
+    hit = cache.lookup("prompt", "ollama:qwen|temperature=0.0")
+    assert hit[0].message.content == "resposta [p.8]"
+    assert cache.lookup("prompt", "ollama:qwen|temperature=0.7") is None
+
+
+def test_llm_cache_ttl_and_size_eviction(tmp_path, monkeypatch):
+    import src.utils.llm_cache as m
+    cache = SQLiteLLMCache(str(tmp_path / "llm.sqlite"), ttl_s=60, max_entries=2)
+    now = [1000.0]
+    monkeypatch.setattr(m.time, "time", lambda: now[0])
+    for i in range(3):
+        now[0] += 1
+        cache.update(f"p{i}", "llm", _gen(str(i)))
+    assert len(cache) == 2 and cache.lookup("p0", "llm") is None
+    now[0] += 120
+    assert cache.lookup("p2", "llm") is None
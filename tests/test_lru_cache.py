@@ -0,0 +1,19 @@
+from src.utils.lru import LRUCache
+
+
+def test_lru_evicts_least_recently_used():
+    c = LRUCache(maxsize=2)
+    c.put("a", 1)
+    c.put("b", 2)
+    assert c.get("a") == 1
+    c.put("c", 3)
+    assert "b" not in c
+    assert c.get("a") == 1 and c.get("c") == 3
+    assert c.get("b") is None
+    assert c.hits == 3 and c.misses == 1
+
+
+def test_lru_size_zero_disables_cache():
+    c = LRUCache(maxsize=0)
+    c.put("a", 1)
+    assert len(c) == 0 and c.get("a") is None
@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("langchain")
+
+from src.nodes import moderator as m
+
+
+@pytest.fixture
+def mod(monkeypatch):
+    """Moderador com classificador local e LLM falsos; devolve a lista de perguntas enviadas ao LLM."""
+    m._CACHE.clear()
+    sent = []
+
+    def fake_llm(query):
+        sent.append(query)
+        return "reject_off_topic"
+
+    async def afake_llm(query):
+        return fake_llm(query)
+
+    monkeypatch.setattr(m, "_moderate_llm", fake_llm)
+    monkeypatch.setattr(m, "_amoderate_llm", afake_llm)
+    monkeypatch.setattr(m, "MODERATION_MIN_MARGIN", 0.1)
+    yield monkeypatch, sent
+    m._CACHE.clear()
+
+
+def _local(monkeypatch, result):
+    def fake(query):
+        if isinstance(result, Exception):
+            raise result
+        return result
+    monkeypatch.setattr(m, "classify_local", fake)
+
+
+def test_classify_local_label_and_margin(monkeypatch):
+    labels = ["proceed", "proceed", "reject_off_topic", "reject_unsafe"]
+    mat = np.array([[1.0, 0.0], [0.8, 0.6], [0.0, 1.0], [-1.0, 0.0]], dtype=np.float32)
+    monkeypatch.setattr(m, "_prototypes", lambda: (labels, mat))
+    monkeypatch.setattr(m, "get_embedder", lambda: None)
+    monkeypatch.setattr(m, "cached_encode", lambda *a, **kw: np.array([[1.0, 0.0]], dtype=np.float32))
+    label, margin = m.classify_local("aquecimento global", k=2)
+    assert label == "proceed"
+    # média top-2 de proceed (0.9) - melhor dos outros (off_topic 0.0)
+    assert margin == pytest.approx(0.9)
+
+
+@pytest.mark.parametrize("mode,margin,llm_called", [
+    ("hybrid", 0.5, False),
+    ("hybrid", 0.05, True),
+    ("local", 0.05, False),
+])
+def test_margin_routing(mod, mode, margin, llm_called):
+    monkeypatch, sent = mod
+    monkeypatch.setattr(m, "MODERATION_MODE", mode)
+    _local(monkeypatch, ("proceed", margin))
+    dec = m.moderate("O que é SSP2-4.5?")
+    assert (sent == ["O que é SSP2-4.5?"]) is llm_called
+    assert dec == ("reject_off_topic" if llm_called else "proceed")
+
+
+@pytest.mark.parametrize("mode", ["local", "hybrid"])
+def test_local_failure_goes_to_llm(mod, mode):
+    monkeypatch, sent = mod
+    monkeypatch.setattr(m, "MODERATION_MODE", mode)
+    _local(monkeypatch, RuntimeError("modelo ausente"))
+    assert m.moderate("qualquer coisa") == "reject_off_topic"
+    assert sent == ["qualquer coisa"]
+    assert asyncio.run(m.amoderate("outra coisa")) == "reject_off_topic"
+
+
+def test_fails_closed_when_llm_also_fails(mod):
+    monkeypatch, _ = mod
+    monkeypatch.setattr(m, "MODERATION_MODE", "local")
+    _local(monkeypatch, RuntimeError("modelo ausente"))
+
+    def broken(query):
+        raise ConnectionError("sem rede")
+
+    monkeypatch.setattr(m, "_moderate_llm", broken)
+    assert m.moderate("Qual o orçamento de carbono?") == "reject_unsafe"
+    # recusa por falha não fica no cache: com o classificador de volta, a pergunta é reavaliada
+    _local(monkeypatch, ("proceed", 0.5))
+    assert m.moderate("Qual o orçamento de carbono?") == "proceed"
+
+
+@pytest.mark.parametrize("local,expected", [("proceed", "reject_unsafe"), ("reject_off_topic", "reject_off_topic")])
+def test_low_margin_llm_failure_is_contained(mod, local, expected):
+    monkeypatch, _ = mod
+    monkeypatch.setattr(m, "MODERATION_MODE", "hybrid")
+    _local(monkeypatch, (local, 0.05))
+
+    def broken(query):
+        raise ConnectionError("sem rede")
+
+    async def abroken(query):
+        broken(query)
+
+    monkeypatch.setattr(m, "_moderate_llm", broken)
+    monkeypatch.setattr(m, "_amoderate_llm", abroken)
+    assert m.moderate("Quanto o mar sobe até 2100?") == expected
+    assert asyncio.run(m.amoderate("Quanto o mar sobe até 2100?")) == expected
+    assert len(m._CACHE) == 0
@@ -0,0 +1,24 @@
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+from src.utils.pdf_loader import iter_pdf_pages, load_pdf_with_metadata
+
+
+def _make_pdf(path, n_pages=7):
+    doc = fitz.open()
+    for i in range(n_pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Page {i + 1} warming of 1.1 C")
+    doc.save(str(path))
+    doc.close()
+
+
+def test_parallel_extraction_matches_sequential(tmp_path):
+    pdf = tmp_path / "tiny.pdf"
+    _make_pdf(pdf)
+    seq = load_pdf_with_metadata(str(pdf), workers=1)
+    par = list(iter_pdf_pages(str(pdf), workers=2, pages_per_task=2))
+    assert [p["page"] for p in par] == list(range(1, 8))
+    assert par == seq
+    assert "Page 3" in seq[2]["text"]
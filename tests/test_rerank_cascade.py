@@ -0,0 +1,31 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("dotenv")
+
+from src.nodes import retriever as r
+
+
+def _cand(i, vec):
+    return {"id": f"c{i}", "text": "x" * (10 * (i + 1)), "vector_score": vec}
+
+
+def test_cascade_skips_when_top_hit_is_clearly_separated(monkeypatch):
+    monkeypatch.setattr(r, "RERANK_SKIP_MARGIN", 0.1)
+    assert r._cascade_pool([_cand(0, 0.9), _cand(1, 0.6), _cand(2, 0.55)]) == []
+
+
+def test_cascade_shrinks_to_window_with_min_pool(monkeypatch):
+    monkeypatch.setattr(r, "RERANK_SKIP_MARGIN", 0.1)
+    monkeypatch.setattr(r, "RERANK_MIN_POOL", 3)
+    pool = [_cand(i, v) for i, v in enumerate([0.9, 0.85, 0.5, 0.4, 0.3])]
+    assert [d["id"] for d in r._cascade_pool(pool)] == ["c0", "c1", "c2"]
+
+
+def test_predict_sorted_restores_original_order():
+    class Fake:
+        def predict(self, pairs, **kw):
+            return [float(len(t)) for _, t in pairs]
+
+    pairs = [("q", "x" * n) for n in (30, 5, 12)]
+    assert r._predict_sorted(Fake(), pairs) == [30.0, 5.0, 12.0]
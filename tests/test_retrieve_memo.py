@@ -0,0 +1,60 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("dotenv")
+
+from src.nodes import retriever as r
+
+
+@pytest.fixture
+def memo(monkeypatch):
+    """retrieve() com busca falsa: devolve a lista de (perguntas, k) que chegaram a buscar."""
+    searched = []
+    version = {"v": "build-1"}
+
+    def fake_many(q_norms, k, qvs=None):
+        searched.append((list(q_norms), k))
+        return [[{"id": f"{q}-{i}", "text": q, "page": i, "metadata": {"page": i}} for i in range(k)]
+                for q in q_norms]
+
+    monkeypatch.setattr(r, "_retrieve_many", fake_many)
+    monkeypatch.setattr(r, "index_version", lambda *a: version["v"])
+    r._MEMO.clear()
+    yield searched, version
+    r._MEMO.clear()
+
+
+def test_memo_key_normalizes_query_and_includes_k(memo):
+    searched, _ = memo
+    first = r.retrieve("What is  SSP2-4.5?", k=3)
+    assert r.retrieve("  What is SSP2-4.5? ", k=3) == first
+    assert len(searched) == 1
+    assert len(r.retrieve("What is SSP2-4.5?", k=5)) == 5
+    assert searched[-1][1] == 5 and len(searched) == 2
+
+
+def test_memo_invalidated_when_index_version_changes(memo):
+    searched, version = memo
+    r.retrieve("carbon budget", k=2)
+    r.retrieve("carbon budget", k=2)
+    version["v"] = "build-2"
+    r.retrieve("carbon budget", k=2)
+    assert len(searched) == 2
+
+
+def test_callers_get_copies(memo):
+    hits = r.retrieve("sea level", k=2)
+    hits[0]["text"] = "alterado"
+    hits[0]["metadata"]["page"] = 99
+    hits.append({"id": "extra"})
+    again = r.retrieve("sea level", k=2)
+    assert len(again) == 2
+    assert again[0]["text"] == "sea level" and again[0]["metadata"] == {"page": 0}
+
+
+def test_batch_dedupes_and_mixes_memo_hits(memo):
+    searched, _ = memo
+    r.retrieve("warming", k=2)
+    out = r.retrieve_batch(["warming", "ocean heat", "ocean  heat"], k=2)
+    assert searched[-1] == (["ocean heat"], 2)
+    assert [h[0]["text"] for h in out] == ["warming", "ocean heat", "ocean heat"]
@@ -0,0 +1,31 @@
+import pytest
+
+pytest.importorskip("langgraph")
+
+from src import graph as g
+from src.nodes.selfcheck import FALLBACK as SELFCHECK_FALLBACK
+
+
+def test_selfcheck_fallback_triggers_retry_with_wider_k(monkeypatch):
+    ks = []
+    checks = iter([{"answer": SELFCHECK_FALLBACK, "contexts": []}])
+
+    def fake_retrieve(query, k=None):
+        ks.append(k)
+        return [{"id": f"c{i}", "text": "warming [p.3]", "page": 3} for i in range(k)]
+
+    monkeypatch.setattr(g, "retrieve", fake_retrieve)
+    monkeypatch.setattr(g, "get_answer_cache", lambda: None)
+    monkeypatch.setattr(g, "moderate", lambda q: "proceed")
+    monkeypatch.setattr(g, "answer", lambda q, ctxs, **kw: {"answer": "ok [p.3]", "contexts": ctxs})
+    # primeira checagem reprova (fallback em inglês do self_check), a segunda aprova
+    monkeypatch.setattr(g, "self_check", lambda a: next(checks, a))
+    monkeypatch.setattr(g, "apply_safety", lambda a: a)
+
+    out = g.build_graph(speculative=False, compress_contexts=False).invoke(
+        {"query": "O que é SSP2-4.5?", "contexts": [], "answer": {}}
+    )
+    assert ks == [g.K, g.K * g.RETRY_K_FACTOR]
+    assert out["tries"] == 1
+    assert out["answer"]["answer"] == "ok [p.3]"
+    assert len(out["contexts"]) == g.K * g.RETRY_K_FACTOR
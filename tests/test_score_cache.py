@@ -0,0 +1,14 @@
+from src.utils.score_cache import ScoreCache
+
+
+def test_score_cache_memory_roundtrip():
+    c = ScoreCache(maxsize=8)
+    c.put_many([("a", 1.5), ("b", -2.0)])
+    assert c.get_many(["a", "b", "c"]) == {"a": 1.5, "b": -2.0}
+
+
+def test_score_cache_persists_in_sqlite(tmp_path):
+    path = str(tmp_path / "rerank" / "scores.sqlite")
+    ScoreCache(maxsize=8, path=path).put_many([("q|ipcc-1", 0.25)])
+    # Nova instância (processo "reiniciado") lê do SQLite.
+    assert ScoreCache(maxsize=8, path=path).get_many(["q|ipcc-1", "x"]) == {"q|ipcc-1": 0.25}
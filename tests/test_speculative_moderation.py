@@ -0,0 +1,76 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("langgraph")
+
+from src import graph as g
+from src.utils.tracing import span
+
+
+@pytest.fixture
+def spec(monkeypatch):
+    """Grafo especulativo com moderação/retrieval/LLM falsos; pool de 1 thread controlável."""
+    calls = {"retrieve": 0}
+    release = threading.Event()
+    release.set()
+    pool = ThreadPoolExecutor(max_workers=1)
+
+    def fake_retrieve(query, k=None):
+        calls["retrieve"] += 1
+        with span("retrieve.fake"):
+            release.wait(5)
+        return [{"id": "c1", "text": "warming [p.3]", "page": 3}]
+
+    monkeypatch.setattr(g, "_SPEC_POOL", pool)
+    monkeypatch.setattr(g, "retrieve", fake_retrieve)
+    monkeypatch.setattr(g, "get_answer_cache", lambda: None)
+    monkeypatch.setattr(g, "answer", lambda q, ctxs, **kw: {"answer": "ok [p.3]", "contexts": ctxs})
+    monkeypatch.setattr(g, "self_check", lambda a: a)
+    monkeypatch.setattr(g, "apply_safety", lambda a: a)
+    graph = g.build_graph(speculative=True, compress_contexts=False)
+    yield graph, calls, release, pool, monkeypatch
+    release.set()
+    pool.shutdown(wait=True)
+
+
+def _names(state):
+    return [sp["name"] for sp in state.get("spans") or []]
+
+
+def test_accepted_query_uses_speculative_result_and_spans(spec):
+    graph, calls, _, _, monkeypatch = spec
+    monkeypatch.setattr(g, "moderate", lambda q: "proceed")
+    out = graph.invoke({"query": "O que é SSP2-4.5?", "contexts": [], "answer": {}})
+    assert calls["retrieve"] == 1
+    assert out["contexts"][0]["id"] == "c1"
+    assert "retrieve.fake" in _names(out)
+
+
+def test_rejected_query_discards_retrieval_and_its_spans(spec):
+    graph, calls, release, pool, monkeypatch = spec
+    monkeypatch.setattr(g, "moderate", lambda q: "reject_off_topic")
+    release.clear()  # retrieval em andamento quando a moderação recusa
+    out = graph.invoke({"query": "Quem ganhou a copa?", "contexts": [], "answer": {}})
+    assert out["answer"]["rejected"]
+    release.set()
+    pool.shutdown(wait=True)
+    assert "retrieve.fake" not in _names(out)
+    assert out["contexts"] == []
+
+
+def test_moderation_error_cancels_queued_retrieval(spec):
+    graph, calls, release, pool, monkeypatch = spec
+    busy = threading.Event()
+    pool.submit(busy.wait, 5)  # ocupa o pool: o retrieval especulativo fica na fila
+
+    def broken(q):
+        raise RuntimeError("moderação caiu")
+
+    monkeypatch.setattr(g, "moderate", broken)
+    with pytest.raises(RuntimeError):
+        graph.invoke({"query": "O que é SSP2-4.5?", "contexts": [], "answer": {}})
+    busy.set()
+    pool.shutdown(wait=True)
+    assert calls["retrieve"] == 0
@@ -0,0 +1,27 @@
+from src.utils.tracing import SpanSink, collect, span, stage_totals, percentile
+
+
+def test_spans_nest_and_land_in_collected_list():
+    spans = []
+    with collect(spans):
+        with span("retrieve", k=6):
+            with span("retrieve.embed", texts=1) as sp:
+                sp["dim"] = 384
+    assert [s["name"] for s in spans] == ["retrieve.embed", "retrieve"]
+    inner, outer = spans
+    assert inner["parent"] == "retrieve" and outer["parent"] is None
+    assert inner["dim"] == 384 and outer["k"] == 6
+    assert outer["duration_ms"] >= inner["duration_ms"] >= 0
+    assert set(stage_totals(spans)) == {"retrieve", "retrieve.embed"}
+
+
+def test_sink_exports_json_and_prometheus():
+    sink = SpanSink(reservoir=10)
+    for ms in (10.0, 20.0, 30.0):
+        sink.add("answer.llm", ms)
+    js = sink.to_json()["answer.llm"]
+    assert js["count"] == 3 and js["p50_ms"] == 20.0
+    text = sink.to_prometheus()
+    assert 'ipcc_span_duration_seconds_count{span="answer.llm"} 3' in text
+    assert 'quantile="0.5"} 0.020000' in text
+    assert percentile([], 95) == 0.0
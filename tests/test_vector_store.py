@@ -0,0 +1,60 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import json
+
+from src.utils.vector_store import MmapCollection, StaleIndexError, write_mmap_index, MMAP_SIDECAR
+
+
+def _index(tmp_path, dtype="float32", build_id=None, version_fn=None):
+    vecs = np.array([[1.0, 0.0, 0.0], [0.0, 2.0, 0.0], [1.0, 1.0, 0.0], [0.0, 0.0, 3.0]])
+    ids = [f"ipcc-{i}" for i in range(len(vecs))]
+    docs = [f"trecho {i}" for i in range(len(vecs))]
+    metas = [{"page": i + 1} for i in range(len(vecs))]
+    write_mmap_index(str(tmp_path), ids, docs, metas, vecs, dtype=dtype, build_id=build_id)
+    return MmapCollection(str(tmp_path), version_fn=version_fn)
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16"])
+def test_mmap_query_exact_topk(tmp_path, dtype):
+    coll = _index(tmp_path, dtype)
+    assert coll.count() == 4
+    res = coll.query(query_embeddings=[[1.0, 0.1, 0.0], [0.0, 0.0, 1.0]], n_results=2,
+                     include=["documents", "metadatas", "distances"])
+    assert res["ids"][0] == ["ipcc-0", "ipcc-2"]
+    assert res["ids"][1][0] == "ipcc-3"
+    assert res["metadatas"][0][0] == {"page": 1}
+    # distância cosine (1 - sim), como o Chroma com hnsw:space=cosine
+    assert res["distances"][1][0] == pytest.approx(0.0, abs=1e-3)
+    assert res["distances"][0][0] < res["distances"][0][1]
+
+
+def test_mmap_get_by_ids_and_pages(tmp_path):
+    coll = _index(tmp_path)
+    got = coll.get(ids=["ipcc-3", "nao-existe", "ipcc-1"], include=["documents", "embeddings"])
+    assert got["ids"] == ["ipcc-3", "ipcc-1"]
+    assert got["documents"] == ["trecho 3", "trecho 1"]
+    assert np.allclose(got["embeddings"][1], [0.0, 1.0, 0.0])
+    assert coll.get(limit=2, offset=3)["ids"] == ["ipcc-3"]
+
+
+def test_mmap_sidecar_keeps_texts_out_of_json(tmp_path):
+    coll = _index(tmp_path)
+    with open(tmp_path / MMAP_SIDECAR, encoding="utf-8") as f:
+        side = json.load(f)
+    # textos e metadados ficam no payload mapeado, não no JSON lido por cada processo
+    assert "documents" not in side and "metadatas" not in side
+    assert coll.get(ids=["ipcc-2"])["metadatas"] == [{"page": 3}]
+
+
+def test_mmap_refuses_stale_build_on_open_but_keeps_serving_loaded_one(tmp_path, capsys):
+    version = {"v": "b1"}
+    coll = _index(tmp_path, build_id="b1", version_fn=lambda: version["v"])
+    assert coll.count() == 4
+    version["v"] = "b2"  # nova ingestão; o índice mmap ainda não foi regravado
+    for _ in range(2):
+        assert coll.query(query_embeddings=[[1.0, 0.0, 0.0]], n_results=1)["ids"] == [["ipcc-0"]]
+    assert capsys.readouterr().out.count("build b1") == 1  # avisa uma vez só
+    with pytest.raises(StaleIndexError):
+        MmapCollection(str(tmp_path), version_fn=lambda: version["v"])